@@ -0,0 +1,397 @@
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from mini_app import DatabaseManager, FareEngine, MySQLBackend, SQLiteBackend, TICKET_TYPES
+
+
+SCALES = {
+    "small": dict(lines=50, stations_per_line=20, buses_per_line=4, passengers=10000, tickets=50000),
+    "medium": dict(lines=1000, stations_per_line=25, buses_per_line=5, passengers=200000, tickets=1000000),
+    "large": dict(lines=5000, stations_per_line=30, buses_per_line=5, passengers=2000000, tickets=5000000),
+}
+
+ZONE_PRICES = [(zone_id, round(1.5 + zone_id * 0.75, 2)) for zone_id in range(1, 11)]
+
+SEAT_HEADROOM = 100
+
+
+def git_version():
+    try:
+        return subprocess.check_output(["git", "describe", "--always", "--dirty"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def summarize(latencies, total_seconds, operations=None):
+    operations = operations if operations is not None else len(latencies)
+    return {
+        "operations": operations,
+        "seconds": round(total_seconds, 4),
+        "ops_per_sec": round(operations / total_seconds, 1) if total_seconds else None,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3) if latencies else None,
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3) if latencies else None,
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3) if latencies else None,
+    }
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - start, result
+
+
+def insert_rows(db, sql, rows, chunk_size=20000):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == chunk_size:
+            with db.transaction() as cursor:
+                cursor.executemany(sql, chunk)
+            chunk = []
+    if chunk:
+        with db.transaction() as cursor:
+            cursor.executemany(sql, chunk)
+
+
+class SyntheticNetwork:
+    def __init__(self, lines, stations_per_line, buses_per_line, passengers, tickets, seed=42):
+        self.lines = lines
+        self.stations_per_line = stations_per_line
+        self.buses_per_line = buses_per_line
+        self.passengers = passengers
+        self.tickets = tickets
+        self.seed = seed
+        self.buses = lines * buses_per_line
+        self.seats_per_bus = -(-tickets // self.buses) + SEAT_HEADROOM
+
+    def bus_number(self, index):
+        return f"BUS{index:06d}"
+
+    def passenger_id(self, index):
+        return f"BP{index:08d}"
+
+    def ticket_number(self, index):
+        return f"BT{index:010d}"
+
+    def generate(self, db):
+        rng = random.Random(self.seed)
+        with db.transaction() as cursor:
+            for table in ("Ticket", "SalesSummary", "ChangeLog", "Crew", "Bus", "Station", "BusLine", "Zone", "Passenger", "Company"):
+                cursor.execute(f"DELETE FROM {table}")
+            cursor.execute("INSERT INTO Company (CompanyName, VAT) VALUES ('Benchmark Transit', 'BT000000000')")
+            cursor.executemany("INSERT INTO Zone (ZoneID, Price) VALUES (%s, %s)", ZONE_PRICES)
+
+        insert_rows(db, '''
+        INSERT INTO BusLine (BusLineID, Route, BusLineName, Length, CompanyName, AmountOfSeats, AmountOfCrew, OnWay)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+        ''', ((line, f"Route {line}", f"Line {line}", round(rng.uniform(5, 40), 2), "Benchmark Transit",
+               self.seats_per_bus, 2, 1) for line in range(1, self.lines + 1)))
+
+        # Station names repeat across lines so the network has transfer points.
+        name_pool = max(self.lines * self.stations_per_line // 3, 1)
+        insert_rows(db, "INSERT INTO Station (StationNumber, StationName, BusLineID) VALUES (%s, %s, %s)",
+                    ((line_index * self.stations_per_line + stop + 1, f"Stop {rng.randrange(name_pool)}", line_index + 1)
+                     for line_index in range(self.lines) for stop in range(self.stations_per_line)))
+
+        insert_rows(db, "INSERT INTO Bus (BusNumber, BusLineID, AmountOfSeats, AmountOfCrew, OnWay) VALUES (%s, %s, %s, %s, %s)",
+                    ((self.bus_number(bus), bus // self.buses_per_line + 1, self.seats_per_bus, 2, 1)
+                     for bus in range(self.buses)))
+
+        insert_rows(db, "INSERT INTO Passenger (PassengerID, PassengerName) VALUES (%s, %s)",
+                    ((self.passenger_id(index), f"Passenger {index}") for index in range(self.passengers)))
+
+        start_day = datetime(2024, 1, 1)
+
+        def tickets():
+            for index in range(self.tickets):
+                bus = index % self.buses
+                line = bus // self.buses_per_line + 1
+                yield (self.ticket_number(index), rng.choice(TICKET_TYPES), line, rng.randint(1, len(ZONE_PRICES)),
+                       self.passenger_id(rng.randrange(self.passengers)),
+                       (line - 1) * self.stations_per_line + rng.randint(1, self.stations_per_line),
+                       self.bus_number(bus), index // self.buses + 1,
+                       start_day + timedelta(days=rng.randrange(30), seconds=rng.randrange(86400)))
+
+        insert_rows(db, '''
+        INSERT INTO Ticket (TicketNumber, TicketType, BusLineID, ZoneID, PassengerID, StationNumber, BusNumber, SeatNumber, SoldAt)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+        ''', tickets())
+
+        db.reports.rebuild()
+        db.seats.invalidate()
+        db.cache.invalidate()
+
+
+class BenchmarkRunner:
+    def __init__(self, db, network, purchases=500, batches=20, batch_size=100, pages=50, selections=500,
+                 delete_checks=200, seed=7):
+        self.db = db
+        self.network = network
+        self.purchases = purchases
+        self.batches = batches
+        self.batch_size = batch_size
+        self.pages = pages
+        self.selections = selections
+        self.delete_checks = delete_checks
+        self.rng = random.Random(seed)
+
+    def random_ticket_fields(self):
+        bus = self.rng.randrange(self.network.buses)
+        line = bus // self.network.buses_per_line + 1
+        return ("SingleTicket", line, self.rng.randint(1, len(ZONE_PRICES)),
+                self.network.passenger_id(self.rng.randrange(self.network.passengers)),
+                (line - 1) * self.network.stations_per_line + 1, self.network.bus_number(bus))
+
+    def purchase_single(self):
+        latencies = []
+        failures = 0
+        start = time.perf_counter()
+        for _ in range(self.purchases):
+            ticket_type, line, zone, passenger, station, bus = self.random_ticket_fields()
+            began = time.perf_counter()
+            seat = self.db.next_free_seat(bus)
+            number = self.db.ticket_numbers.next()
+            if self.db.insert_ticket(number, ticket_type, line, zone, passenger, station, bus, seat) is None:
+                failures += 1
+            latencies.append(time.perf_counter() - began)
+        result = summarize(latencies, time.perf_counter() - start)
+        result["failures"] = failures
+        return result
+
+    def purchase_batch(self):
+        latencies = []
+        inserted = 0
+        start = time.perf_counter()
+        for _ in range(self.batches):
+            ticket_type, line, zone, passenger, station, bus = self.random_ticket_fields()
+            began = time.perf_counter()
+            seats = self.db.find_free_seats(bus, self.batch_size)
+            numbers = self.db.ticket_numbers.take(len(seats))
+            ok, _ = self.db.insert_tickets_bulk(
+                [(number, ticket_type, line, zone, passenger, station, bus, seat) for number, seat in zip(numbers, seats)]
+            )
+            inserted += len(ok)
+            latencies.append(time.perf_counter() - began)
+        result = summarize(latencies, time.perf_counter() - start)
+        result["tickets_per_sec"] = round(inserted / result["seconds"], 1) if result["seconds"] else None
+        return result
+
+    def ticket_list_load(self):
+        first_page, _ = timed(self.db.get_tickets_page, None, 100)
+        count_seconds, _ = timed(self.db.count_tickets)
+        latencies = []
+        after = None
+        start = time.perf_counter()
+        for _ in range(self.pages):
+            began = time.perf_counter()
+            rows = self.db.get_tickets_page(after, 100)
+            latencies.append(time.perf_counter() - began)
+            if len(rows) < 100:
+                break
+            after = rows[-1][0]
+        bookmarks_seconds, bookmarks = timed(self.db.get_ticket_bookmarks)
+        jump_seconds, _ = timed(self.db.get_tickets_page, bookmarks[len(bookmarks) // 2], 100, True)
+        result = summarize(latencies, time.perf_counter() - start)
+        result.update(first_page_ms=round(first_page * 1000, 3), count_ms=round(count_seconds * 1000, 3),
+                      bookmarks_ms=round(bookmarks_seconds * 1000, 3), middle_jump_ms=round(jump_seconds * 1000, 3))
+        return result
+
+    def ticket_store(self):
+        # The synthetic tickets are sold in the past, so measure a store over the full history.
+        self.db.tickets.since = None
+        load_seconds, _ = timed(self.db.tickets.load)
+        latencies = []
+        start = time.perf_counter()
+        for _ in range(self.selections // 10):
+            bus_line_id = self.rng.randrange(self.network.lines) + 1
+            began = time.perf_counter()
+            self.db.find_tickets(order_by="SeatNumber", limit=100, BusLineID=bus_line_id, TicketType="SingleTicket")
+            latencies.append(time.perf_counter() - began)
+        result = summarize(latencies, time.perf_counter() - start)
+        result["load_ms"] = round(load_seconds * 1000, 3)
+        return result
+
+    def selection_latency(self):
+        latencies = []
+        start = time.perf_counter()
+        for _ in range(self.selections):
+            number = self.network.ticket_number(self.rng.randrange(self.network.tickets))
+            began = time.perf_counter()
+            ticket = self.db.get_ticket(number)
+            if ticket:
+                self.db.get_bus_line_name(ticket[2])
+                self.db.get_zone_price(ticket[3])
+                self.db.get_passenger_name(ticket[4])
+                self.db.get_station_name(ticket[5])
+                self.db.get_bus_line_id(ticket[6])
+            latencies.append(time.perf_counter() - began)
+        return summarize(latencies, time.perf_counter() - start)
+
+    def passenger_delete_checks(self):
+        latencies = []
+        refused = 0
+        start = time.perf_counter()
+        for _ in range(self.delete_checks):
+            passenger_id = self.network.passenger_id(self.rng.randrange(self.network.passengers))
+            began = time.perf_counter()
+            success, _ = self.db.delete_passenger(passenger_id)
+            latencies.append(time.perf_counter() - began)
+            if success:
+                self.db.create_passenger(passenger_id, f"Passenger {passenger_id}")
+            else:
+                refused += 1
+        result = summarize(latencies, time.perf_counter() - start)
+        result["refused"] = refused
+        return result
+
+    def reports(self):
+        results = {}
+        for name, fn in (("zone_usage", self.db.reports.zone_usage), ("bus_line_usage", self.db.reports.bus_line_usage),
+                         ("fare_totals", self.db.reports.fare_totals), ("daily_sales", self.db.reports.daily_sales)):
+            seconds, _ = timed(fn)
+            results[f"{name}_ms"] = round(seconds * 1000, 3)
+
+        def group_by_report():
+            with self.db.transaction(write=False) as cursor:
+                cursor.execute('''
+                SELECT z.ZoneID, COUNT(t.TicketNumber)
+                FROM Zone z LEFT JOIN Ticket t ON z.ZoneID = t.ZoneID
+                GROUP BY z.ZoneID
+                ''')
+                return cursor.fetchall()
+
+        seconds, _ = timed(group_by_report)
+        results["zone_usage_group_by_ms"] = round(seconds * 1000, 3)
+        try:
+            engine = FareEngine(self.db)
+        except ImportError:
+            return results
+        seconds, columns = timed(engine.load)
+        results["settlement_load_ms"] = round(seconds * 1000, 3)
+        seconds, _ = timed(engine.settle, columns)
+        results["settlement_compute_ms"] = round(seconds * 1000, 3)
+        return results
+
+    def run(self):
+        results = {}
+        for name in ("ticket_list_load", "ticket_store", "selection_latency", "passenger_delete_checks", "reports",
+                     "purchase_single", "purchase_batch"):
+            print(f"  {name}...", flush=True)
+            results[name] = getattr(self, name)()
+        return results
+
+
+def run_backend(name, backend, network, args):
+    print(f"{name}: {backend.describe()}")
+    db = DatabaseManager(backend=backend, interactive=False, pool_max_size=args.pool_size)
+    try:
+        generate_seconds = None
+        if not args.reuse:
+            print(f"  generating {network.tickets} tickets...", flush=True)
+            generate_seconds, _ = timed(network.generate, db)
+        runner = BenchmarkRunner(db, network, purchases=args.purchases, batches=args.batches,
+                                 selections=args.selections, delete_checks=args.delete_checks)
+        results = runner.run()
+        results["generate_seconds"] = round(generate_seconds, 2) if generate_seconds is not None else None
+        return results
+    finally:
+        db.close()
+
+
+def compare(previous, current):
+    for backend, benchmarks in current["backends"].items():
+        before = previous.get("backends", {}).get(backend)
+        if not before:
+            continue
+        print(f"\n{backend}: {previous.get('version')} -> {current.get('version')}")
+        for name, result in benchmarks.items():
+            old = before.get(name)
+            if not isinstance(result, dict) or not isinstance(old, dict):
+                continue
+            for metric in ("ops_per_sec", "p95_ms"):
+                if result.get(metric) and old.get(metric):
+                    change = (result[metric] - old[metric]) / old[metric] * 100
+                    print(f"  {name:<24} {metric:<12} {old[metric]:>12} -> {result[metric]:>12} ({change:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the ticketing hot paths on synthetic data")
+    parser.add_argument("--scale", choices=sorted(SCALES), default="small")
+    parser.add_argument("--lines", type=int)
+    parser.add_argument("--stations-per-line", type=int)
+    parser.add_argument("--buses-per-line", type=int)
+    parser.add_argument("--passengers", type=int)
+    parser.add_argument("--tickets", type=int)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--purchases", type=int, default=500)
+    parser.add_argument("--batches", type=int, default=20)
+    parser.add_argument("--selections", type=int, default=500)
+    parser.add_argument("--delete-checks", type=int, default=200)
+    parser.add_argument("--pool-size", type=int, default=5)
+    parser.add_argument("--sqlite", metavar="PATH", help="SQLite database file (default: a temporary file)")
+    parser.add_argument("--mysql", action="store_true",
+                        help="also benchmark MySQL; the database is wiped and refilled with synthetic data")
+    parser.add_argument("--mysql-host", default="localhost")
+    parser.add_argument("--mysql-user", default="root")
+    parser.add_argument("--mysql-password", default="root")
+    parser.add_argument("--mysql-database", default="busline_benchmark")
+    parser.add_argument("--reuse", action="store_true", help="skip data generation and reuse the existing data")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--compare", metavar="PATH", help="print changes against an earlier results file")
+    args = parser.parse_args()
+
+    scale = dict(SCALES[args.scale])
+    for key in scale:
+        if getattr(args, key) is not None:
+            scale[key] = getattr(args, key)
+    network = SyntheticNetwork(seed=args.seed, **scale)
+
+    report = {
+        "version": git_version(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "scale": scale,
+        "backends": {},
+    }
+
+    with tempfile.TemporaryDirectory() as scratch:
+        report["backends"]["sqlite"] = run_backend(
+            "sqlite", SQLiteBackend(args.sqlite or os.path.join(scratch, "benchmark.db")), network, args
+        )
+
+    if args.mysql:
+        try:
+            backend = MySQLBackend(host=args.mysql_host, user=args.mysql_user, password=args.mysql_password,
+                                   database=args.mysql_database)
+            report["backends"]["mysql"] = run_backend("mysql", backend, network, args)
+        except Exception as e:
+            print(f"Skipping MySQL: {e}")
+
+    with open(args.output, "w", encoding="utf-8") as output:
+        json.dump(report, output, indent=2)
+    print(f"\nResults written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as source:
+            compare(json.load(source), report)
+
+
+if __name__ == "__main__":
+    main()
@@ -74,4 +74,7 @@ CREATE TABLE Ticket (
 CREATE TABLE Passenger (
     PassengerID VARCHAR(20) PRIMARY KEY,
     PassengerName VARCHAR(100)
-);
\ No newline at end of file
+);
+
+-- Indexes, sales summaries, ticket sequence, row versions and station zones are added by the
+-- application migrations (SCHEMA_MIGRATIONS) on first start and recorded in SchemaVersion.
@@ -1,353 +1,3948 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
-import mysql.connector
+import argparse
+import bisect
+import csv
+import functools
+import heapq
+import json
+import logging
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+import uuid
+import weakref
+from array import array
+from collections import OrderedDict, deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+try:
+    import mysql.connector
+except ImportError:
+    mysql = None
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+logger = logging.getLogger("mini_app")
+slow_query_logger = logging.getLogger("mini_app.slow_queries")
+
+
+class PoolError(Exception):
+    pass
+
+
+class ConnectionPool:
+    def __init__(self, connect, ping, min_size=1, max_size=5, timeout=30, health_check_interval=5):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError(f"Invalid pool size: min_size={min_size}, max_size={max_size}")
+        self._connect = connect
+        self._ping = ping
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self._idle = []
+        self._size = 0
+        self._closed = False
+        self._available = threading.Condition()
+
+        for _ in range(min_size):
+            conn = self._connect()
+            self._size += 1
+            self._idle.append((conn, time.monotonic()))
+
+    @property
+    def size(self):
+        return self._size
+
+    @property
+    def idle(self):
+        return len(self._idle)
+
+    def acquire(self):
+        deadline = time.monotonic() + self.timeout
+        with self._available:
+            while True:
+                if self._closed:
+                    raise PoolError("Connection pool is closed")
+                if self._idle:
+                    conn, released_at = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    conn, released_at = None, None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolError(f"No database connection available after {self.timeout}s")
+                self._available.wait(remaining)
+
+        try:
+            if conn is None:
+                conn = self._connect()
+            elif time.monotonic() - released_at >= self.health_check_interval:
+                conn = self._check(conn)
+        except Exception:
+            with self._available:
+                self._size -= 1
+                self._available.notify()
+            raise
+        return conn
+
+    def release(self, conn, discard=False):
+        with self._available:
+            if discard or self._closed:
+                self._size -= 1
+                self._close_quietly(conn)
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._available.notify()
+
+    def close(self):
+        with self._available:
+            self._closed = True
+            for conn, _ in self._idle:
+                self._close_quietly(conn)
+                self._size -= 1
+            self._idle = []
+            self._available.notify_all()
+
+    def _check(self, conn):
+        try:
+            self._ping(conn)
+            return conn
+        except Exception as e:
+            logger.warning(f"Discarding dead database connection: {e}")
+            self._close_quietly(conn)
+            return self._connect()
+
+    def _close_quietly(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+class ExecutorBusyError(Exception):
+    pass
+
+
+class DatabaseExecutor:
+    def __init__(self, max_workers=4, max_pending=32):
+        self.max_pending = max_pending
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="db-worker")
+        self._slots = threading.BoundedSemaphore(max_pending)
+
+    def submit(self, fn, *args, **kwargs):
+        if not self._slots.acquire(blocking=False):
+            raise ExecutorBusyError("Too many database requests are pending, please try again")
+        try:
+            future = self._pool.submit(fn, *args, **kwargs)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda f: self._slots.release())
+        return future
+
+    def shutdown(self, wait=False):
+        self._pool.shutdown(wait=wait)
+
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+_QUERY_TABLE = re.compile(r"\b(?:FROM|INTO|UPDATE|TABLE(?:\s+IF\s+NOT\s+EXISTS)?|ON)\s+(\w+)", re.IGNORECASE)
+
+
+def query_label(sql):
+    words = sql.split(None, 1)
+    if not words:
+        return ""
+    match = _QUERY_TABLE.search(sql)
+    return f"{words[0].upper()} {match.group(1)}" if match else words[0].upper()
+
+
+class LatencyHistogram:
+    __slots__ = ("buckets", "counts", "total", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.total += seconds
+        self.count += 1
+
+    def cumulative(self):
+        running = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            running += count
+            yield bound, running
+
+
+class QueryMetrics:
+    def __init__(self, slow_query_threshold=0.5, buckets=LATENCY_BUCKETS):
+        self.slow_query_threshold = slow_query_threshold
+        self.buckets = tuple(buckets)
+        self.operations = {}
+        self.queries = {}
+        self._labels = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def current_operation(self):
+        return getattr(self._local, 'operation', None) or "other"
+
+    @contextmanager
+    def operation(self, name):
+        if getattr(self._local, 'operation', None) is not None:
+            yield
+            return
+        self._local.operation = name
+        start = time.perf_counter()
+        failed = False
+        try:
+            yield
+        except Exception:
+            failed = True
+            raise
+        finally:
+            self._local.operation = None
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                stats = self._operation_stats(name)
+                stats[0].observe(elapsed)
+                stats[1] += failed
+
+    def _operation_stats(self, name):
+        stats = self.operations.get(name)
+        if stats is None:
+            stats = self.operations[name] = [LatencyHistogram(self.buckets), 0]
+        return stats
+
+    def _query_stats(self, key):
+        stats = self.queries.get(key)
+        if stats is None:
+            stats = self.queries[key] = [LatencyHistogram(self.buckets), 0, 0, 0]
+        return stats
+
+    def _label(self, sql):
+        label = self._labels.get(sql)
+        if label is None:
+            if len(self._labels) > 10000:
+                self._labels.clear()
+            label = self._labels[sql] = query_label(sql)
+        return label
+
+    def observe_query(self, sql, seconds, error=False):
+        operation = self.current_operation()
+        key = (operation, self._label(sql))
+        slow = seconds >= self.slow_query_threshold
+        with self._lock:
+            stats = self._query_stats(key)
+            stats[0].observe(seconds)
+            stats[2] += error
+            stats[3] += slow
+        if slow:
+            slow_query_logger.warning("Slow query (%.3fs) in %s: %s", seconds, operation, " ".join(sql.split())[:1000])
+        return key
+
+    def add_rows(self, key, rows):
+        with self._lock:
+            self._query_stats(key)[1] += rows
+
+    def count_error(self, operation=None):
+        with self._lock:
+            self._operation_stats(operation or self.current_operation())[1] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "operations": {name: {"count": histogram.count, "seconds": histogram.total, "errors": errors,
+                                      "buckets": list(histogram.cumulative())}
+                               for name, (histogram, errors) in self.operations.items()},
+                "queries": {key: {"count": histogram.count, "seconds": histogram.total, "rows": rows,
+                                  "errors": errors, "slow": slow, "buckets": list(histogram.cumulative())}
+                            for key, (histogram, rows, errors, slow) in self.queries.items()},
+            }
+
+    def prometheus(self):
+        snapshot = self.snapshot()
+        lines = []
+
+        def escape(value):
+            return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+        def histogram(name, help_text, series):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            for labels, stats in series:
+                for bound, count in stats["buckets"]:
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f'{name}_bucket{{{labels},le="{le}"}} {count}')
+                lines.append(f"{name}_sum{{{labels}}} {stats['seconds']:.6f}")
+                lines.append(f"{name}_count{{{labels}}} {stats['count']}")
+
+        def counter(name, help_text, series, field):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            for labels, stats in series:
+                lines.append(f"{name}{{{labels}}} {stats[field]}")
+
+        operations = [(f'operation="{escape(name)}"', stats) for name, stats in sorted(snapshot["operations"].items())]
+        queries = [(f'operation="{escape(operation)}",query="{escape(query)}"', stats)
+                   for (operation, query), stats in sorted(snapshot["queries"].items())]
+        histogram("mini_app_operation_seconds", "Latency of DatabaseManager calls.", operations)
+        counter("mini_app_operation_errors_total", "Failed DatabaseManager calls.", operations, "errors")
+        histogram("mini_app_query_seconds", "Latency of SQL statements.", queries)
+        counter("mini_app_query_rows_total", "Rows fetched by SQL statements.", queries, "rows")
+        counter("mini_app_query_errors_total", "SQL statements that raised an error.", queries, "errors")
+        counter("mini_app_slow_queries_total", "SQL statements slower than the slow query threshold.", queries, "slow")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        with open(path + ".tmp", "w", encoding="utf-8") as output:
+            output.write(self.prometheus())
+        os.replace(path + ".tmp", path)
+
+    def serve(self, host="127.0.0.1", port=9464):
+        metrics = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+        return server
+
+    def export_periodically(self, path, interval=15):
+        def run():
+            while True:
+                try:
+                    self.write_prometheus(path)
+                except OSError as e:
+                    logger.error(f"Error writing metrics to {path}: {e}")
+                time.sleep(interval)
+
+        threading.Thread(target=run, name="metrics-file", daemon=True).start()
+
+
+class InstrumentedCursor:
+    def __init__(self, cursor, metrics):
+        self._cursor = cursor
+        self._metrics = metrics
+        self._key = None
+
+    def _timed(self, method, sql, params):
+        start = time.perf_counter()
+        try:
+            result = method(sql) if params is None else method(sql, params)
+        except Exception:
+            self._key = self._metrics.observe_query(sql, time.perf_counter() - start, error=True)
+            raise
+        self._key = self._metrics.observe_query(sql, time.perf_counter() - start)
+        return result
+
+    def execute(self, sql, params=None):
+        return self._timed(self._cursor.execute, sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        return self._timed(self._cursor.executemany, sql, seq_of_params)
+
+    def _fetched(self, rows):
+        if self._key is not None and rows:
+            self._metrics.add_rows(self._key, len(rows))
+        return rows
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        if row is not None and self._key is not None:
+            self._metrics.add_rows(self._key, 1)
+        return row
+
+    def fetchall(self):
+        return self._fetched(self._cursor.fetchall())
+
+    def fetchmany(self, size=None):
+        return self._fetched(self._cursor.fetchmany(size) if size else self._cursor.fetchmany())
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    def close(self):
+        self._cursor.close()
+
+
+def timed_operation(method):
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.metrics.operation(method.__name__):
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+class PreparedStatementCache:
+    def __init__(self, conn, max_size=64):
+        self.conn = conn
+        self.max_size = max_size
+        self._statements = OrderedDict()
+        self._seen = OrderedDict()
+
+    def get(self, sql):
+        entry = self._statements.get(sql)
+        if entry is not None:
+            self._statements.move_to_end(sql)
+            return entry
+        # Prepare on the second execution only: one-off statements would pay an extra round trip.
+        if sql not in self._seen:
+            self._seen[sql] = True
+            if len(self._seen) > self.max_size * 4:
+                self._seen.popitem(last=False)
+            return None
+        del self._seen[sql]
+        # The connector re-prepares unless it sees the identical string object, so keep the first one.
+        entry = self._statements[sql] = (sql, self.conn.cursor(prepared=True))
+        if len(self._statements) > self.max_size:
+            self._close(self._statements.popitem(last=False)[1][1])
+        return entry
+
+    def evict(self, sql):
+        entry = self._statements.pop(sql, None)
+        if entry is not None:
+            self._close(entry[1])
+
+    def clear(self, close=True):
+        while self._statements:
+            cursor = self._statements.popitem()[1][1]
+            if close:
+                self._close(cursor)
+        self._seen.clear()
+
+    def _close(self, cursor):
+        try:
+            cursor.close()
+        except mysql.connector.Error:
+            pass
+
+
+class MySQLStatementCursor:
+    def __init__(self, conn, statements):
+        self._plain = conn.cursor(buffered=True)
+        self._active = self._plain
+        self._statements = statements
+        self._rows = None
+        self._next = 0
+
+    def execute(self, sql, params=None):
+        entry = self._statements.get(sql) if params else None
+        self._active, self._rows = self._plain, None
+        if entry is None:
+            return self._plain.execute(sql, params)
+        key, cursor = entry
+        try:
+            cursor.execute(key, tuple(params))
+        except mysql.connector.Error as e:
+            # ER_UNKNOWN_STMT_HANDLER: the server dropped the statement, so prepare it again later.
+            if e.errno != 1243:
+                raise
+            self._statements.evict(sql)
+            return self._plain.execute(sql, params)
+        # Prepared cursors are unbuffered; read the rows now so the connection is free for the next query.
+        self._active = cursor
+        self._rows = cursor.fetchall() if cursor.with_rows else None
+        self._next = 0
+
+    def executemany(self, sql, seq_of_params):
+        self._active, self._rows = self._plain, None
+        return self._plain.executemany(sql, seq_of_params)
+
+    def fetchone(self):
+        if self._rows is None:
+            return self._plain.fetchone()
+        if self._next >= len(self._rows):
+            return None
+        self._next += 1
+        return self._rows[self._next - 1]
+
+    def fetchmany(self, size=1):
+        if self._rows is None:
+            return self._plain.fetchmany(size)
+        rows = self._rows[self._next:self._next + size]
+        self._next += len(rows)
+        return rows
+
+    def fetchall(self):
+        if self._rows is None:
+            return self._plain.fetchall()
+        rows = self._rows[self._next:]
+        self._next = len(self._rows)
+        return rows
+
+    @property
+    def rowcount(self):
+        return len(self._rows) if self._rows is not None else self._active.rowcount
+
+    @property
+    def lastrowid(self):
+        return self._active.lastrowid
+
+    @property
+    def description(self):
+        return self._active.description
+
+    def close(self):
+        self._plain.close()
+
+
+class MySQLBackend:
+    name = "mysql"
+    max_connections = None
+
+    def __init__(self, host="localhost", user="root", password="root", database="busline_prisezone",
+                 reconnect_attempts=3, reconnect_delay=1, statement_cache_size=64, **options):
+        if mysql is None:
+            raise ImportError("mysql-connector-python is required for the MySQL backend")
+        self.params = dict(host=host, user=user, password=password, database=database, **options)
+        self.reconnect_attempts = reconnect_attempts
+        self.reconnect_delay = reconnect_delay
+        self.statement_cache_size = statement_cache_size
+        self._statements = weakref.WeakKeyDictionary()
+        self._statements_lock = threading.Lock()
+        self.Error = mysql.connector.Error
+        self.IntegrityError = mysql.connector.IntegrityError
+        self.connection_errors = (mysql.connector.InterfaceError, mysql.connector.OperationalError)
+
+    def is_connection_error(self, error):
+        return isinstance(error, self.connection_errors)
+
+    def describe(self):
+        return f"MySQL database {self.params['database']} on {self.params['host']}"
+
+    def connect(self):
+        return mysql.connector.connect(**self.params)
+
+    def ping(self, conn):
+        try:
+            conn.ping()
+            return
+        except self.Error:
+            # Prepared statements do not survive a reconnect.
+            self.drop_statements(conn)
+        conn.ping(reconnect=True, attempts=self.reconnect_attempts, delay=self.reconnect_delay)
+
+    def begin(self, conn, write=True):
+        pass
+
+    def cursor(self, conn):
+        if not self.statement_cache_size:
+            return conn.cursor(buffered=True)
+        with self._statements_lock:
+            statements = self._statements.get(conn)
+            if statements is None:
+                statements = self._statements[conn] = PreparedStatementCache(conn, self.statement_cache_size)
+        return MySQLStatementCursor(conn, statements)
+
+    def drop_statements(self, conn):
+        with self._statements_lock:
+            statements = self._statements.pop(conn, None)
+        if statements is not None:
+            statements.clear(close=False)
+
+    def increment_sql(self, table, keys, counters):
+        columns = keys + counters
+        return (f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))}) "
+                f"ON DUPLICATE KEY UPDATE {', '.join(f'{c} = {c} + VALUES({c})' for c in counters)}")
+
+    def full_scans(self, cursor, query, params=()):
+        cursor.execute("EXPLAIN " + query, params)
+        columns = [column[0] for column in cursor.description]
+        table, access = columns.index("table"), columns.index("type")
+        return [row[table] for row in cursor.fetchall() if row[access] == "ALL"]
+
+    def has_column(self, cursor, table, column):
+        cursor.execute("SELECT 1 FROM INFORMATION_SCHEMA.COLUMNS "
+                       "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s", (table, column))
+        return cursor.fetchone() is not None
+
+    def has_index(self, cursor, table, index):
+        cursor.execute("SELECT 1 FROM INFORMATION_SCHEMA.STATISTICS "
+                       "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = %s", (table, index))
+        return cursor.fetchone() is not None
+
+
+class SQLiteCursor:
+    _translated = {}
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    @classmethod
+    def translate(cls, sql):
+        translated = cls._translated.get(sql)
+        if translated is None:
+            translated = (sql.replace("%s", "?")
+                          .replace("BIGINT AUTO_INCREMENT PRIMARY KEY", "INTEGER PRIMARY KEY AUTOINCREMENT"))
+            cls._translated[sql] = translated
+        return translated
+
+    def execute(self, sql, params=()):
+        self._cursor.execute(self.translate(sql), params or ())
+        return self
+
+    def executemany(self, sql, seq_of_params):
+        self._cursor.executemany(self.translate(sql), seq_of_params)
+        return self
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def fetchmany(self, size=None):
+        return self._cursor.fetchmany(size or self._cursor.arraysize)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    def close(self):
+        self._cursor.close()
+
+
+class SQLiteBackend:
+    name = "sqlite"
+    Error = sqlite3.Error
+    IntegrityError = sqlite3.IntegrityError
+    # OperationalError also covers locked databases, missing tables and bad SQL; only a
+    # file that cannot be opened or read means the database is unreachable.
+    UNREACHABLE_CODES = (14, 10)  # SQLITE_CANTOPEN, SQLITE_IOERR
+    UNREACHABLE_MESSAGES = ("unable to open database file", "disk I/O error")
+
+    PRAGMAS = (
+        ("journal_mode", "WAL"),
+        ("synchronous", "NORMAL"),
+        ("foreign_keys", "ON"),
+        ("temp_store", "MEMORY"),
+        ("cache_size", -64000),
+        ("mmap_size", 268435456),
+        ("busy_timeout", 5000),
+    )
+
+    def __init__(self, path="busline_prisezone.db", pragmas=None, cached_statements=256):
+        self.path = path
+        self.pragmas = dict(self.PRAGMAS, **(pragmas or {}))
+        self.cached_statements = cached_statements
+        # Every connection to ":memory:" is a separate database, so the pool must share one.
+        self.max_connections = 1 if path == ":memory:" else None
+
+    def describe(self):
+        return f"SQLite database {self.path}"
+
+    def is_connection_error(self, error):
+        if not isinstance(error, sqlite3.OperationalError):
+            return False
+        code = getattr(error, "sqlite_errorcode", None)
+        if code is not None:
+            return code & 0xFF in self.UNREACHABLE_CODES
+        return str(error).startswith(self.UNREACHABLE_MESSAGES)
+
+    def connect(self):
+        conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False,
+                               detect_types=sqlite3.PARSE_DECLTYPES,
+                               cached_statements=self.cached_statements)
+        for pragma, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {pragma} = {value}")
+        conn.create_function("CONCAT", -1, _sqlite_concat, deterministic=True)
+        return conn
+
+    def ping(self, conn):
+        conn.execute("SELECT 1")
+
+    def begin(self, conn, write=True):
+        # Writers take the write lock up front; deferred transactions that later write can
+        # fail with SQLITE_BUSY instead of waiting for busy_timeout. Readers stay deferred so
+        # under WAL they neither wait for nor hold up the writer.
+        conn.execute("BEGIN IMMEDIATE" if write else "BEGIN")
+
+    def cursor(self, conn):
+        return SQLiteCursor(conn.cursor())
+
+    def increment_sql(self, table, keys, counters):
+        columns = keys + counters
+        return (f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))}) "
+                f"ON CONFLICT ({', '.join(keys)}) DO UPDATE SET {', '.join(f'{c} = {c} + excluded.{c}' for c in counters)}")
+
+    def full_scans(self, cursor, query, params=()):
+        cursor.execute("EXPLAIN QUERY PLAN " + query, params)
+        details = [row[3] for row in cursor.fetchall()]
+        return [detail.split()[1] for detail in details if detail.startswith("SCAN ") and "INDEX" not in detail]
+
+    def has_column(self, cursor, table, column):
+        cursor.execute(f"PRAGMA table_info({table})")
+        return any(row[1].lower() == column.lower() for row in cursor.fetchall())
+
+    def has_index(self, cursor, table, index):
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND tbl_name = %s AND name = %s", (table, index))
+        return cursor.fetchone() is not None
+
+
+def _sqlite_concat(*parts):
+    if any(part is None for part in parts):
+        return None
+    return "".join(str(part) for part in parts)
+
+
+# Round-trip DECIMAL and DATETIME columns as the same Python types mysql.connector returns.
+# SQLite keeps decimals as REAL, so restore the two-digit scale every DECIMAL(x,2) column uses.
+sqlite3.register_adapter(Decimal, str)
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(" "))
+sqlite3.register_converter("DECIMAL", lambda value: Decimal(value.decode()).quantize(Decimal("0.01")))
+sqlite3.register_converter("DATETIME", lambda value: datetime.fromisoformat(value.decode()))
+
+
+class SeatMap:
+    def __init__(self, capacity):
+        self.capacity = max(int(capacity or 0), 0)
+        self._bits = bytearray((self.capacity + 7) // 8)
+        self.occupied = 0
+
+    def is_free(self, seat):
+        if not 1 <= seat <= self.capacity:
+            return False
+        index = seat - 1
+        return not self._bits[index >> 3] & (1 << (index & 7))
+
+    def occupy(self, seat):
+        if not self.is_free(seat):
+            return False
+        index = seat - 1
+        self._bits[index >> 3] |= 1 << (index & 7)
+        self.occupied += 1
+        return True
+
+    def release(self, seat):
+        if not 1 <= seat <= self.capacity or self.is_free(seat):
+            return False
+        index = seat - 1
+        self._bits[index >> 3] &= ~(1 << (index & 7)) & 0xFF
+        self.occupied -= 1
+        return True
+
+    def next_free(self, start=1):
+        start = max(start, 1)
+        if start > self.capacity or self.occupied >= self.capacity:
+            return None
+        index = start - 1
+        byte = index >> 3
+        while byte < len(self._bits):
+            value = self._bits[byte]
+            if value != 0xFF:
+                for bit in range(index & 7 if byte == (start - 1) >> 3 else 0, 8):
+                    if not value & (1 << bit):
+                        seat = (byte << 3) + bit + 1
+                        return seat if seat <= self.capacity else None
+            byte += 1
+        return None
+
+
+class SeatIndex:
+    def __init__(self, db_manager):
+        self.db_manager = db_manager
+        self._maps = None
+        self._lock = threading.RLock()
+
+    def _ensure_loaded(self):
+        if self._maps is None:
+            self.reload()
+        return self._maps
+
+    def reload(self, bus_number=None):
+        with self.db_manager.transaction(write=False) as cursor:
+            if bus_number is None:
+                cursor.execute("SELECT BusNumber, AmountOfSeats FROM Bus")
+                maps = {row[0]: SeatMap(row[1]) for row in cursor.fetchall()}
+                cursor.execute("SELECT BusNumber, SeatNumber FROM Ticket")
+            else:
+                cursor.execute("SELECT BusNumber, AmountOfSeats FROM Bus WHERE BusNumber = %s", (bus_number,))
+                maps = {row[0]: SeatMap(row[1]) for row in cursor.fetchall()}
+                cursor.execute("SELECT BusNumber, SeatNumber FROM Ticket WHERE BusNumber = %s", (bus_number,))
+            for bus, seat in cursor.fetchall():
+                if bus in maps and seat is not None:
+                    maps[bus].occupy(int(seat))
+
+        # Sales still waiting in the offline journal keep their seats until they are synced.
+        if self.db_manager.offline is not None:
+            for bus, seat in self.db_manager.offline.pending_seats(bus_number):
+                if bus in maps:
+                    maps[bus].occupy(int(seat))
+
+        with self._lock:
+            if bus_number is None:
+                self._maps = maps
+            elif self._maps is not None:
+                self._maps.pop(bus_number, None)
+                self._maps.update(maps)
+
+    def invalidate(self):
+        with self._lock:
+            self._maps = None
+
+    def capacity(self, bus_number):
+        with self._lock:
+            seat_map = self._ensure_loaded().get(bus_number)
+            return seat_map.capacity if seat_map else 0
+
+    def is_free(self, bus_number, seat_number):
+        with self._lock:
+            seat_map = self._ensure_loaded().get(bus_number)
+            return seat_map is not None and seat_map.is_free(seat_number)
+
+    def is_known_taken(self, bus_number, seat_number):
+        with self._lock:
+            if self._maps is None or bus_number not in self._maps:
+                return False
+            return not self._maps[bus_number].is_free(seat_number)
+
+    def next_free(self, bus_number, start=1):
+        with self._lock:
+            seat_map = self._ensure_loaded().get(bus_number)
+            return seat_map.next_free(start) if seat_map else None
+
+    def find_free(self, bus_number, count, start=1):
+        seats = []
+        with self._lock:
+            seat_map = self._ensure_loaded().get(bus_number)
+            seat = seat_map.next_free(start) if seat_map else None
+            while seat is not None and len(seats) < count:
+                seats.append(seat)
+                seat = seat_map.next_free(seat + 1)
+        return seats
+
+    def occupy(self, bus_number, seat_number):
+        with self._lock:
+            if self._maps is not None and bus_number in self._maps:
+                self._maps[bus_number].occupy(seat_number)
+
+    def release(self, bus_number, seat_number):
+        with self._lock:
+            if self._maps is not None and bus_number in self._maps:
+                self._maps[bus_number].release(seat_number)
+
+
+class TicketNumberAllocator:
+    def __init__(self, db_manager, block_size=100, prefix="TK", width=10):
+        self.db = db_manager
+        self.block_size = block_size
+        self.prefix = prefix
+        self.width = width
+        self._next = 0
+        self._end = 0
+        self._lock = threading.Lock()
+
+    def _reserve(self, count):
+        with self.db.metrics.operation("reserve_ticket_numbers"), self.db.transaction() as cursor:
+            cursor.execute("UPDATE TicketSequence SET NextValue = NextValue + %s WHERE Name = %s", (count, "Ticket"))
+            cursor.execute("SELECT NextValue FROM TicketSequence WHERE Name = %s", ("Ticket",))
+            end = cursor.fetchone()[0]
+        return end - count, end
+
+    def format(self, value):
+        return f"{self.prefix}{value:0{self.width}d}"
+
+    def take(self, count=1):
+        with self._lock:
+            numbers = []
+            while len(numbers) < count:
+                if self._next >= self._end:
+                    if self.db.offline is not None and self.db.is_offline:
+                        numbers.extend(self.db.offline.take_numbers(count - len(numbers)))
+                        break
+                    try:
+                        self._next, self._end = self._reserve(max(self.block_size, count - len(numbers)))
+                    except Exception as e:
+                        if self.db.offline is None or not self.db.is_connection_error(e):
+                            raise
+                        self.db.go_offline(e)
+                        continue
+                take = min(count - len(numbers), self._end - self._next)
+                numbers.extend(self.format(value) for value in range(self._next, self._next + take))
+                self._next += take
+            return numbers
+
+    def next(self):
+        return self.take(1)[0]
+
+
+DEFAULT_OFFLINE_JOURNAL = os.path.join(os.path.expanduser("~"), ".bus_ticket_system", "offline_sales.db")
+
+
+class OfflineSalesJournal:
+    def __init__(self, path=DEFAULT_OFFLINE_JOURNAL, prefix="OF"):
+        self.path = path
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False,
+                                     detect_types=sqlite3.PARSE_DECLTYPES)
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        # A queued sale exists nowhere else, so every append is flushed to disk before it is acknowledged.
+        self._conn.execute("PRAGMA synchronous = FULL")
+        self._conn.executescript("""
+        CREATE TABLE IF NOT EXISTS Sale (
+            Seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            TicketNumber TEXT NOT NULL UNIQUE,
+            TicketType TEXT,
+            BusLineID INTEGER,
+            ZoneID INTEGER,
+            PassengerID TEXT,
+            StationNumber INTEGER,
+            BusNumber TEXT,
+            SeatNumber INTEGER,
+            SoldAt DATETIME NOT NULL,
+            Fare TEXT,
+            Status TEXT NOT NULL DEFAULT 'pending',
+            Error TEXT
+        );
+        CREATE INDEX IF NOT EXISTS ix_sale_status ON Sale (Status, Seq);
+        CREATE UNIQUE INDEX IF NOT EXISTS ux_sale_pending_seat ON Sale (BusNumber, SeatNumber) WHERE Status = 'pending';
+        CREATE TABLE IF NOT EXISTS Meta (Name TEXT PRIMARY KEY, Value TEXT);
+        """)
+        if "Fare" not in [column[1] for column in self._conn.execute("PRAGMA table_info(Sale)")]:
+            self._conn.execute("ALTER TABLE Sale ADD COLUMN Fare TEXT")
+        self._conn.execute("INSERT OR IGNORE INTO Meta (Name, Value) VALUES ('StationCode', ?)", (uuid.uuid4().hex[:8].upper(),))
+        self._conn.execute("INSERT OR IGNORE INTO Meta (Name, Value) VALUES ('NextNumber', '1')")
+        self.station_code = self._conn.execute("SELECT Value FROM Meta WHERE Name = 'StationCode'").fetchone()[0]
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def take_numbers(self, count):
+        # Numbers issued while the central ticket sequence is unreachable; the station
+        # code keeps them apart from the numbers issued offline by other stations.
+        with self._transaction() as conn:
+            start = int(conn.execute("SELECT Value FROM Meta WHERE Name = 'NextNumber'").fetchone()[0])
+            conn.execute("UPDATE Meta SET Value = ? WHERE Name = 'NextNumber'", (str(start + count),))
+        return [f"{self.prefix}{self.station_code}{value:08d}" for value in range(start, start + count)]
+
+    def append(self, rows, sold_at, atomic=False):
+        # Rows are the ticket columns followed by the fare charged at the time of sale.
+        queued = []
+        failures = []
+        try:
+            with self._transaction() as conn:
+                for index, row in rows:
+                    conn.execute("SAVEPOINT sale")
+                    try:
+                        conn.execute(f"INSERT INTO Sale ({', '.join(TICKET_COLUMNS)}, SoldAt, Fare) "
+                                     f"VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                     tuple(row[:8]) + (sold_at, None if row[8] is None else str(row[8])))
+                        conn.execute("RELEASE SAVEPOINT sale")
+                        queued.append(row[0])
+                    except sqlite3.IntegrityError:
+                        conn.execute("ROLLBACK TO SAVEPOINT sale")
+                        failures.append((index, row[0], f"Ticket number or seat {row[7]} on bus {row[6]} is already queued"))
+                if atomic and failures:
+                    raise _BatchAborted()
+        except _BatchAborted:
+            return [], failures
+        return queued, failures
+
+    def pending(self, limit=500):
+        with self._lock:
+            return self._conn.execute(f"""
+            SELECT Seq, {', '.join(TICKET_COLUMNS)}, SoldAt, Fare FROM Sale
+            WHERE Status = 'pending' ORDER BY Seq LIMIT ?
+            """, (limit,)).fetchall()
+
+    def pending_seats(self, bus_number=None):
+        with self._lock:
+            if bus_number is None:
+                return self._conn.execute("SELECT BusNumber, SeatNumber FROM Sale WHERE Status = 'pending'").fetchall()
+            return self._conn.execute("SELECT BusNumber, SeatNumber FROM Sale WHERE Status = 'pending' AND BusNumber = ?",
+                                      (bus_number,)).fetchall()
+
+    def count(self, status="pending"):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM Sale WHERE Status = ?", (status,)).fetchone()[0]
+
+    def failed(self):
+        with self._lock:
+            return self._conn.execute(f"""
+            SELECT {', '.join(TICKET_COLUMNS)}, SoldAt, Error FROM Sale
+            WHERE Status = 'failed' ORDER BY Seq
+            """).fetchall()
+
+    def complete(self, synced, failed=()):
+        with self._transaction() as conn:
+            conn.executemany("DELETE FROM Sale WHERE Seq = ?", [(seq,) for seq in synced])
+            conn.executemany("UPDATE Sale SET Status = 'failed', Error = ? WHERE Seq = ?",
+                             [(message, seq) for seq, message in failed])
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class _CodeTable:
+    def __init__(self):
+        self.values = []
+        self.codes = {}
+        self._ranks = None
+
+    def encode(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+            self._ranks = None
+        return code
+
+    def ranks(self):
+        # Codes are handed out in arrival order; sorting needs them in value order.
+        if self._ranks is None:
+            ranks = array("I", bytes(4 * len(self.values)))
+            for rank, code in enumerate(sorted(range(len(self.values)), key=lambda code: str(self.values[code]))):
+                ranks[code] = rank
+            self._ranks = ranks
+        return self._ranks
+
+
+def start_of_day():
+    return datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+class TicketStore:
+    # One typed array per column; text columns hold codes into a shared value table.
+    INT_COLUMNS = ("BusLineID", "ZoneID", "StationNumber", "SeatNumber")
+    CODED_COLUMNS = ("TicketType", "PassengerID", "BusNumber")
+
+    def __init__(self, db_manager, since=None, chunk_size=50000):
+        # since is a datetime or a callable returning one, e.g. start_of_day for a store
+        # that only holds the current day and reloads when the day changes.
+        self.db = db_manager
+        self.since = since
+        self.chunk_size = chunk_size
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._loaded_since = None
+        self._clear()
+
+    def _clear(self):
+        self._numbers = []
+        self._positions = {}
+        self._tables = {column: _CodeTable() for column in self.CODED_COLUMNS}
+        self._columns = {column: array("i") for column in self.INT_COLUMNS}
+        self._columns.update({column: array("I") for column in self.CODED_COLUMNS})
+
+    def _window(self):
+        return self.since() if callable(self.since) else self.since
+
+    def _ensure(self):
+        if not self._loaded or self._window() != self._loaded_since:
+            self.load()
+
+    def load(self):
+        # Encode each chunk as it arrives so the full result set is never held as tuples.
+        fresh = TicketStore(self.db)
+        since = self._window()
+        if since is None:
+            query = f"SELECT {', '.join(TICKET_COLUMNS)} FROM Ticket WHERE TicketNumber > %s ORDER BY TicketNumber LIMIT %s"
+            last = ("",)
+        else:
+            # Page along ix_ticket_sold_at so only the tickets in the window are read.
+            query = (f"SELECT {', '.join(TICKET_COLUMNS)}, SoldAt FROM Ticket "
+                     f"WHERE SoldAt >= %s AND (SoldAt > %s OR (SoldAt = %s AND TicketNumber > %s)) "
+                     f"ORDER BY SoldAt, TicketNumber LIMIT %s")
+            last = (since, since, since, "")
+        while True:
+            with self.db.metrics.operation("load_ticket_store"), self.db.transaction(write=False) as cursor:
+                cursor.execute(query, last + (self.chunk_size,))
+                chunk = cursor.fetchall()
+            fresh._extend(chunk if since is None else [row[:-1] for row in chunk])
+            if len(chunk) < self.chunk_size:
+                break
+            last = (chunk[-1][0],) if since is None else (since, chunk[-1][-1], chunk[-1][-1], chunk[-1][0])
+        with self._lock:
+            self._numbers, self._positions = fresh._numbers, fresh._positions
+            self._tables, self._columns = fresh._tables, fresh._columns
+            self._loaded_since = since
+            self._loaded = True
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded = False
+            self._loaded_since = None
+            self._clear()
+
+    def __len__(self):
+        with self._lock:
+            self._ensure()
+            return len(self._numbers)
+
+    def _encode(self, column, value):
+        if column in self._tables:
+            return self._tables[column].encode(value)
+        return -1 if value is None else int(value)
+
+    def _extend(self, rows):
+        # Bulk path for new ticket numbers: encode a column at a time instead of a cell at a time.
+        if not rows:
+            return
+        columns = list(zip(*rows))
+        start = len(self._numbers)
+        self._numbers.extend(columns[0])
+        self._positions.update(zip(columns[0], range(start, start + len(rows))))
+        for column, values in zip(TICKET_COLUMNS[1:], columns[1:]):
+            if column in self._tables:
+                table = self._tables[column]
+                codes = table.codes
+                self._columns[column].extend([codes[value] if value in codes else table.encode(value) for value in values])
+            else:
+                self._columns[column].extend([-1 if value is None else value for value in values])
+
+    def _put(self, row):
+        position = self._positions.get(row[0])
+        if position is None:
+            self._positions[row[0]] = len(self._numbers)
+            self._numbers.append(row[0])
+            for column, value in zip(TICKET_COLUMNS[1:], row[1:]):
+                self._columns[column].append(self._encode(column, value))
+        else:
+            for column, value in zip(TICKET_COLUMNS[1:], row[1:]):
+                self._columns[column][position] = self._encode(column, value)
+
+    def _remove(self, ticket_number):
+        position = self._positions.pop(ticket_number, None)
+        if position is None:
+            return
+        # Move the last ticket into the hole so the columns stay dense.
+        last = len(self._numbers) - 1
+        if position != last:
+            self._numbers[position] = self._numbers[last]
+            self._positions[self._numbers[position]] = position
+            for values in self._columns.values():
+                values[position] = values[last]
+        self._numbers.pop()
+        for values in self._columns.values():
+            values.pop()
+
+    def _row(self, position):
+        row = [self._numbers[position]]
+        for column in TICKET_COLUMNS[1:]:
+            value = self._columns[column][position]
+            if column in self._tables:
+                row.append(self._tables[column].values[value])
+            else:
+                row.append(None if value == -1 else value)
+        return tuple(row)
+
+    def get(self, ticket_number):
+        with self._lock:
+            self._ensure()
+            position = self._positions.get(ticket_number)
+            return self._row(position) if position is not None else None
+
+    def apply(self, event):
+        if event.table == "*" and event.operation == "reload":
+            self.invalidate()
+            return
+        if event.table != "Ticket":
+            return
+        with self._lock:
+            if not self._loaded:
+                return
+            if event.operation == "delete":
+                self._remove(event.key)
+            elif event.row is not None:
+                # Tickets sold before the window stay out; one already held is kept current.
+                if (self._loaded_since is not None and event.key not in self._positions
+                        and (event.sold_at is None or event.sold_at < self._loaded_since)):
+                    return
+                self._put(tuple(event.row))
+
+    def _matches(self, criteria):
+        if not self._numbers:
+            return []
+        positions = None
+        for column, value in criteria.items():
+            if column == "TicketNumber":
+                position = self._positions.get(value)
+                matches = [] if position is None else [position]
+                positions = matches if positions is None else [p for p in positions if p in matches]
+            else:
+                if column in self._tables:
+                    code = self._tables[column].codes.get(value)
+                    if code is None:
+                        return []
+                else:
+                    code = -1 if value is None else int(value)
+                values = self._columns[column]
+                if positions is not None:
+                    positions = [position for position in positions if values[position] == code]
+                elif np is not None:
+                    positions = np.flatnonzero(np.frombuffer(values, dtype=values.typecode) == code).tolist()
+                else:
+                    positions = [position for position, item in enumerate(values) if item == code]
+            if not positions:
+                return []
+        return list(range(len(self._numbers))) if positions is None else positions
+
+    def find(self, order_by=None, descending=False, limit=None, **criteria):
+        unknown = set(criteria) - set(TICKET_COLUMNS)
+        if unknown or (order_by is not None and order_by not in TICKET_COLUMNS):
+            raise ValueError(f"Unknown ticket column: {', '.join(sorted(unknown)) or order_by}")
+        with self._lock:
+            self._ensure()
+            positions = self._matches(criteria)
+            if order_by == "TicketNumber":
+                positions.sort(key=self._numbers.__getitem__, reverse=descending)
+            elif order_by is not None:
+                values = self._columns[order_by]
+                if order_by in self._tables:
+                    ranks = self._tables[order_by].ranks()
+                    positions.sort(key=lambda position: ranks[values[position]], reverse=descending)
+                else:
+                    positions.sort(key=values.__getitem__, reverse=descending)
+            if limit is not None:
+                positions = positions[:limit]
+            return [self._row(position) for position in positions]
+
+
+REFERENCE_TABLES = {
+    "BusLine": ("SELECT BusLineID, BusLineName FROM BusLine ORDER BY BusLineID", int),
+    "Zone": ("SELECT ZoneID, Price FROM Zone ORDER BY ZoneID", int),
+    "Station": ("SELECT StationNumber, StationName, BusLineID, ZoneID FROM Station ORDER BY StationNumber", int),
+    "Bus": ("SELECT BusNumber, BusLineID, AmountOfSeats FROM Bus ORDER BY BusNumber", str),
+    "Passenger": ("SELECT PassengerID, PassengerName FROM Passenger ORDER BY PassengerID", str),
+}
+
+
+class ReferenceCache:
+    def __init__(self, db_manager, ttl=300):
+        self.db_manager = db_manager
+        self.ttl = ttl
+        self._tables = {}
+        self._loaded_at = {}
+        self._lock = threading.RLock()
+
+    def _index(self, table):
+        with self._lock:
+            loaded_at = self._loaded_at.get(table)
+            if loaded_at is None or (self.ttl is not None and time.monotonic() - loaded_at > self.ttl):
+                try:
+                    self.reload(table)
+                except Exception as e:
+                    # While the database is unreachable, keep serving the last copy until the next refresh.
+                    if table not in self._tables or not self.db_manager.is_connection_error(e):
+                        raise
+                    self._loaded_at[table] = time.monotonic()
+            return self._tables[table]
+
+    def reload(self, table):
+        query, key_type = REFERENCE_TABLES[table]
+        with self.db_manager.transaction(write=False) as cursor:
+            cursor.execute(query)
+            rows = cursor.fetchall()
+        with self._lock:
+            self._tables[table] = {row[0]: tuple(row) for row in rows}
+            self._loaded_at[table] = time.monotonic()
+
+    def _key(self, table, key):
+        key_type = REFERENCE_TABLES[table][1]
+        try:
+            return key_type(key)
+        except (TypeError, ValueError):
+            return key
+
+    def table(self, table):
+        return self._index(table)
+
+    def rows(self, table):
+        return list(self._index(table).values())
+
+    def get(self, table, key):
+        return self._index(table).get(self._key(table, key))
+
+    def put(self, table, row):
+        with self._lock:
+            if table in self._tables:
+                self._tables[table][self._key(table, row[0])] = tuple(row)
+
+    def remove(self, table, key):
+        with self._lock:
+            if table in self._tables:
+                self._tables[table].pop(self._key(table, key), None)
+
+    def invalidate(self, table=None):
+        with self._lock:
+            if table is None:
+                self._loaded_at.clear()
+            else:
+                self._loaded_at.pop(table, None)
+
+
+def _trigrams(token):
+    padded = f"  {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class PassengerSearchIndex:
+    def __init__(self, db_manager, min_similarity=0.3):
+        self.db_manager = db_manager
+        self.min_similarity = min_similarity
+        self._source = None
+        self._stale = True
+        self._lock = threading.RLock()
+        self._ids = []
+        self._names = {}
+        self._tokens = {}
+        self._token_keys = []
+        self._token_trigrams = {}
+
+    def _ensure(self):
+        source = self.db_manager.cache.table("Passenger")
+        with self._lock:
+            if self._stale or source is not self._source:
+                self._build(source.values())
+                self._source = source
+                self._stale = False
+
+    def _build(self, rows):
+        self._names = {}
+        self._tokens = {}
+        self._token_trigrams = {}
+        for passenger_id, passenger_name in rows:
+            self._names[passenger_id] = passenger_name
+            for token in self._split(passenger_name):
+                self._tokens.setdefault(token, set()).add(passenger_id)
+        self._ids = sorted((passenger_id.lower(), passenger_id) for passenger_id in self._names)
+        self._token_keys = sorted(self._tokens)
+        for token in self._token_keys:
+            for trigram in _trigrams(token):
+                self._token_trigrams.setdefault(trigram, set()).add(token)
+
+    def _split(self, name):
+        return set((name or "").lower().split())
+
+    def _add_token(self, token, passenger_id):
+        ids = self._tokens.get(token)
+        if ids is None:
+            ids = self._tokens[token] = set()
+            bisect.insort(self._token_keys, token)
+            for trigram in _trigrams(token):
+                self._token_trigrams.setdefault(trigram, set()).add(token)
+        ids.add(passenger_id)
+
+    def _remove_token(self, token, passenger_id):
+        ids = self._tokens.get(token)
+        if ids is None:
+            return
+        ids.discard(passenger_id)
+        if not ids:
+            del self._tokens[token]
+            del self._token_keys[bisect.bisect_left(self._token_keys, token)]
+            for trigram in _trigrams(token):
+                tokens = self._token_trigrams.get(trigram)
+                if tokens is not None:
+                    tokens.discard(token)
+                    if not tokens:
+                        del self._token_trigrams[trigram]
+
+    def put(self, row):
+        with self._lock:
+            if self._source is None:
+                return
+            passenger_id, passenger_name = row[0], row[1]
+            if passenger_id in self._names:
+                for token in self._split(self._names[passenger_id]):
+                    self._remove_token(token, passenger_id)
+            else:
+                bisect.insort(self._ids, (passenger_id.lower(), passenger_id))
+            self._names[passenger_id] = passenger_name
+            for token in self._split(passenger_name):
+                self._add_token(token, passenger_id)
+
+    def remove(self, passenger_id):
+        with self._lock:
+            if self._source is None or passenger_id not in self._names:
+                return
+            for token in self._split(self._names.pop(passenger_id)):
+                self._remove_token(token, passenger_id)
+            index = bisect.bisect_left(self._ids, (passenger_id.lower(), passenger_id))
+            if index < len(self._ids) and self._ids[index][1] == passenger_id:
+                del self._ids[index]
+
+    def apply(self, event):
+        if event.table == "*":
+            self._stale = True
+        elif event.table == "Passenger":
+            if event.operation == "delete":
+                self.remove(event.key)
+            elif event.row:
+                self.put(event.row)
+
+    def _prefix_range(self, keys, prefix):
+        start = bisect.bisect_left(keys, prefix)
+        end = bisect.bisect_left(keys, prefix + "￿", start)
+        return start, end
+
+    def search(self, text, limit=20):
+        self._ensure()
+        query = (text or "").strip().lower()
+        with self._lock:
+            if not query:
+                return [(passenger_id, self._names[passenger_id]) for _, passenger_id in self._ids[:limit]]
+
+            found = []
+            seen = set()
+
+            def add(passenger_id):
+                if passenger_id not in seen and passenger_id in self._names:
+                    seen.add(passenger_id)
+                    found.append((passenger_id, self._names[passenger_id]))
+                return len(found) >= limit
+
+            start, end = bisect.bisect_left(self._ids, (query,)), len(self._ids)
+            for index in range(start, end):
+                if not self._ids[index][0].startswith(query) or add(self._ids[index][1]):
+                    break
+            if len(found) >= limit:
+                return found
+
+            words = query.split()
+            ranges = [self._prefix_range(self._token_keys, word) for word in words]
+            # Walk the most selective word's tokens and check the other words against each name.
+            narrowest = min(range(len(words)), key=lambda i: ranges[i][1] - ranges[i][0])
+            others = [word for i, word in enumerate(words) if i != narrowest]
+            start, end = ranges[narrowest]
+            for token in self._token_keys[start:end]:
+                for passenger_id in sorted(self._tokens[token]):
+                    tokens = self._split(self._names[passenger_id])
+                    if all(any(name_token.startswith(word) for name_token in tokens) for word in others):
+                        if add(passenger_id):
+                            return found
+
+            scores = {}
+            for word in words:
+                if len(word) < 3:
+                    continue
+                word_trigrams = _trigrams(word)
+                shared = {}
+                for trigram in word_trigrams:
+                    for token in self._token_trigrams.get(trigram, ()):
+                        shared[token] = shared.get(token, 0) + 1
+                # A short word has few trigrams, so one differing letter costs it a large share of
+                # its score; the threshold is relaxed for words under four letters.
+                threshold = self.min_similarity * min(1.0, len(word) / 4)
+                best = {}
+                for token, count in shared.items():
+                    similarity = count / (len(word_trigrams) + len(_trigrams(token)) - count)
+                    if similarity < threshold:
+                        continue
+                    for passenger_id in self._tokens[token]:
+                        best[passenger_id] = max(best.get(passenger_id, 0), similarity)
+                # Names matching several of the typed words rank above single-word matches.
+                for passenger_id, similarity in best.items():
+                    scores[passenger_id] = scores.get(passenger_id, 0) + similarity
+            for passenger_id, _ in sorted(scores.items(), key=lambda item: (-item[1], item[0])):
+                if add(passenger_id):
+                    break
+            return found
+
+
+JourneyLeg = namedtuple("JourneyLeg", "bus_line_id board alight stops")
+
+
+class RouteGraph:
+    def __init__(self, db_manager, max_cached_journeys=4096):
+        self.db_manager = db_manager
+        self.max_cached_journeys = max_cached_journeys
+        self._sources = None
+        self._lock = threading.RLock()
+        self._line_stations = {}
+        self._line_buses = {}
+        self._station_line = {}
+        self._position = {}
+        self._twins = {}
+        self._same_stop = {}
+        self._transfer_points = {}
+        self._journeys = {}
+
+    def _ensure(self):
+        sources = tuple(self.db_manager.cache.table(table) for table in ("BusLine", "Station", "Bus"))
+        with self._lock:
+            if self._sources is None or any(a is not b for a, b in zip(sources, self._sources)):
+                self._build(*sources)
+                self._sources = sources
+
+    def _build(self, bus_lines, stations, buses):
+        # Stations have no explicit sequence, so a line's stops run in StationNumber order.
+        self._line_stations = {line_id: [] for line_id in bus_lines}
+        self._station_line = {}
+        by_name = {}
+        for station_number in sorted(stations):
+            name, line_id = stations[station_number][1:3]
+            self._line_stations.setdefault(line_id, []).append((station_number, name))
+            self._station_line[station_number] = line_id
+            by_name.setdefault(name, []).append(station_number)
+        self._position = {station_number: position
+                          for line_stations in self._line_stations.values()
+                          for position, (station_number, _) in enumerate(line_stations)}
+
+        # Stations of different lines sharing a name are transfer points between those lines.
+        self._twins = {}
+        self._same_stop = {}
+        for same_name in by_name.values():
+            for station_number in same_name:
+                self._same_stop[station_number] = same_name
+                twins = [other for other in same_name if self._station_line[other] != self._station_line[station_number]]
+                if twins:
+                    self._twins[station_number] = twins
+        self._transfer_points = {}
+        for station_number in self._twins:
+            self._transfer_points.setdefault(self._station_line[station_number], []).append(
+                (self._position[station_number], station_number))
+        for points in self._transfer_points.values():
+            points.sort()
+
+        self._line_buses = {line_id: [] for line_id in bus_lines}
+        for bus_number in sorted(buses):
+            self._line_buses.setdefault(buses[bus_number][1], []).append((bus_number, buses[bus_number][1]))
+        self._journeys = {}
+
+    def stations(self, bus_line_id):
+        self._ensure()
+        return list(self._line_stations.get(int(bus_line_id), ()))
+
+    def buses(self, bus_line_id):
+        self._ensure()
+        return list(self._line_buses.get(int(bus_line_id), ()))
+
+    def transfers(self, station_number):
+        self._ensure()
+        return [(twin, self._station_line[twin]) for twin in self._twins.get(int(station_number), ())]
+
+    def plan(self, origin, destination):
+        self._ensure()
+        origin, destination = int(origin), int(destination)
+        with self._lock:
+            key = (origin, destination)
+            if key not in self._journeys:
+                if len(self._journeys) >= self.max_cached_journeys:
+                    self._journeys.clear()
+                self._journeys[key] = self._shortest_path(origin, destination)
+            return self._journeys[key]
+
+    def _shortest_path(self, origin, destination):
+        if origin not in self._station_line or destination not in self._station_line:
+            return None
+        # Same-named stations are one physical stop: boarding or alighting at any of them is free.
+        if origin in self._same_stop[destination]:
+            return []
+        targets = {}
+        for station_number in self._same_stop[destination]:
+            targets.setdefault(self._station_line[station_number], []).append(station_number)
+        # Dijkstra over transfer points only; a ride between two stops of a line costs the number of
+        # stops in between, so costs are (transfers, stops) compared lexicographically.
+        best = {}
+        previous = {}
+        heap = []
+        for station_number in self._same_stop[origin]:
+            best[station_number] = (0, 0)
+            heap.append(((0, 0), station_number))
+        heapq.heapify(heap)
+        arrival = None
+        while heap:
+            cost, station_number = heapq.heappop(heap)
+            if cost > best[station_number]:
+                continue
+            line_id = self._station_line[station_number]
+            if station_number in targets.get(line_id, ()):
+                arrival = station_number
+                break
+            position = self._position[station_number]
+            moves = [(twin, (cost[0] + 1, cost[1])) for twin in self._twins.get(station_number, ())]
+            for target in targets.get(line_id, ()):
+                moves.append((target, (cost[0], cost[1] + abs(self._position[target] - position))))
+            points = self._transfer_points.get(line_id, ())
+            index = bisect.bisect_left(points, (position, station_number))
+            for neighbour in (index - 1, index + 1 if index < len(points) and points[index][1] == station_number else index):
+                if 0 <= neighbour < len(points):
+                    moves.append((points[neighbour][1], (cost[0], cost[1] + abs(points[neighbour][0] - position))))
+            for next_station, next_cost in moves:
+                if next_station not in best or next_cost < best[next_station]:
+                    best[next_station] = next_cost
+                    previous[next_station] = station_number
+                    heapq.heappush(heap, (next_cost, next_station))
+        if arrival is None:
+            return None
+
+        path = [arrival]
+        while path[-1] in previous:
+            path.append(previous[path[-1]])
+        path.reverse()
+        legs = []
+        board = path[0]
+        for here, there in zip(path, path[1:] + [None]):
+            if there is None or self._station_line[there] != self._station_line[here]:
+                if here != board:
+                    legs.append(JourneyLeg(self._station_line[board], board, here,
+                                           abs(self._position[here] - self._position[board])))
+                board = there
+        return legs
+
+
+def _sales_summary_keys(ticket_type, bus_line_id, zone_id, sold_at):
+    keys = [("zone", str(zone_id)), ("bus_line", str(bus_line_id)), ("ticket_type", ticket_type),
+            ("fare", f"{ticket_type}/{zone_id}")]
+    if sold_at is not None:
+        keys.append(("day", sold_at.date().isoformat()))
+    return keys
+
+
+def _sales_summary_totals(tickets, prices, totals=None, sign=1):
+    # Tickets carry the fare they were sold at; only rows without one are priced now.
+    totals = {} if totals is None else totals
+    for ticket_type, bus_line_id, zone_id, sold_at, fare in tickets:
+        revenue = Decimal(str(fare)) if fare is not None else ticket_fare(ticket_type, prices.get(zone_id))
+        for key in _sales_summary_keys(ticket_type, bus_line_id, zone_id, sold_at):
+            total = totals.setdefault(key, [0, Decimal("0.00")])
+            total[0] += sign
+            total[1] += sign * revenue
+    return totals
+
+
+def backfill_ticket_fares(cursor):
+    for ticket_type, multiplier in FARE_MULTIPLIERS.items():
+        cursor.execute(
+            "UPDATE Ticket SET Fare = (SELECT Price FROM Zone WHERE Zone.ZoneID = Ticket.ZoneID) * %s "
+            "WHERE Fare IS NULL AND TicketType = %s",
+            (multiplier, ticket_type)
+        )
+
+
+def rebuild_sales_summary(cursor, stored_fares=True):
+    # Schema versions before 9 have no Ticket.Fare; their tickets are priced at the current zone prices.
+    if stored_fares:
+        backfill_ticket_fares(cursor)
+    cursor.execute("DELETE FROM SalesSummary")
+    cursor.execute("SELECT ZoneID, Price FROM Zone")
+    prices = dict(cursor.fetchall())
+    cursor.execute(f"SELECT TicketType, BusLineID, ZoneID, SoldAt, {'Fare' if stored_fares else 'NULL'} FROM Ticket")
+    totals = _sales_summary_totals(cursor.fetchall(), prices)
+    if totals:
+        cursor.executemany(
+            "INSERT INTO SalesSummary (Dimension, DimensionKey, Tickets, Revenue) VALUES (%s, %s, %s, %s)",
+            [(dimension, key, tickets, revenue) for (dimension, key), (tickets, revenue) in totals.items()]
+        )
+
+
+def ticket_fare(ticket_type, price):
+    if price is None:
+        return Decimal("0.00")
+    return Decimal(str(price)) * FARE_MULTIPLIERS.get(ticket_type, 0)
+
+
+class SalesReports:
+    def __init__(self, db_manager):
+        self.db = db_manager
+
+    def fare(self, ticket_type, zone_id):
+        zone = self.db.cache.get("Zone", zone_id)
+        return ticket_fare(ticket_type, zone[1] if zone else None)
+
+    def apply(self, cursor, added=(), removed=()):
+        prices = {}
+        for ticket in list(added) + list(removed):
+            if ticket[4] is None and ticket[2] not in prices:
+                zone = self.db.cache.get("Zone", ticket[2])
+                prices[ticket[2]] = zone[1] if zone else None
+        totals = _sales_summary_totals(added, prices)
+        _sales_summary_totals(removed, prices, totals, sign=-1)
+        changed = [(dimension, key, tickets, revenue)
+                   for (dimension, key), (tickets, revenue) in totals.items() if tickets or revenue]
+        if changed:
+            cursor.executemany(
+                self.db.backend.increment_sql("SalesSummary", ("Dimension", "DimensionKey"), ("Tickets", "Revenue")),
+                changed
+            )
+
+    def rebuild(self):
+        with self.db.metrics.operation("rebuild_sales_summary"), self.db.transaction() as cursor:
+            rebuild_sales_summary(cursor)
+
+    def totals(self, dimension):
+        with self.db.metrics.operation(f"sales_report_{dimension}"), self.db.transaction(write=False) as cursor:
+            cursor.execute(
+                "SELECT DimensionKey, Tickets, Revenue FROM SalesSummary WHERE Dimension = %s", (dimension,)
+            )
+            return {key: (tickets, Decimal(str(revenue))) for key, tickets, revenue in cursor.fetchall()}
+
+    def zone_usage(self):
+        totals = self.totals("zone")
+        return [(zone_id, label) + totals.get(str(zone_id), (0, Decimal("0.00")))
+                for zone_id, label in self.db.get_all_zones()]
+
+    def bus_line_usage(self):
+        totals = self.totals("bus_line")
+        return [(bus_line_id, name) + totals.get(str(bus_line_id), (0, Decimal("0.00")))
+                for bus_line_id, name in self.db.get_all_bus_lines()]
+
+    def ticket_type_sales(self):
+        totals = self.totals("ticket_type")
+        return [(ticket_type,) + totals.get(ticket_type, (0, Decimal("0.00"))) for ticket_type in TICKET_TYPES]
+
+    def fare_totals(self):
+        labels = dict(self.db.get_all_zones())
+        rows = []
+        for key, (tickets, revenue) in self.totals("fare").items():
+            if not tickets:
+                continue
+            ticket_type, zone_id = key.rsplit("/", 1)
+            rows.append((ticket_type, int(zone_id), labels.get(int(zone_id), f"Zone {zone_id}"), tickets, revenue))
+        return sorted(rows)
+
+    def daily_sales(self, start=None, end=None):
+        rows = []
+        for day, (tickets, revenue) in self.totals("day").items():
+            if (start is None or day >= str(start)) and (end is None or day <= str(end)):
+                rows.append((day, tickets, revenue))
+        return sorted(rows)
+
+
+def _cents(value):
+    return Decimal(int(round(float(value)))).scaleb(-2)
+
+
+FareColumns = namedtuple("FareColumns", "ticket_types bus_lines zones fares", defaults=(None,))
+
+
+class FareEngine:
+    def __init__(self, db_manager):
+        if np is None:
+            raise ImportError("numpy is required for the fare engine")
+        self.db = db_manager
+        self.multipliers = np.array([FARE_MULTIPLIERS[ticket_type] for ticket_type in TICKET_TYPES] + [0], dtype=np.int64)
+        self._type_codes = {ticket_type: code for code, ticket_type in enumerate(TICKET_TYPES)}
+
+    def columns(self, rows):
+        # Rows are (TicketType, BusLineID, ZoneID) with an optional stored Fare. Missing values
+        # are kept as -1: an unknown zone prices at 0 and a missing fare is priced from the zones.
+        unknown = len(TICKET_TYPES)
+        rows = list(rows)
+        return FareColumns(
+            np.fromiter((self._type_codes.get(row[0], unknown) for row in rows), dtype=np.int8, count=len(rows)),
+            np.fromiter((-1 if row[1] is None else row[1] for row in rows), dtype=np.int64, count=len(rows)),
+            np.fromiter((-1 if row[2] is None else row[2] for row in rows), dtype=np.int64, count=len(rows)),
+            np.fromiter((-1 if len(row) < 4 or row[3] is None else int(round(float(row[3]) * 100)) for row in rows),
+                        dtype=np.int64, count=len(rows))
+        )
+
+    def load(self, since=None, until=None, chunk_size=50000):
+        # A SoldAt range pages along ix_ticket_sold_at; without one, along the primary key,
+        # which also covers tickets that have no sale time.
+        bounds, params = [], []
+        if since is not None:
+            bounds.append("SoldAt >= %s")
+            params.append(since)
+        if until is not None:
+            bounds.append("SoldAt < %s")
+            params.append(until)
+        if bounds:
+            order, seek = "SoldAt, TicketNumber", "(SoldAt > %s OR (SoldAt = %s AND TicketNumber > %s))"
+        else:
+            order, seek = "TicketNumber", "TicketNumber > %s"
+        chunks = []
+        last = None
+        while True:
+            where = bounds + ([seek] if last is not None else [])
+            with self.db.metrics.operation("load_fare_columns"), self.db.transaction(write=False) as cursor:
+                cursor.execute(
+                    f"SELECT TicketType, BusLineID, ZoneID, Fare, SoldAt, TicketNumber FROM Ticket"
+                    f"{' WHERE ' + ' AND '.join(where) if where else ''} ORDER BY {order} LIMIT %s",
+                    params + list(last or ()) + [chunk_size]
+                )
+                rows = cursor.fetchall()
+            if not rows:
+                break
+            last = (rows[-1][4], rows[-1][4], rows[-1][5]) if bounds else (rows[-1][5],)
+            chunks.append(self.columns(row[:4] for row in rows))
+            if len(rows) < chunk_size:
+                break
+        if not chunks:
+            return self.columns([])
+        return FareColumns(*(np.concatenate(parts) for parts in zip(*chunks)))
+
+    def price_table(self):
+        zones = self.db.cache.rows("Zone")
+        prices = np.zeros(max([zone_id for zone_id, _ in zones], default=0) + 1, dtype=np.int64)
+        for zone_id, price in zones:
+            prices[zone_id] = int(Decimal(str(price)) * 100)
+        return prices
+
+    def fares(self, columns, prices=None):
+        # Fares are computed in cents so totals stay exact. Tickets are settled at the fare
+        # they were sold at; only tickets without a stored fare use the current prices.
+        prices = self.price_table() if prices is None else prices
+        known = (columns.zones >= 0) & (columns.zones < len(prices))
+        zone_prices = np.where(known, prices[np.where(known, columns.zones, 0)], 0)
+        priced = zone_prices * self.multipliers[columns.ticket_types]
+        if columns.fares is None:
+            return priced
+        return np.where(columns.fares >= 0, columns.fares, priced)
+
+    def _breakdown(self, keys, fares):
+        if not len(keys):
+            return {}
+        if keys.min() >= 0 and keys.max() < 1 << 20:
+            # IDs are small integers: count straight into dense bins and skip the sort.
+            counts = np.bincount(keys)
+            totals = np.bincount(keys, weights=fares)
+            values = np.flatnonzero(counts)
+            counts, totals = counts[values], totals[values]
+        else:
+            values, inverse = np.unique(keys, return_inverse=True)
+            counts = np.bincount(inverse, minlength=len(values))
+            totals = np.bincount(inverse, weights=fares, minlength=len(values))
+        # -1 stands for a missing bus line or zone and is reported under None.
+        return {None if value == -1 else value: (int(count), _cents(total))
+                for value, count, total in zip(values.tolist(), counts, totals)}
+
+    def settle(self, columns=None, since=None, until=None):
+        columns = self.load(since, until) if columns is None else columns
+        fares = self.fares(columns)
+        by_type = self._breakdown(columns.ticket_types, fares)
+        return {
+            "tickets": int(len(fares)),
+            "revenue": _cents(fares.sum()),
+            "by_ticket_type": {TICKET_TYPES[code] if code < len(TICKET_TYPES) else "Unknown": total
+                               for code, total in by_type.items()},
+            "by_zone": self._breakdown(columns.zones, fares),
+            "by_bus_line": self._breakdown(columns.bus_lines, fares),
+        }
+
+
+class FareMatrix:
+    def __init__(self, db_manager):
+        self.db = db_manager
+        self._lock = threading.RLock()
+        self._sources = None
+        self._zone_ids = []
+        self._zone_index = {}
+        self._station_zone = {}
+        self._fare_zones = array("i")
+        self._cells = {}
+        self._prices = {}
+        self._zone_cents = {}
+
+    def _ensure(self):
+        zones, stations = self.db.cache.table("Zone"), self.db.cache.table("Station")
+        if self._sources is not None and zones is self._sources[0] and stations is self._sources[1]:
+            return
+        with self._lock:
+            if self._sources is not None and stations is self._sources[1] and sorted(zones) == self._zone_ids:
+                for zone_id, price in zones.values():
+                    self._set_price(zone_id, price)
+            else:
+                self._build(zones, stations)
+            self._sources = (zones, stations)
+
+    def _build(self, zones, stations):
+        self._zone_ids = sorted(zones)
+        self._zone_index = {zone_id: index for index, zone_id in enumerate(self._zone_ids)}
+        self._station_zone = {row[0]: self._zone_index[row[3]] for row in stations.values() if row[3] in self._zone_index}
+        # A trip spanning n zones is charged the price of the n-th zone, capped at the outermost zone.
+        count = len(self._zone_ids)
+        self._fare_zones = array("i", (min(abs(origin - destination), count - 1)
+                                       for origin in range(count) for destination in range(count)))
+        self._cells = {}
+        for cell, fare_zone in enumerate(self._fare_zones):
+            self._cells.setdefault(fare_zone, []).append(cell)
+        self._prices = {ticket_type: array("q", bytes(8 * len(self._fare_zones))) for ticket_type in TICKET_TYPES}
+        self._zone_cents = {}
+        for zone_id, price in zones.values():
+            self._set_price(zone_id, price)
+
+    def _set_price(self, zone_id, price):
+        index = self._zone_index.get(zone_id)
+        cents = int(round(Decimal(str(price or 0)) * 100))
+        if index is None or self._zone_cents.get(index) == cents:
+            return
+        # Only the cells charged at this zone's price change.
+        self._zone_cents[index] = cents
+        for ticket_type, prices in self._prices.items():
+            value = cents * FARE_MULTIPLIERS[ticket_type]
+            for cell in self._cells.get(index, ()):
+                prices[cell] = value
+
+    def apply(self, event):
+        if event.table == "Zone" and event.row:
+            with self._lock:
+                if event.row[0] in self._zone_index:
+                    self._set_price(event.row[0], event.row[1])
+                else:
+                    self._sources = None
+        elif event.table == "Station" and event.row:
+            with self._lock:
+                zone = self._zone_index.get(event.row[3])
+                if zone is None:
+                    self._station_zone.pop(event.row[0], None)
+                else:
+                    self._station_zone[event.row[0]] = zone
+
+    def _cell(self, origin_station, destination_station):
+        try:
+            origin = self._station_zone.get(int(origin_station))
+            destination = self._station_zone.get(int(destination_station))
+        except (TypeError, ValueError):
+            return None
+        if origin is None or destination is None:
+            return None
+        return origin * len(self._zone_ids) + destination
+
+    def fare_zone(self, origin_station, destination_station):
+        self._ensure()
+        with self._lock:
+            cell = self._cell(origin_station, destination_station)
+            return None if cell is None else self._zone_ids[self._fare_zones[cell]]
+
+    def quote(self, origin_station, destination_station, ticket_type):
+        self._ensure()
+        with self._lock:
+            cell = self._cell(origin_station, destination_station)
+            if cell is None or ticket_type not in self._prices:
+                return None
+            return self._zone_ids[self._fare_zones[cell]], _cents(self._prices[ticket_type][cell])
+
+
+# MySQL commits every DDL statement on its own, so a migration that fails half way leaves
+# its earlier steps applied. Schema changes therefore check first and can simply be re-run.
+def add_column(table, column, definition):
+    def step(cursor, backend):
+        if not backend.has_column(cursor, table, column):
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+    return step
+
+
+def create_index(name, table, columns, unique=False):
+    def step(cursor, backend):
+        if not backend.has_index(cursor, table, name):
+            cursor.execute(f"CREATE {'UNIQUE ' if unique else ''}INDEX {name} ON {table} ({columns})")
+    return step
+
+
+def require_unique(table, columns, key, shown=20):
+    # Existing duplicates would make the unique index fail with a bare integrity error; list
+    # them instead so they can be resolved by hand. Rows with NULLs never conflict.
+    def step(cursor, backend):
+        cursor.execute(
+            f"SELECT {columns}, GROUP_CONCAT({key}) FROM {table} "
+            f"WHERE {' AND '.join(f'{column.strip()} IS NOT NULL' for column in columns.split(','))} "
+            f"GROUP BY {columns} HAVING COUNT(*) > 1"
+        )
+        duplicates = cursor.fetchall()
+        if duplicates:
+            listed = "; ".join(f"{', '.join(str(value) for value in row[:-1])}: {row[-1]}" for row in duplicates[:shown])
+            raise MigrationError(
+                f"{table} has {len(duplicates)} duplicate ({columns}) value(s), resolve them and restart: {listed}"
+                + (" ..." if len(duplicates) > shown else "")
+            )
+    return step
+
+
+SCHEMA_MIGRATIONS = [
+    (1, [
+        '''
+        CREATE TABLE IF NOT EXISTS Company (
+            CompanyName VARCHAR(100) PRIMARY KEY,
+            VAT VARCHAR(20)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS BusLine (
+            BusLineID INT PRIMARY KEY,
+            Route VARCHAR(255),
+            BusLineName VARCHAR(100),
+            Length DECIMAL(5,2),
+            CompanyName VARCHAR(100),
+            AmountOfSeats INT,
+            AmountOfCrew INT,
+            OnWay TINYINT(1),
+            FOREIGN KEY (CompanyName) REFERENCES Company(CompanyName)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS Station (
+            StationNumber INT PRIMARY KEY,
+            StationName VARCHAR(100),
+            BusLineID INT,
+            FOREIGN KEY (BusLineID) REFERENCES BusLine(BusLineID)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS Bus (
+            BusNumber VARCHAR(50) PRIMARY KEY,
+            BusLineID INT,
+            AmountOfSeats INT,
+            AmountOfCrew INT,
+            OnWay TINYINT(1),
+            FOREIGN KEY (BusLineID) REFERENCES BusLine(BusLineID)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS Crew (
+            CrewID INT PRIMARY KEY,
+            CrewRole VARCHAR(100),
+            CrewName VARCHAR(100),
+            BusNumber VARCHAR(50),
+            FOREIGN KEY (BusNumber) REFERENCES Bus(BusNumber)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS Zone (
+            ZoneID INT PRIMARY KEY,
+            Price DECIMAL(5,2)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS Passenger (
+            PassengerID VARCHAR(20) PRIMARY KEY,
+            PassengerName VARCHAR(100)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS Ticket (
+            TicketNumber VARCHAR(50) PRIMARY KEY,
+            TicketType VARCHAR(50),
+            ZoneID INT,
+            SeatNumber INT,
+            PassengerID VARCHAR(20),
+            BusLineID INT,
+            StationNumber INT,
+            BusNumber VARCHAR(50),
+            FOREIGN KEY (ZoneID) REFERENCES Zone(ZoneID),
+            FOREIGN KEY (PassengerID) REFERENCES Passenger(PassengerID),
+            FOREIGN KEY (BusLineID) REFERENCES BusLine(BusLineID),
+            FOREIGN KEY (StationNumber) REFERENCES Station(StationNumber),
+            FOREIGN KEY (BusNumber) REFERENCES Bus(BusNumber)
+        )
+        '''
+    ]),
+    (2, [
+        require_unique("Ticket", "BusNumber, SeatNumber", "TicketNumber"),
+        create_index("ux_ticket_bus_seat", "Ticket", "BusNumber, SeatNumber", unique=True)
+    ]),
+    (3, [
+        '''
+        CREATE TABLE IF NOT EXISTS ChangeLog (
+            ChangeID BIGINT AUTO_INCREMENT PRIMARY KEY,
+            TableName VARCHAR(50),
+            Operation VARCHAR(10),
+            RowKey VARCHAR(50),
+            Scope VARCHAR(255),
+            Origin VARCHAR(64),
+            ChangedAt DATETIME
+        )
+        ''',
+        create_index("ix_changelog_changed_at", "ChangeLog", "ChangedAt")
+    ]),
+    (4, [
+        create_index("ix_ticket_passenger", "Ticket", "PassengerID"),
+        create_index("ix_ticket_line_zone", "Ticket", "BusLineID, ZoneID")
+    ]),
+    (5, [
+        add_column("Ticket", "SoldAt", "DATETIME"),
+        '''
+        CREATE TABLE IF NOT EXISTS SalesSummary (
+            Dimension VARCHAR(20),
+            DimensionKey VARCHAR(100),
+            Tickets INT NOT NULL DEFAULT 0,
+            Revenue DECIMAL(12,2) NOT NULL DEFAULT 0,
+            PRIMARY KEY (Dimension, DimensionKey)
+        )
+        ''',
+        lambda cursor, backend: rebuild_sales_summary(cursor, stored_fares=False)
+    ]),
+    (6, [
+        '''
+        CREATE TABLE IF NOT EXISTS TicketSequence (
+            Name VARCHAR(50) PRIMARY KEY,
+            NextValue BIGINT NOT NULL
+        )
+        ''',
+        "INSERT INTO TicketSequence (Name, NextValue) VALUES ('Ticket', 1)"
+    ]),
+    (7, [
+        add_column("Ticket", "Version", "INT NOT NULL DEFAULT 1"),
+        add_column("Passenger", "Version", "INT NOT NULL DEFAULT 1")
+    ]),
+    (8, [
+        add_column("Station", "ZoneID", "INT")
+    ]),
+    (9, [
+        add_column("Ticket", "Fare", "DECIMAL(8,2)"),
+        lambda cursor, backend: backfill_ticket_fares(cursor)
+    ]),
+    (10, [
+        create_index("ix_ticket_sold_at", "Ticket", "SoldAt, TicketNumber")
+    ]),
+]
+
+SCHEMA_VERSION = SCHEMA_MIGRATIONS[-1][0]
+
+TICKET_COLUMNS = ("TicketNumber", "TicketType", "BusLineID", "ZoneID", "PassengerID", "StationNumber", "BusNumber", "SeatNumber")
+
+FARE_MULTIPLIERS = {"SingleTicket": 1, "MonthlyPass": 10}
+
+TICKET_TYPES = tuple(FARE_MULTIPLIERS)
+
+
+ChangeEvent = namedtuple("ChangeEvent", "table operation key row remote sold_at", defaults=(None,))
+
+
+class _BatchAborted(Exception):
+    pass
+
+
+class MigrationError(Exception):
+    pass
+
+
+class VersionConflict(Exception):
+    def __init__(self, table, key, current):
+        if current is None:
+            message = f"{table} {key} was deleted by another station"
+        else:
+            message = f"{table} {key} was changed by another station"
+        super().__init__(message)
+        self.table = table
+        self.key = key
+        self.current = current
+
+
+def retry_on_conflict(operation, attempts=3, delay=0.05):
+    for attempt in range(attempts):
+        try:
+            return operation()
+        except VersionConflict:
+            if attempt == attempts - 1:
+                raise
+            time.sleep(delay * (2 ** attempt))
+
 
 class DatabaseManager:
-    def __init__(self, host="localhost", user="root", password="root", database="busline_prisezone"):
+    def __init__(self, host="localhost", user="root", password="root", database="busline_prisezone",
+                 pool_min_size=1, pool_max_size=5, pool_timeout=30, max_pending_requests=32, cache_ttl=300,
+                 seed_sample_data=False, backend=None, interactive=True, slow_query_threshold=0.5,
+                 offline_journal=None):
+        if backend is None:
+            backend = MySQLBackend(host=host, user=user, password=password, database=database)
+        self.backend = backend
+        if backend.max_connections:
+            pool_max_size = min(pool_max_size, backend.max_connections)
+            pool_min_size = min(pool_min_size, pool_max_size)
+        self.metrics = QueryMetrics(slow_query_threshold)
+        self._local = threading.local()
+        self._pinned = {}
+        self._pinned_lock = threading.Lock()
+        self.seats = SeatIndex(self)
+        self.cache = ReferenceCache(self, ttl=cache_ttl)
+        self.reports = SalesReports(self)
+        self.ticket_numbers = TicketNumberAllocator(self)
+        self.passenger_search = PassengerSearchIndex(self)
+        self.routes = RouteGraph(self)
+        self.fares = FareMatrix(self)
+        self.tickets = TicketStore(self, since=start_of_day)
+        self.offline = OfflineSalesJournal(offline_journal) if offline_journal else None
+        self._offline_since = None
+        self._syncer = None
+        self._stop_sync = threading.Event()
+        self.station_id = uuid.uuid4().hex
+        self._subscribers = [self.passenger_search.apply, self.fares.apply, self.tickets.apply]
+        self._last_change_id = None
+        self._seen_changes = deque(maxlen=1000)
+        self._poller = None
+        self._stop_polling = threading.Event()
+        self.executor = DatabaseExecutor(max_workers=pool_max_size, max_pending=max_pending_requests)
+        try:
+            self.pool = ConnectionPool(
+                backend.connect,
+                backend.ping,
+                min_size=pool_min_size,
+                max_size=pool_max_size,
+                timeout=pool_timeout
+            )
+            self.bootstrap(seed_sample_data)
+        except backend.Error as err:
+            if interactive:
+                messagebox.showerror("Database Connection Error", f"Failed to connect to {backend.describe()}: {err}")
+            raise
+
+    @contextmanager
+    def transaction(self, write=True):
+        conn = getattr(self._local, 'tx_conn', None)
+        if conn is not None:
+            cursor = InstrumentedCursor(self.backend.cursor(conn), self.metrics)
+            try:
+                yield cursor
+            finally:
+                cursor.close()
+            return
+
+        conn = self.pool.acquire()
+        self._local.tx_conn = conn
+        self._local.pending_events = []
+        broken = False
+        try:
+            self.backend.begin(conn, write)
+            cursor = InstrumentedCursor(self.backend.cursor(conn), self.metrics)
+        except Exception:
+            self._local.tx_conn = None
+            self.pool.release(conn, discard=True)
+            raise
+        try:
+            yield cursor
+            conn.commit()
+            events = self._local.pending_events
+        except Exception:
+            try:
+                conn.rollback()
+            except Exception:
+                broken = True
+            raise
+        finally:
+            try:
+                cursor.close()
+            except Exception:
+                broken = True
+            self._local.tx_conn = None
+            self._local.pending_events = []
+            self.pool.release(conn, discard=broken)
+
+        for event in events:
+            self._publish(event)
+
+    def _log_error(self, message):
+        self.metrics.count_error()
+        logger.error(message)
+
+    def is_connection_error(self, error):
+        return isinstance(error, PoolError) or self.backend.is_connection_error(error)
+
+    @property
+    def is_offline(self):
+        return self._offline_since is not None
+
+    def go_offline(self, error):
+        if self._offline_since is None:
+            self._offline_since = time.monotonic()
+            logger.warning("Lost the connection to %s, queueing sales in %s: %s",
+                           self.backend.describe(), self.offline.path, error)
+
+    def _queues_sales(self):
+        return self.offline is not None and (self.is_offline or self.offline.count() > 0)
+
+    def _queue_sales(self, rows, failures, atomic=False):
+        queued = []
+        for index, row in rows:
+            if self.seats.is_known_taken(row[6], row[7]):
+                failures.append((index, row[0], f"Seat {row[7]} on bus {row[6]} is not available"))
+            else:
+                queued.append((index, row))
+        if atomic and failures:
+            return [], sorted(failures)
+        # The fare is fixed when the sale is made, not when the journal is synced.
+        inserted, rejected = self.offline.append([(index, row + (self._queued_fare(row[1], row[3]),)) for index, row in queued],
+                                                 datetime.now(), atomic)
+        failures.extend(rejected)
+        inserted_numbers = set(inserted)
+        for _, row in queued:
+            if row[0] in inserted_numbers:
+                self.seats.occupy(row[6], row[7])
+        return inserted, sorted(failures)
+
+    def _queued_fare(self, ticket_type, zone_id):
+        # Without any cached zone prices the fare is left open and priced when the sale is synced.
+        try:
+            return self.reports.fare(ticket_type, zone_id)
+        except Exception as e:
+            if not self.is_connection_error(e):
+                raise
+            return None
+
+    def subscribe(self, callback):
+        self._subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        if callback in self._subscribers:
+            self._subscribers.remove(callback)
+
+    def _publish(self, event):
+        for callback in list(self._subscribers):
+            try:
+                callback(event)
+            except Exception as e:
+                self._log_error(f"Error delivering change event: {e}")
+
+    def _record_changes(self, cursor, table, operation, rows, scopes=None, sold_at=None):
+        now = datetime.now()
+        cursor.executemany('''
+        INSERT INTO ChangeLog (TableName, Operation, RowKey, Scope, Origin, ChangedAt)
+        VALUES (%s, %s, %s, %s, %s, %s)
+        ''', [(table, operation, str(key) if key is not None else None, scopes[i] if scopes else None, self.station_id, now)
+              for i, (key, _) in enumerate(rows)])
+        self._local.pending_events.extend(
+            ChangeEvent(table, operation, key, row, False, sold_at[i] if sold_at else None)
+            for i, (key, row) in enumerate(rows)
+        )
+
+    def _record_change(self, cursor, table, operation, key, row=None, scope=None, sold_at=None):
+        self._record_changes(cursor, table, operation, [(key, row)], [scope] if scope else None,
+                             [sold_at] if sold_at else None)
+
+    @timed_operation
+    def poll_changes(self, limit=1000, overlap=100):
+        with self.transaction(write=False) as cursor:
+            if self._last_change_id is None:
+                cursor.execute("SELECT MAX(ChangeID) FROM ChangeLog")
+                self._last_change_id = cursor.fetchone()[0] or 0
+                # Everything committed so far is already reflected in what this station loads,
+                # so mark the overlap window as seen instead of replaying it on the next poll.
+                cursor.execute("SELECT ChangeID FROM ChangeLog WHERE ChangeID > %s AND ChangeID <= %s",
+                               (max(self._last_change_id - overlap, 0), self._last_change_id))
+                self._seen_changes.extend(row[0] for row in cursor.fetchall())
+                return 0
+            # Re-read a small window below the high-water mark: auto-increment ids can
+            # become visible out of order when concurrent transactions commit.
+            cursor.execute('''
+            SELECT ChangeID, TableName, Operation, RowKey, Scope FROM ChangeLog
+            WHERE ChangeID > %s AND Origin <> %s
+            ORDER BY ChangeID
+            LIMIT %s
+            ''', (max(self._last_change_id - overlap, 0), self.station_id, limit))
+            changes = [change for change in cursor.fetchall() if change[0] not in self._seen_changes]
+
+        for change_id, table, operation, key, scope in changes:
+            self._seen_changes.append(change_id)
+            self._last_change_id = max(self._last_change_id, change_id)
+            self._publish(self._apply_remote_change(table, operation, key, scope))
+        return len(changes)
+
+    def _apply_remote_change(self, table, operation, key, scope):
+        row = None
+        sold_at = None
+        if table == "Passenger":
+            if operation == "delete":
+                self.cache.remove("Passenger", key)
+            else:
+                with self.transaction(write=False) as cursor:
+                    cursor.execute("SELECT PassengerID, PassengerName FROM Passenger WHERE PassengerID = %s", (key,))
+                    row = cursor.fetchone()
+                if row:
+                    self.cache.put("Passenger", row)
+        elif table == "Ticket":
+            for bus_number in (scope or "").split(","):
+                if bus_number:
+                    self.seats.reload(bus_number)
+            if operation != "delete":
+                with self.transaction(write=False) as cursor:
+                    cursor.execute(f"SELECT {', '.join(TICKET_COLUMNS)}, SoldAt FROM Ticket WHERE TicketNumber = %s", (key,))
+                    found = cursor.fetchone()
+                if found:
+                    row, sold_at = tuple(found[:-1]), found[-1]
+        elif table == "Zone":
+            with self.transaction(write=False) as cursor:
+                cursor.execute("SELECT ZoneID, Price FROM Zone WHERE ZoneID = %s", (key,))
+                row = cursor.fetchone()
+            if row:
+                self.cache.put("Zone", row)
+        elif table == "Station":
+            with self.transaction(write=False) as cursor:
+                cursor.execute("SELECT StationNumber, StationName, BusLineID, ZoneID FROM Station WHERE StationNumber = %s",
+                               (key,))
+                row = cursor.fetchone()
+            if row:
+                self.cache.put("Station", row)
+        elif operation == "reload":
+            self.seats.invalidate()
+            self.cache.invalidate()
+        return ChangeEvent(table, operation, key, row, True, sold_at)
+
+    def start_change_polling(self, interval=2.0, prune_after=86400):
+        if self._poller is not None:
+            return
+        self._stop_polling.clear()
+
+        def run():
+            last_prune = time.monotonic()
+            while not self._stop_polling.wait(interval):
+                try:
+                    self.poll_changes()
+                    if time.monotonic() - last_prune > 3600:
+                        self.prune_change_log(prune_after)
+                        last_prune = time.monotonic()
+                except Exception as e:
+                    self._log_error(f"Error polling changes: {e}")
+
+        self._poller = threading.Thread(target=run, name="change-poller", daemon=True)
+        self._poller.start()
+
+    def stop_change_polling(self):
+        if self._poller is not None:
+            self._stop_polling.set()
+            self._poller.join(timeout=5)
+            self._poller = None
+
+    @timed_operation
+    def prune_change_log(self, max_age=86400):
+        with self.transaction() as cursor:
+            cursor.execute("DELETE FROM ChangeLog WHERE ChangedAt < %s",
+                           (datetime.fromtimestamp(time.time() - max_age),))
+
+    @timed_operation
+    def sync_offline_sales(self, batch_size=500, chunk_size=100):
+        if self.offline is None:
+            return 0
+        synced = 0
+        while True:
+            batch = self.offline.pending(batch_size)
+            if not batch:
+                if self.is_offline:
+                    with self.transaction(write=False) as cursor:
+                        cursor.execute("SELECT 1")
+                break
+            done, failed = self._replay_sales(batch, chunk_size)
+            self.offline.complete(done, failed)
+            synced += len(done)
+            if failed:
+                sales = {sale[0]: sale for sale in batch}
+                for seq, message in failed:
+                    self._log_error(f"Offline sale {sales[seq][1]} was rejected by the central database: {message}")
+                for bus_number in {sales[seq][7] for seq, _ in failed}:
+                    self.seats.reload(bus_number)
+            if len(batch) < batch_size:
+                break
+        if self.is_offline:
+            self._offline_since = None
+            logger.warning("Connection to %s restored, %d offline sales synced", self.backend.describe(), synced)
+        return synced
+
+    def _replay_sales(self, batch, chunk_size):
+        # The ticket number is the idempotency key: a sale that reached the central
+        # database before its journal entry was cleared is acknowledged, not inserted twice.
+        sales = {sale[1]: sale for sale in batch}
+        done = []
+        failed = []
+        with self.transaction() as cursor:
+            cursor.execute(f"SELECT {', '.join(TICKET_COLUMNS)} FROM Ticket WHERE TicketNumber IN ({', '.join(['%s'] * len(sales))})",
+                           list(sales))
+            existing = {row[0]: row for row in cursor.fetchall()}
+            rows = []
+            for sale in batch:
+                current = existing.get(sale[1])
+                if current is None:
+                    fare = self.reports.fare(sale[2], sale[4]) if sale[10] is None else Decimal(sale[10])
+                    rows.append((sale[0], tuple(sale[1:10]) + (fare,)))
+                elif [str(value) for value in current] == [str(value) for value in sale[1:9]]:
+                    done.append(sale[0])
+                else:
+                    failed.append((sale[0], f"Ticket number {sale[1]} is already used by another sale"))
+
+            for start in range(0, len(rows), chunk_size):
+                chunk = rows[start:start + chunk_size]
+                ok, errors = self._insert_ticket_chunk(cursor, chunk)
+                if ok:
+                    ok_numbers = set(ok)
+                    written = [row for _, row in chunk if row[0] in ok_numbers]
+                    self.reports.apply(cursor, added=[(row[1], row[2], row[3], row[8], row[9]) for row in written])
+                    self._record_changes(cursor, "Ticket", "insert", [(row[0], row[:8]) for row in written],
+                                         [row[6] for row in written], [row[8] for row in written])
+                done.extend(sales[number][0] for number in ok)
+                failed.extend((seq, message) for seq, _, message in errors)
+        return done, failed
+
+    def start_offline_sync(self, interval=5.0, batch_size=500):
+        if self.offline is None or self._syncer is not None:
+            return
+        self._stop_sync.clear()
+
+        def run():
+            while True:
+                try:
+                    self.sync_offline_sales(batch_size)
+                except Exception as e:
+                    if self.is_connection_error(e):
+                        self.go_offline(e)
+                    else:
+                        self._log_error(f"Error syncing offline sales: {e}")
+                if self._stop_sync.wait(interval):
+                    break
+
+        self._syncer = threading.Thread(target=run, name="offline-sync", daemon=True)
+        self._syncer.start()
+
+    def stop_offline_sync(self):
+        if self._syncer is not None:
+            self._stop_sync.set()
+            self._syncer.join(timeout=5)
+            self._syncer = None
+
+    @timed_operation
+    def pending_offline_sales(self):
+        return self.offline.count() if self.offline is not None else 0
+
+    @timed_operation
+    def failed_offline_sales(self):
+        return self.offline.failed() if self.offline is not None else []
+
+    @property
+    def conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self.pool.acquire()
+            self._local.conn = conn
+            with self._pinned_lock:
+                self._pinned[threading.get_ident()] = conn
+        return conn
+
+    @property
+    def cursor(self):
+        cursor = getattr(self._local, 'cursor', None)
+        if cursor is None:
+            cursor = InstrumentedCursor(self.backend.cursor(self.conn), self.metrics)
+            self._local.cursor = cursor
+        return cursor
+
+    def full_scans(self, query, params=()):
+        with self.transaction(write=False) as cursor:
+            return self.backend.full_scans(cursor, query, params)
+
+    @timed_operation
+    def schema_version(self):
+        with self.transaction(write=False) as cursor:
+            try:
+                cursor.execute("SELECT MAX(Version) FROM SchemaVersion")
+            except self.backend.Error:
+                return 0
+            row = cursor.fetchone()
+            return (row[0] or 0) if row else 0
+
+    def bootstrap(self, seed_sample_data=False):
+        if self.schema_version() < SCHEMA_VERSION:
+            self.migrate()
+        if seed_sample_data:
+            self.insert_sample_data()
+
+    @timed_operation
+    def migrate(self):
+        with self.transaction() as cursor:
+            cursor.execute('''
+            CREATE TABLE IF NOT EXISTS SchemaVersion (
+                Version INT PRIMARY KEY,
+                AppliedAt DATETIME
+            )
+            ''')
+
+        for version, steps in SCHEMA_MIGRATIONS:
+            if version <= self.schema_version():
+                continue
+            try:
+                with self.transaction() as cursor:
+                    for step in steps:
+                        if callable(step):
+                            step(cursor, self.backend)
+                        else:
+                            cursor.execute(step)
+                    cursor.execute(
+                        "INSERT INTO SchemaVersion (Version, AppliedAt) VALUES (%s, %s)",
+                        (version, datetime.now())
+                    )
+            except Exception:
+                # Another station may have applied the same migration concurrently.
+                if self.schema_version() < version:
+                    raise
+
+    @timed_operation
+    def insert_sample_data(self):
+        with self.transaction() as cursor:
+            cursor.execute("DELETE FROM Ticket")
+            cursor.execute("DELETE FROM Passenger")
+            cursor.execute("DELETE FROM Zone")
+            cursor.execute("DELETE FROM Crew")
+            cursor.execute("DELETE FROM Bus")
+            cursor.execute("DELETE FROM Station")
+            cursor.execute("DELETE FROM BusLine")
+            cursor.execute("DELETE FROM Company")
+
+            cursor.execute('''
+            INSERT INTO Company (CompanyName, VAT) 
+            VALUES ('Metro Transit', 'MT123456789')
+            ''')
+        
+            bus_lines = [
+                (1, 'Downtown to North End', 'Red Line', 15.5, 'Metro Transit', 50, 2, 1),
+                (2, 'Airport to South Side', 'Blue Line', 18.2, 'Metro Transit', 40, 2, 1),
+                (3, 'East to West', 'Green Line', 12.8, 'Metro Transit', 60, 2, 1)
+            ]
+            cursor.executemany('''
+            INSERT INTO BusLine (BusLineID, Route, BusLineName, Length, CompanyName, AmountOfSeats, AmountOfCrew, OnWay)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+            ''', bus_lines)
+        
+            stations = [
+                (1, 'Downtown Central', 1, 1),
+                (2, 'North End Terminal', 1, 3),
+                (3, 'Airport Terminal', 2, 3),
+                (4, 'South Side Station', 2, 2),
+                (5, 'East Terminal', 3, 2),
+                (6, 'West Terminal', 3, 2)
+            ]
+            cursor.executemany('''
+            INSERT INTO Station (StationNumber, StationName, BusLineID, ZoneID)
+            VALUES (%s, %s, %s, %s)
+            ''', stations)
+        
+            buses = [
+                ('B001', 1, 50, 2, 1),
+                ('B002', 2, 40, 2, 1),
+                ('B003', 3, 60, 2, 1)
+            ]
+            cursor.executemany('''
+            INSERT INTO Bus (BusNumber, BusLineID, AmountOfSeats, AmountOfCrew, OnWay)
+            VALUES (%s, %s, %s, %s, %s)
+            ''', buses)
+        
+            crew_members = [
+                (1, 'Driver', 'John Smith', 'B001'),
+                (2, 'Attendant', 'Mary Johnson', 'B001'),
+                (3, 'Driver', 'James Brown', 'B002'),
+                (4, 'Attendant', 'Sarah Davis', 'B002'),
+                (5, 'Driver', 'Michael Wilson', 'B003'),
+                (6, 'Attendant', 'Lisa Thompson', 'B003')
+            ]
+            cursor.executemany('''
+            INSERT INTO Crew (CrewID, CrewRole, CrewName, BusNumber)
+            VALUES (%s, %s, %s, %s)
+            ''', crew_members)
+        
+            zones = [
+                (1, 2.50),
+                (2, 3.75),
+                (3, 5.00)
+            ]
+            cursor.executemany('''
+            INSERT INTO Zone (ZoneID, Price)
+            VALUES (%s, %s)
+            ''', zones)
+        
+            passengers = [
+                ('P001', 'John Doe'),
+                ('P002', 'Jane Smith'),
+                ('P003', 'Robert Johnson')
+            ]
+            cursor.executemany('''
+            INSERT INTO Passenger (PassengerID, PassengerName)
+            VALUES (%s, %s)
+            ''', passengers)
+
+            tickets = [
+                ('T001', 'SingleTicket', 1, 10, 'P001', 1, 1, 'B001'),
+                ('T002', 'MonthlyPass', 2, 15, 'P002', 1, 1, 'B001'),
+                ('T003', 'SingleTicket', 3, 20, 'P003', 2, 3, 'B002'),
+                ('T004', 'SingleTicket', 1, 25, 'P001', 2, 4, 'B002'),
+                ('T005', 'MonthlyPass', 2, 30, 'P002', 3, 5, 'B003'),
+                ('T006', 'SingleTicket', 3, 5, 'P003', 3, 6, 'B003'),
+                ('T007', 'SingleTicket', 1, 12, 'P001', 1, 2, 'B001'),
+                ('T008', 'MonthlyPass', 2, 18, 'P002', 2, 3, 'B002'),
+                ('T009', 'SingleTicket', 3, 22, 'P003', 3, 5, 'B003'),
+                ('T010', 'SingleTicket', 1, 28, 'P001', 1, 1, 'B001'),
+                ('T011', 'MonthlyPass', 2, 8, 'P002', 2, 4, 'B002'),
+                ('T012', 'SingleTicket', 3, 14, 'P003', 3, 6, 'B003'),
+                ('T013', 'SingleTicket', 1, 16, 'P001', 1, 1, 'B001'),
+                ('T014', 'MonthlyPass', 2, 21, 'P002', 2, 3, 'B002'),
+                ('T015', 'SingleTicket', 3, 27, 'P003', 3, 5, 'B003')
+            ]
+            sold_at = datetime.now()
+            cursor.executemany('''
+            INSERT INTO Ticket (TicketNumber, TicketType, ZoneID, SeatNumber, PassengerID, BusLineID, StationNumber, BusNumber, SoldAt)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+            ''', [ticket + (sold_at,) for ticket in tickets])
+
+            rebuild_sales_summary(cursor)
+            self._record_change(cursor, "*", "reload", None)
+
+        self.seats.invalidate()
+        self.cache.invalidate()
+
+    @timed_operation
+    def get_all_passengers(self):
+        return self.cache.rows("Passenger")
+
+    @timed_operation
+    def search_passengers(self, text, limit=20):
+        return self.passenger_search.search(text, limit)
+
+    @timed_operation
+    def get_passenger(self, passenger_id):
+        return self.cache.get("Passenger", passenger_id)
+
+    @timed_operation
+    def create_passenger(self, passenger_id, passenger_name):
+        try:
+            with self.transaction() as cursor:
+                cursor.execute('''
+                INSERT INTO Passenger (PassengerID, PassengerName)
+                VALUES (%s, %s)
+                ''', (passenger_id, passenger_name))
+                self._record_change(cursor, "Passenger", "insert", passenger_id, (passenger_id, passenger_name))
+            self.cache.put("Passenger", (passenger_id, passenger_name))
+            return passenger_id
+        except Exception as e:
+            self._log_error(f"Error creating passenger: {e}")
+            return None
+
+    @timed_operation
+    def insert_passengers_bulk(self, passengers, chunk_size=500, raise_connection_errors=False):
+        rows = []
+        failures = []
+        seen = set()
+        for index, passenger in enumerate(passengers):
+            passenger = tuple(passenger)
+            passenger_id = passenger[0] if passenger else None
+            if len(passenger) != 2:
+                failures.append((index, passenger_id, f"Expected 2 fields, got {len(passenger)}"))
+                continue
+            passenger_id, passenger_name = (str(value).strip() if value is not None else "" for value in passenger)
+            if not passenger_id or not passenger_name:
+                failures.append((index, passenger_id, "All fields are required"))
+                continue
+            if passenger_id in seen:
+                failures.append((index, passenger_id, "Duplicate passenger ID in batch"))
+                continue
+            seen.add(passenger_id)
+            rows.append((index, (passenger_id, passenger_name)))
+
+        inserted = []
+        try:
+            with self.transaction() as cursor:
+                for start in range(0, len(rows), chunk_size):
+                    chunk = rows[start:start + chunk_size]
+                    cursor.execute(
+                        f"SELECT PassengerID FROM Passenger WHERE PassengerID IN ({', '.join(['%s'] * len(chunk))})",
+                        [row[0] for _, row in chunk]
+                    )
+                    taken = {row[0] for row in cursor.fetchall()}
+                    failures.extend((index, row[0], "Passenger ID already exists") for index, row in chunk if row[0] in taken)
+                    written = [row for _, row in chunk if row[0] not in taken]
+                    if not written:
+                        continue
+                    cursor.execute(
+                        f"INSERT INTO Passenger (PassengerID, PassengerName) VALUES {', '.join(['(%s, %s)'] * len(written))}",
+                        [value for row in written for value in row]
+                    )
+                    self._record_changes(cursor, "Passenger", "insert", [(row[0], row) for row in written])
+                    inserted.extend(written)
+        except Exception as e:
+            if raise_connection_errors and self.is_connection_error(e):
+                raise
+            self._log_error(f"Error inserting passenger batch: {e}")
+            failed = {failure[0] for failure in failures}
+            failures.extend((index, row[0], f"Error: {str(e)}") for index, row in rows if index not in failed)
+            return [], sorted(failures)
+
+        for row in inserted:
+            self.cache.put("Passenger", row)
+        return [row[0] for row in inserted], sorted(failures)
+
+    @timed_operation
+    def get_passengers_page(self, after=None, limit=100):
+        with self.transaction(write=False) as cursor:
+            if after is None:
+                cursor.execute("SELECT PassengerID, PassengerName FROM Passenger ORDER BY PassengerID LIMIT %s", (limit,))
+            else:
+                cursor.execute(
+                    "SELECT PassengerID, PassengerName FROM Passenger WHERE PassengerID > %s ORDER BY PassengerID LIMIT %s",
+                    (after, limit)
+                )
+            return cursor.fetchall()
+
+    @timed_operation
+    def get_versioned_passenger(self, passenger_id):
+        with self.transaction(write=False) as cursor:
+            cursor.execute("SELECT PassengerID, PassengerName, Version FROM Passenger WHERE PassengerID = %s",
+                           (passenger_id,))
+            return cursor.fetchone()
+
+    @timed_operation
+    def update_passenger(self, passenger_id, passenger_name, expected_version=None):
+        try:
+            with self.transaction() as cursor:
+                if expected_version is None:
+                    cursor.execute('''
+                    UPDATE Passenger
+                    SET PassengerName = %s, Version = Version + 1
+                    WHERE PassengerID = %s
+                    ''', (passenger_name, passenger_id))
+                    if cursor.rowcount == 0:
+                        return False
+                else:
+                    cursor.execute('''
+                    UPDATE Passenger
+                    SET PassengerName = %s, Version = Version + 1
+                    WHERE PassengerID = %s AND Version = %s
+                    ''', (passenger_name, passenger_id, expected_version))
+                    if cursor.rowcount == 0:
+                        cursor.execute("SELECT PassengerID, PassengerName, Version FROM Passenger WHERE PassengerID = %s",
+                                       (passenger_id,))
+                        raise VersionConflict("Passenger", passenger_id, cursor.fetchone())
+                self._record_change(cursor, "Passenger", "update", passenger_id, (passenger_id, passenger_name))
+            self.cache.put("Passenger", (passenger_id, passenger_name))
+            return True
+        except VersionConflict as e:
+            logger.warning(str(e))
+            raise
+        except Exception as e:
+            self._log_error(f"Error updating passenger: {e}")
+            return False
+
+    @timed_operation
+    def delete_passenger(self, passenger_id):
+        try:
+            with self.transaction() as cursor:
+                cursor.execute("SELECT COUNT(*) FROM Ticket WHERE PassengerID = %s", (passenger_id,))
+                if cursor.fetchone()[0] > 0:
+                    return False, "Cannot delete passenger with existing tickets"
+
+                cursor.execute("DELETE FROM Passenger WHERE PassengerID = %s", (passenger_id,))
+                self._record_change(cursor, "Passenger", "delete", passenger_id)
+            self.cache.remove("Passenger", passenger_id)
+            return True, "Passenger deleted successfully"
+        except Exception as e:
+            self._log_error(f"Error deleting passenger: {e}")
+            return False, f"Error: {str(e)}"
+
+    @timed_operation
+    def get_all_bus_lines(self):
+        return [(row[0], row[1]) for row in self.cache.rows("BusLine")]
+
+    @timed_operation
+    def get_all_zones(self):
+        return [(row[0], f"Zone {row[0]} - ${row[1]}") for row in self.cache.rows("Zone")]
+
+    @timed_operation
+    def get_all_stations(self):
+        return [(row[0], row[1]) for row in self.cache.rows("Station")]
+
+    @timed_operation
+    def get_all_buses(self):
+        return [(row[0], row[1]) for row in self.cache.rows("Bus")]
+
+    @timed_operation
+    def get_line_stations(self, bus_line_id):
+        return self.routes.stations(bus_line_id)
+
+    @timed_operation
+    def get_line_buses(self, bus_line_id):
+        return self.routes.buses(bus_line_id)
+
+    @timed_operation
+    def plan_journey(self, origin_station, destination_station):
+        return self.routes.plan(origin_station, destination_station)
+
+    @timed_operation
+    def get_bus_line_name(self, bus_line_id):
+        result = self.cache.get("BusLine", bus_line_id)
+        return result[1] if result else ""
+
+    @timed_operation
+    def get_zone_price(self, zone_id):
+        result = self.cache.get("Zone", zone_id)
+        return result[1] if result else ""
+
+    @timed_operation
+    def update_zone_price(self, zone_id, price):
+        try:
+            price = Decimal(str(price)).quantize(Decimal("0.01"))
+            with self.transaction() as cursor:
+                cursor.execute("UPDATE Zone SET Price = %s WHERE ZoneID = %s", (price, zone_id))
+                if cursor.rowcount == 0:
+                    return False
+                self._record_change(cursor, "Zone", "update", zone_id, (int(zone_id), price))
+            self.cache.put("Zone", (int(zone_id), price))
+            return True
+        except Exception as e:
+            self._log_error(f"Error updating zone price: {e}")
+            return False
+
+    @timed_operation
+    def set_station_zone(self, station_number, zone_id):
+        try:
+            if zone_id is not None and self.cache.get("Zone", zone_id) is None:
+                self._log_error(f"Error setting station zone: unknown zone {zone_id}")
+                return False
+            with self.transaction() as cursor:
+                cursor.execute("SELECT StationNumber, StationName, BusLineID FROM Station WHERE StationNumber = %s",
+                               (station_number,))
+                current = cursor.fetchone()
+                if current is None:
+                    return False
+                cursor.execute("UPDATE Station SET ZoneID = %s WHERE StationNumber = %s", (zone_id, station_number))
+                row = tuple(current) + (None if zone_id is None else int(zone_id),)
+                self._record_change(cursor, "Station", "update", station_number, row)
+            self.cache.put("Station", row)
+            return True
+        except Exception as e:
+            self._log_error(f"Error setting station zone: {e}")
+            return False
+
+    @timed_operation
+    def quote_fare(self, origin_station, destination_station, ticket_type):
+        return self.fares.quote(origin_station, destination_station, ticket_type)
+
+    @timed_operation
+    def get_passenger_name(self, passenger_id):
+        result = self.cache.get("Passenger", passenger_id)
+        return result[1] if result else ""
+
+    @timed_operation
+    def get_station_name(self, station_number):
+        result = self.cache.get("Station", station_number)
+        return result[1] if result else ""
+
+    @timed_operation
+    def get_bus_line_id(self, bus_number):
+        result = self.cache.get("Bus", bus_number)
+        return result[1] if result else ""
+
+    @timed_operation
+    def is_seat_free(self, bus_number, seat_number):
+        return self.seats.is_free(bus_number, int(seat_number))
+
+    @timed_operation
+    def next_free_seat(self, bus_number, start=1):
+        return self.seats.next_free(bus_number, int(start))
+
+    @timed_operation
+    def find_free_seats(self, bus_number, count, start=1):
+        return self.seats.find_free(bus_number, int(count), int(start))
+
+    @timed_operation
+    def insert_ticket(self, ticket_number, ticket_type, bus_line_id, zone_id, passenger_id, station_number, bus_number, seat_number):
+        try:
+            seat_number = int(seat_number)
+            if self._queues_sales():
+                return self._queue_ticket(ticket_number, ticket_type, bus_line_id, zone_id, passenger_id,
+                                          station_number, bus_number, seat_number)
+            if not self.seats.is_free(bus_number, seat_number):
+                self._log_error(f"Error inserting ticket: seat {seat_number} on bus {bus_number} is not available")
+                return None
+            sold_at = datetime.now()
+            fare = self.reports.fare(ticket_type, zone_id)
+            with self.transaction() as cursor:
+                cursor.execute('''
+                INSERT INTO Ticket (TicketNumber, TicketType, BusLineID, ZoneID, PassengerID, StationNumber, BusNumber, SeatNumber, SoldAt, Fare)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                ''', (ticket_number, ticket_type, bus_line_id, zone_id, passenger_id, station_number, bus_number, seat_number, sold_at, fare))
+                self.reports.apply(cursor, added=[(ticket_type, bus_line_id, zone_id, sold_at, fare)])
+                self._record_change(cursor, "Ticket", "insert", ticket_number,
+                                    (ticket_number, ticket_type, bus_line_id, zone_id, passenger_id, station_number, bus_number, seat_number),
+                                    bus_number, sold_at)
+            self.seats.occupy(bus_number, seat_number)
+            return ticket_number
+        except self.backend.IntegrityError as e:
+            self._log_error(f"Error inserting ticket: {e}")
+            self.seats.reload(bus_number)
+            return None
+        except Exception as e:
+            if self.offline is not None and self.is_connection_error(e):
+                self.go_offline(e)
+                return self._queue_ticket(ticket_number, ticket_type, bus_line_id, zone_id, passenger_id,
+                                          station_number, bus_number, seat_number)
+            self._log_error(f"Error inserting ticket: {e}")
+            return None
+
+    def _queue_ticket(self, *ticket):
+        inserted, failures = self._queue_sales(*self._validate_ticket_batch([ticket]), atomic=True)
+        for _, _, message in failures:
+            self._log_error(f"Error queueing ticket: {message}")
+        return inserted[0] if inserted else None
+
+    @timed_operation
+    def insert_tickets_bulk(self, tickets, chunk_size=100, atomic=False, raise_connection_errors=False):
+        rows, failures = self._validate_ticket_batch(tickets)
+        if atomic and failures:
+            return [], failures
+        if self._queues_sales() and not raise_connection_errors:
+            return self._queue_sales(rows, failures, atomic)
+
+        inserted = []
         try:
-            self.conn = mysql.connector.connect(
-                host=host,
-                user=user,
-                password=password,
-                database=database
+            with self.transaction() as cursor:
+                rows, rejected = self._check_ticket_references(cursor, rows)
+                failures.extend(rejected)
+                if atomic and failures:
+                    return [], sorted(failures)
+
+                for start in range(0, len(rows), chunk_size):
+                    sold_at = datetime.now()
+                    chunk = [(index, row + (sold_at, self.reports.fare(row[1], row[3])))
+                             for index, row in rows[start:start + chunk_size]]
+                    ok, failed = self._insert_ticket_chunk(cursor, chunk)
+                    if ok:
+                        ok_numbers = set(ok)
+                        written = [row for _, row in chunk if row[0] in ok_numbers]
+                        self.reports.apply(cursor, added=[(row[1], row[2], row[3], row[8], row[9]) for row in written])
+                        self._record_changes(cursor, "Ticket", "insert", [(row[0], row[:8]) for row in written],
+                                             [row[6] for row in written], [row[8] for row in written])
+                    inserted.extend(ok)
+                    failures.extend(failed)
+                    if atomic and failed:
+                        raise _BatchAborted()
+        except _BatchAborted:
+            return [], sorted(failures)
+        except Exception as e:
+            if raise_connection_errors and self.is_connection_error(e):
+                raise
+            if self.offline is not None and self.is_connection_error(e):
+                self.go_offline(e)
+                failed = {failure[0] for failure in failures}
+                return self._queue_sales([(index, row) for index, row in rows if index not in failed], failures, atomic)
+            self._log_error(f"Error inserting ticket batch: {e}")
+            failed = {failure[0] for failure in failures}
+            failures.extend((index, row[0], f"Error: {str(e)}") for index, row in rows if index not in failed)
+            return [], sorted(failures)
+
+        inserted_numbers = set(inserted)
+        for _, row in rows:
+            if row[0] in inserted_numbers:
+                self.seats.occupy(row[6], row[7])
+        if len(inserted) < len(rows):
+            for bus_number in {row[6] for _, row in rows if row[0] not in inserted_numbers}:
+                self.seats.reload(bus_number)
+
+        return inserted, sorted(failures)
+
+    def _validate_ticket_batch(self, tickets):
+        rows = []
+        failures = []
+        seen = set()
+        for index, ticket in enumerate(tickets):
+            ticket = tuple(ticket)
+            ticket_number = ticket[0] if ticket else None
+            if len(ticket) != len(TICKET_COLUMNS):
+                failures.append((index, ticket_number, f"Expected {len(TICKET_COLUMNS)} fields, got {len(ticket)}"))
+                continue
+            ticket_number, ticket_type, bus_line_id, zone_id, passenger_id, station_number, bus_number, seat_number = (
+                str(value).strip() if value is not None else "" for value in ticket
             )
-            self.cursor = self.conn.cursor(buffered=True)
-            self.create_tables()
-        except mysql.connector.Error as err:
-            messagebox.showerror("Database Connection Error", f"Failed to connect to MySQL database: {err}")
+            if not all([ticket_number, ticket_type, bus_line_id, zone_id, passenger_id, station_number, bus_number, seat_number]):
+                failures.append((index, ticket_number, "All fields are required"))
+                continue
+            if ticket_type not in TICKET_TYPES:
+                failures.append((index, ticket_number, f"Unknown ticket type: {ticket_type}"))
+                continue
+            try:
+                bus_line_id, zone_id, station_number, seat_number = (
+                    int(bus_line_id), int(zone_id), int(station_number), int(seat_number)
+                )
+            except ValueError:
+                failures.append((index, ticket_number, "Bus line, zone, station and seat must be numbers"))
+                continue
+            if seat_number <= 0:
+                failures.append((index, ticket_number, "Seat number must be positive"))
+                continue
+            if ticket_number in seen:
+                failures.append((index, ticket_number, "Duplicate ticket number in batch"))
+                continue
+            seen.add(ticket_number)
+            rows.append((index, (ticket_number, ticket_type, bus_line_id, zone_id, passenger_id,
+                                 station_number, bus_number, seat_number)))
+        return rows, failures
+
+    def _check_ticket_references(self, cursor, rows):
+        if not rows:
+            return rows, []
+
+        def existing(sql, values):
+            found = set()
+            values = list(values)
+            for start in range(0, len(values), 500):
+                chunk = values[start:start + 500]
+                cursor.execute(sql % ", ".join(["%s"] * len(chunk)), chunk)
+                found.update(row[0] for row in cursor.fetchall())
+            return found
+
+        taken = existing("SELECT TicketNumber FROM Ticket WHERE TicketNumber IN (%s)", {r[0] for _, r in rows})
+        bus_lines = existing("SELECT BusLineID FROM BusLine WHERE BusLineID IN (%s)", {r[2] for _, r in rows})
+        zones = existing("SELECT ZoneID FROM Zone WHERE ZoneID IN (%s)", {r[3] for _, r in rows})
+        passengers = existing("SELECT PassengerID FROM Passenger WHERE PassengerID IN (%s)", {r[4] for _, r in rows})
+        stations = existing("SELECT StationNumber FROM Station WHERE StationNumber IN (%s)", {r[5] for _, r in rows})
+        buses = existing("SELECT BusNumber FROM Bus WHERE BusNumber IN (%s)", {r[6] for _, r in rows})
+
+        valid = []
+        rejected = []
+        claimed = set()
+        for index, row in rows:
+            if row[0] in taken:
+                rejected.append((index, row[0], "Ticket number already exists"))
+            elif row[2] not in bus_lines:
+                rejected.append((index, row[0], f"Unknown bus line: {row[2]}"))
+            elif row[3] not in zones:
+                rejected.append((index, row[0], f"Unknown zone: {row[3]}"))
+            elif row[4] not in passengers:
+                rejected.append((index, row[0], f"Unknown passenger: {row[4]}"))
+            elif row[5] not in stations:
+                rejected.append((index, row[0], f"Unknown station: {row[5]}"))
+            elif row[6] not in buses:
+                rejected.append((index, row[0], f"Unknown bus: {row[6]}"))
+            elif (row[6], row[7]) in claimed or not self.seats.is_free(row[6], row[7]):
+                rejected.append((index, row[0], f"Seat {row[7]} on bus {row[6]} is not available"))
+            else:
+                claimed.add((row[6], row[7]))
+                valid.append((index, row))
+        return valid, rejected
+
+    def _insert_ticket_chunk(self, cursor, chunk):
+        # Rows are the ticket columns followed by SoldAt and Fare.
+        values = []
+        for _, row in chunk:
+            values.extend(row)
+        placeholders = ", ".join(["(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)"] * len(chunk))
+        cursor.execute("SAVEPOINT ticket_chunk")
+        try:
+            cursor.execute(f"INSERT INTO Ticket ({', '.join(TICKET_COLUMNS)}, SoldAt, Fare) VALUES {placeholders}", values)
+            cursor.execute("RELEASE SAVEPOINT ticket_chunk")
+            return [row[0] for _, row in chunk], []
+        except Exception:
+            cursor.execute("ROLLBACK TO SAVEPOINT ticket_chunk")
+
+        # Isolate the offending rows so the rest of the chunk still goes through.
+        inserted = []
+        failures = []
+        for index, row in chunk:
+            cursor.execute("SAVEPOINT ticket_row")
+            try:
+                cursor.execute(f"INSERT INTO Ticket ({', '.join(TICKET_COLUMNS)}, SoldAt, Fare) "
+                               f"VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)", row)
+                cursor.execute("RELEASE SAVEPOINT ticket_row")
+                inserted.append(row[0])
+            except Exception as e:
+                cursor.execute("ROLLBACK TO SAVEPOINT ticket_row")
+                failures.append((index, row[0], f"Error: {str(e)}"))
+        return inserted, failures
+
+    @timed_operation
+    def get_all_tickets(self):
+        with self.transaction(write=False) as cursor:
+            cursor.execute("""
+            SELECT TicketNumber, TicketType, BusLineID, ZoneID, PassengerID, StationNumber, BusNumber, SeatNumber 
+            FROM Ticket
+            """)
+            return cursor.fetchall()
+
+    @timed_operation
+    def find_tickets(self, order_by=None, descending=False, limit=None, **criteria):
+        return self.tickets.find(order_by, descending, limit, **criteria)
+
+    @timed_operation
+    def count_tickets(self):
+        # Every ticket write keeps SalesSummary current, so the per-type counters add up
+        # to the ticket count without scanning the table.
+        return sum(tickets for tickets, _ in self.reports.totals("ticket_type").values())
+
+    @timed_operation
+    def get_tickets_page(self, after=None, limit=100, inclusive=False):
+        with self.transaction(write=False) as cursor:
+            if after is None:
+                cursor.execute("""
+                SELECT TicketNumber, TicketType, BusLineID, ZoneID, PassengerID, StationNumber, BusNumber, SeatNumber 
+                FROM Ticket
+                ORDER BY TicketNumber
+                LIMIT %s
+                """, (limit,))
+            else:
+                cursor.execute(f"""
+                SELECT TicketNumber, TicketType, BusLineID, ZoneID, PassengerID, StationNumber, BusNumber, SeatNumber 
+                FROM Ticket
+                WHERE TicketNumber {'>=' if inclusive else '>'} %s
+                ORDER BY TicketNumber
+                LIMIT %s
+                """, (after, limit))
+            return cursor.fetchall()
+
+    @timed_operation
+    def get_tickets_page_before(self, before=None, limit=100):
+        with self.transaction(write=False) as cursor:
+            if before is None:
+                cursor.execute("""
+                SELECT TicketNumber, TicketType, BusLineID, ZoneID, PassengerID, StationNumber, BusNumber, SeatNumber 
+                FROM Ticket
+                ORDER BY TicketNumber DESC
+                LIMIT %s
+                """, (limit,))
+            else:
+                cursor.execute("""
+                SELECT TicketNumber, TicketType, BusLineID, ZoneID, PassengerID, StationNumber, BusNumber, SeatNumber 
+                FROM Ticket
+                WHERE TicketNumber < %s
+                ORDER BY TicketNumber DESC
+                LIMIT %s
+                """, (before, limit))
+            return cursor.fetchall()[::-1]
+
+    @timed_operation
+    def get_ticket_bookmarks(self, step=1000):
+        # Every step-th ticket number, so a position in the list can be reached with a keyed
+        # seek. Each bookmark skips step entries of the primary key index from the previous
+        # one, so the whole list costs a single pass over the index.
+        bookmarks = []
+        with self.transaction(write=False) as cursor:
+            cursor.execute("SELECT MIN(TicketNumber) FROM Ticket")
+            key = cursor.fetchone()[0]
+            while key is not None:
+                bookmarks.append(key)
+                cursor.execute("SELECT TicketNumber FROM Ticket WHERE TicketNumber > %s ORDER BY TicketNumber LIMIT 1 OFFSET %s",
+                               (key, step - 1))
+                row = cursor.fetchone()
+                key = row[0] if row else None
+        return bookmarks
+
+    @timed_operation
+    def get_ticket(self, ticket_number):
+        with self.transaction(write=False) as cursor:
+            cursor.execute("""
+            SELECT TicketNumber, TicketType, BusLineID, ZoneID, PassengerID, StationNumber, BusNumber, SeatNumber 
+            FROM Ticket 
+            WHERE TicketNumber = %s
+            """, (ticket_number,))
+            return cursor.fetchone()
+
+    @timed_operation
+    def get_versioned_ticket(self, ticket_number):
+        with self.transaction(write=False) as cursor:
+            return self._versioned_ticket(cursor, ticket_number)
+
+    @timed_operation
+    def update_ticket(self, ticket_number, ticket_type, bus_line_id, zone_id, passenger_id, station_number, bus_number, seat_number,
+                      expected_version=None):
+        try:
+            seat_number = int(seat_number)
+            with self.transaction() as cursor:
+                cursor.execute(
+                    "SELECT BusNumber, SeatNumber, TicketType, BusLineID, ZoneID, SoldAt, Version, Fare FROM Ticket WHERE TicketNumber = %s",
+                    (ticket_number,)
+                )
+                current = cursor.fetchone()
+                if expected_version is not None and (current is None or current[6] != int(expected_version)):
+                    raise VersionConflict("Ticket", ticket_number, self._versioned_ticket(cursor, ticket_number))
+                if current is None:
+                    return False
+                seat_changed = (current[0], current[1]) != (bus_number, seat_number)
+                if seat_changed and not self.seats.is_free(bus_number, seat_number):
+                    self._log_error(f"Error updating ticket: seat {seat_number} on bus {bus_number} is not available")
+                    return False
+                # A ticket keeps the fare it was sold at unless its type or zone changes.
+                fare = (current[7] if current[7] is not None and (current[2], current[4]) == (ticket_type, int(zone_id))
+                        else self.reports.fare(ticket_type, int(zone_id)))
+                # Compare-and-swap on the version read above, so the summary adjustment below
+                # always reverses the row this update actually replaced.
+                cursor.execute('''
+                UPDATE Ticket
+                SET TicketType = %s, BusLineID = %s, ZoneID = %s, PassengerID = %s, 
+                    StationNumber = %s, BusNumber = %s, SeatNumber = %s, Fare = %s, Version = Version + 1
+                WHERE TicketNumber = %s AND Version = %s
+                ''', (ticket_type, bus_line_id, zone_id, passenger_id, station_number, bus_number, seat_number, fare, ticket_number,
+                      current[6]))
+                if cursor.rowcount == 0:
+                    raise VersionConflict("Ticket", ticket_number, self._versioned_ticket(cursor, ticket_number))
+                self.reports.apply(cursor, added=[(ticket_type, int(bus_line_id), int(zone_id), current[5], fare)],
+                                   removed=[current[2:6] + (current[7],)])
+                buses = [bus_number] if current[0] == bus_number else [current[0], bus_number]
+                self._record_change(cursor, "Ticket", "update", ticket_number,
+                                    (ticket_number, ticket_type, bus_line_id, zone_id, passenger_id, station_number, bus_number, seat_number),
+                                    ",".join(buses), current[5])
+            if seat_changed:
+                self.seats.release(current[0], current[1])
+                self.seats.occupy(bus_number, seat_number)
+            return True
+        except VersionConflict as e:
+            logger.warning(str(e))
             raise
+        except self.backend.IntegrityError as e:
+            self._log_error(f"Error updating ticket: {e}")
+            self.seats.reload(bus_number)
+            return False
+        except Exception as e:
+            self._log_error(f"Error updating ticket: {e}")
+            return False
+
+    def _versioned_ticket(self, cursor, ticket_number):
+        cursor.execute("""
+        SELECT TicketNumber, TicketType, BusLineID, ZoneID, PassengerID, StationNumber, BusNumber, SeatNumber, Version
+        FROM Ticket
+        WHERE TicketNumber = %s
+        """, (ticket_number,))
+        return cursor.fetchone()
+
+    @timed_operation
+    def delete_ticket(self, ticket_number):
+        try:
+            with self.transaction() as cursor:
+                cursor.execute(
+                    "SELECT BusNumber, SeatNumber, TicketType, BusLineID, ZoneID, SoldAt, Fare FROM Ticket WHERE TicketNumber = %s",
+                    (ticket_number,)
+                )
+                current = cursor.fetchone()
+                cursor.execute("DELETE FROM Ticket WHERE TicketNumber = %s", (ticket_number,))
+                if current:
+                    self.reports.apply(cursor, removed=[current[2:]])
+                    self._record_change(cursor, "Ticket", "delete", ticket_number, scope=current[0])
+            if current:
+                self.seats.release(current[0], current[1])
+            return True, "Ticket deleted successfully"
+        except Exception as e:
+            self._log_error(f"Error deleting ticket: {e}")
+            return False, f"Error: {str(e)}"
+
+    def close(self):
+        self.stop_change_polling()
+        self.stop_offline_sync()
+        self.executor.shutdown()
+        with self._pinned_lock:
+            pinned = list(self._pinned.values())
+            self._pinned.clear()
+        for conn in pinned:
+            self.pool.release(conn)
+        self._local = threading.local()
+        if hasattr(self, 'pool') and self.pool:
+            self.pool.close()
+        if self.offline is not None:
+            self.offline.close()
+
+
+EXCHANGE_TABLES = {
+    "Ticket": (TICKET_COLUMNS, ("string", "string", "int64", "int64", "string", "int64", "string", "int64")),
+    "Passenger": (("PassengerID", "PassengerName"), ("string", "string")),
+}
+
+
+class DataExchange:
+    def __init__(self, db_manager, page_size=1000, chunk_size=1000, progress=None):
+        self.db = db_manager
+        self.page_size = page_size
+        self.chunk_size = chunk_size
+        self.progress = progress
+
+    def _format(self, path):
+        file_format = os.path.splitext(path)[1].lower().lstrip(".")
+        if file_format not in ("csv", "parquet"):
+            raise ValueError(f"Unsupported file format: {path}")
+        if file_format == "parquet" and pq is None:
+            raise ImportError("pyarrow is required for Parquet files")
+        return file_format
+
+    def _columns(self, table):
+        if table not in EXCHANGE_TABLES:
+            raise ValueError(f"Unsupported table: {table}")
+        return EXCHANGE_TABLES[table]
+
+    def _pages(self, table):
+        fetch = self.db.get_tickets_page if table == "Ticket" else self.db.get_passengers_page
+        after = None
+        while True:
+            rows = fetch(after=after, limit=self.page_size)
+            if rows:
+                yield rows
+            if len(rows) < self.page_size:
+                return
+            after = rows[-1][0]
+
+    def _report(self, table, rows):
+        if self.progress:
+            self.progress(table, rows)
+
+    def export_file(self, table, path):
+        columns, types = self._columns(table)
+        file_format = self._format(path)
+        exported = 0
+        temp_path = path + ".part"
+        if file_format == "csv":
+            with open(temp_path, "w", newline="", encoding="utf-8") as output:
+                writer = csv.writer(output)
+                writer.writerow(columns)
+                for rows in self._pages(table):
+                    writer.writerows(rows)
+                    exported += len(rows)
+                    self._report(table, exported)
+        else:
+            schema = pa.schema([(name, pa.type_for_alias(alias)) for name, alias in zip(columns, types)])
+            with pq.ParquetWriter(temp_path, schema) as writer:
+                for rows in self._pages(table):
+                    writer.write_table(pa.Table.from_arrays(
+                        [pa.array(values, type=field.type) for values, field in zip(zip(*rows), schema)],
+                        schema=schema
+                    ))
+                    exported += len(rows)
+                    self._report(table, exported)
+        os.replace(temp_path, path)
+        return exported
+
+    def _read_chunks(self, table, path):
+        columns, _ = self._columns(table)
+        if self._format(path) == "csv":
+            with open(path, newline="", encoding="utf-8") as source:
+                reader = csv.reader(source)
+                header = next(reader, None)
+                if header is None:
+                    return
+                if set(header) != set(columns):
+                    raise ValueError(f"Expected columns {', '.join(columns)}, got {', '.join(header)}")
+                order = [header.index(column) for column in columns]
+                chunk = []
+                for record in reader:
+                    chunk.append(tuple(record[i] if i < len(record) else None for i in order))
+                    if len(chunk) == self.chunk_size:
+                        yield chunk
+                        chunk = []
+                if chunk:
+                    yield chunk
+        else:
+            for batch in pq.ParquetFile(path).iter_batches(batch_size=self.chunk_size, columns=list(columns)):
+                yield list(zip(*(batch.column(column).to_pylist() for column in columns)))
+
+    def _load_checkpoint(self, checkpoint, path):
+        if not os.path.exists(checkpoint):
+            return {"path": os.path.abspath(path), "rows": 0, "inserted": 0, "failed": 0}
+        with open(checkpoint, encoding="utf-8") as source:
+            state = json.load(source)
+        if state.get("path") != os.path.abspath(path):
+            raise ValueError(f"Checkpoint {checkpoint} belongs to {state.get('path')}")
+        return state
+
+    def _save_checkpoint(self, checkpoint, state):
+        with open(checkpoint + ".tmp", "w", encoding="utf-8") as output:
+            json.dump(state, output)
+        os.replace(checkpoint + ".tmp", checkpoint)
+
+    def import_file(self, table, path, checkpoint=None):
+        self._columns(table)
+        checkpoint = checkpoint or path + ".checkpoint"
+        state = self._load_checkpoint(checkpoint, path)
+        insert = self.db.insert_tickets_bulk if table == "Ticket" else self.db.insert_passengers_bulk
+        failures = []
+        offset = 0
+        for chunk in self._read_chunks(table, path):
+            if offset + len(chunk) <= state["rows"]:
+                offset += len(chunk)
+                continue
+            skip = max(state["rows"] - offset, 0)
+            # A lost connection stops the import with the checkpoint still at the last
+            # committed chunk, instead of recording the chunk as failed rows and moving on.
+            try:
+                inserted, failed = insert(chunk[skip:], raise_connection_errors=True)
+            except Exception as e:
+                if self.db.is_connection_error(e):
+                    logger.warning("Import of %s stopped after %d rows, run it again to resume: %s",
+                                   path, state["rows"], e)
+                raise
+            failures.extend((offset + skip + index, key, message) for index, key, message in failed)
+            offset += len(chunk)
+            state.update(rows=offset, inserted=state["inserted"] + len(inserted),
+                         failed=state["failed"] + len(failed))
+            self._save_checkpoint(checkpoint, state)
+            self._report(table, offset)
+        if os.path.exists(checkpoint):
+            os.remove(checkpoint)
+        return state["inserted"], failures
+
+
+class BackgroundTasks:
+    def __init__(self, widget, executor, status_var=None, poll_interval=25):
+        self.widget = widget
+        self.executor = executor
+        self.status_var = status_var
+        self.poll_interval = poll_interval
+        self._latest = {}
+        self._pending = []
+        self._polling = False
+
+    @property
+    def busy(self):
+        return bool(self._pending)
+
+    def run(self, key, fn, *args, on_success=None, on_error=None):
+        previous = self._latest.get(key) if key is not None else None
+        if previous is not None:
+            previous.cancel()
+        try:
+            future = self.executor.submit(fn, *args)
+        except ExecutorBusyError as e:
+            self.report_error(e, on_error)
+            return None
+        if key is not None:
+            self._latest[key] = future
+        self._pending.append((key, future, on_success, on_error))
+        self._update_busy()
+        if not self._polling:
+            self._polling = True
+            self.widget.after(self.poll_interval, self._poll)
+        return future
+
+    def _poll(self):
+        try:
+            if not self.widget.winfo_exists():
+                return
+        except tk.TclError:
+            return
+
+        pending, self._pending = self._pending, []
+        still_running = []
+        for key, future, on_success, on_error in pending:
+            if not future.done():
+                still_running.append((key, future, on_success, on_error))
+                continue
+            if key is not None:
+                if self._latest.get(key) is not future:
+                    continue
+                del self._latest[key]
+            if future.cancelled():
+                continue
+            error = future.exception()
+            if error is not None:
+                self.report_error(error, on_error)
+            elif on_success is not None:
+                on_success(future.result())
+        self._pending = still_running + self._pending
+
+        self._update_busy()
+        if self._pending:
+            self.widget.after(self.poll_interval, self._poll)
+        else:
+            self._polling = False
+
+    def report_error(self, error, on_error=None):
+        if on_error is not None:
+            on_error(error)
+        elif isinstance(error, ExecutorBusyError):
+            if self.status_var is not None:
+                self.status_var.set(str(error))
+        else:
+            messagebox.showerror("Database Error", str(error), parent=self.widget)
+
+    def _update_busy(self):
+        try:
+            self.widget.config(cursor="watch" if self._pending else "")
+        except tk.TclError:
+            return
+        if self.status_var is not None:
+            self.status_var.set("Working..." if self._pending else "")
+
+
+class ChangeListener:
+    def __init__(self, widget, db_manager, callback, poll_interval=200):
+        self.widget = widget
+        self.db_manager = db_manager
+        self.callback = callback
+        self.poll_interval = poll_interval
+        self._queue = queue.Queue()
+        self._subscriber = self._queue.put
+        self._closed = False
+
+        self.db_manager.subscribe(self._subscriber)
+        self.widget.bind("<Destroy>", self._on_destroy, add="+")
+        self.widget.after(self.poll_interval, self._drain)
+
+    def _drain(self):
+        if self._closed:
+            return
+        events = []
+        while True:
+            try:
+                events.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if events:
+            self.callback(events)
+        self.widget.after(self.poll_interval, self._drain)
+
+    def _on_destroy(self, event):
+        if event.widget is self.widget:
+            self.close()
+
+    def close(self):
+        self._closed = True
+        self.db_manager.unsubscribe(self._subscriber)
+
+
+class PassengerTypeAhead:
+    IGNORED_KEYS = {"Up", "Down", "Left", "Right", "Return", "Escape", "Tab", "Shift_L", "Shift_R",
+                    "Control_L", "Control_R", "Alt_L", "Alt_R"}
+
+    def __init__(self, combo, variable, db_manager, tasks, limit=20, delay=150):
+        self.combo = combo
+        self.variable = variable
+        self.db_manager = db_manager
+        self.tasks = tasks
+        self.limit = limit
+        self.delay = delay
+        self._after = None
+        combo.bind("<KeyRelease>", self._typed)
+
+    def _typed(self, event):
+        if event.keysym in self.IGNORED_KEYS:
+            return
+        if self._after is not None:
+            self.combo.after_cancel(self._after)
+        self._after = self.combo.after(self.delay, self.refresh)
+
+    def query(self):
+        text = self.variable.get()
+        # A chosen "ID: Name" entry searches by its ID so the selection stays in the list.
+        return text.split(":")[0] if ":" in text else text
+
+    def refresh(self):
+        self._after = None
+        self.tasks.run("passenger_search", self.db_manager.search_passengers, self.query(), self.limit,
+                       on_success=self.show)
+
+    def show(self, passengers):
+        current = self.variable.get()
+        values = [f"{p[0]}: {p[1]}" for p in passengers]
+        self.combo['values'] = values
+        if values and (not current or (":" in current and current not in values)):
+            self.combo.current(0)
+
+
+class LineChoices:
+    def __init__(self, line_dropdown, line_var, station_dropdown, bus_dropdown, db_manager, tasks, on_change=None):
+        self.line_var = line_var
+        self.station_dropdown = station_dropdown
+        self.bus_dropdown = bus_dropdown
+        self.db_manager = db_manager
+        self.tasks = tasks
+        self.on_change = on_change
+        line_dropdown.bind("<<ComboboxSelected>>", lambda event: self.refresh(select_first=True))
+
+    def fetch(self, bus_line_id):
+        return self.db_manager.get_line_stations(bus_line_id), self.db_manager.get_line_buses(bus_line_id)
+
+    def refresh(self, select_first=False):
+        bus_line_id = self.line_var.get().split(":")[0]
+        if bus_line_id:
+            self.tasks.run("line_choices", self.fetch, bus_line_id,
+                           on_success=lambda choices: self.show(choices, select_first))
+
+    def show(self, choices, select_first=False):
+        stations, buses = choices
+        self.station_dropdown['values'] = [f"{s[0]}: {s[1]}" for s in stations]
+        self.bus_dropdown['values'] = [f"{b[0]}: BusLine {b[1]}" for b in buses]
+        # Keep a value that was set explicitly (for example a loaded ticket) unless the user picked another line.
+        for dropdown, rows in ((self.station_dropdown, stations), (self.bus_dropdown, buses)):
+            if select_first or not dropdown.get():
+                if rows:
+                    dropdown.current(0)
+                else:
+                    dropdown.set("")
+        if self.on_change is not None:
+            self.on_change()
+
+
+class VirtualTicketList:
+    def __init__(self, tree, scrollbar, db_manager, tasks, page_size=100, max_rows=300, bookmark_step=1000):
+        self.tree = tree
+        self.scrollbar = scrollbar
+        self.db_manager = db_manager
+        self.tasks = tasks
+        self.page_size = page_size
+        self.max_rows = max_rows
+        self.bookmark_step = bookmark_step
+        self.rows = []
+        self.start = 0
+        self.total = 0
+        self._bookmarks = None
+        self._loading = False
+
+        self.tree.configure(yscrollcommand=self._on_tree_scroll)
+        self.scrollbar.configure(command=self._on_scrollbar)
+
+    def reload(self):
+        anchor = self.rows[0][0] if self.rows else None
+        start = self.start if anchor is not None else 0
+        self._bookmarks = None
+
+        def fetch():
+            total = self.db_manager.count_tickets()
+            rows = self.db_manager.get_tickets_page(anchor, self.max_rows, inclusive=True)
+            offset = start
+            if not rows and total:
+                rows = self.db_manager.get_tickets_page_before(None, self.max_rows)
+                offset = max(0, total - len(rows))
+            return total, offset, rows
+
+        def done(result):
+            total, offset, rows = result
+            self.total = total
+            self._replace(rows, offset, self.tree.yview()[0] if anchor is not None else 0)
+
+        self._loading = True
+        self.tasks.run("tickets", fetch, on_success=done, on_error=self._failed)
+
+    def _replace(self, rows, start, fraction):
+        self._loading = False
+        self.tree.delete(*self.tree.get_children())
+        self.rows = list(rows)
+        self.start = start
+        for row in self.rows:
+            self.tree.insert("", "end", iid=row[0], values=row)
+        self.tree.yview_moveto(fraction)
+
+    def _failed(self, error):
+        self._loading = False
+        self.tasks.report_error(error)
+
+    def _on_tree_scroll(self, first, last):
+        first, last = float(first), float(last)
+        count = len(self.rows)
+        if not count or not self.total:
+            self.scrollbar.set(first, last)
+            return
+        self.scrollbar.set((self.start + first * count) / self.total, (self.start + last * count) / self.total)
 
-    def create_tables(self):
-        self.cursor.execute("SHOW TABLES")
-        existing_tables = [table[0] for table in self.cursor.fetchall()]
-        
-        if 'company' not in existing_tables:
-            self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS Company (
-                CompanyName VARCHAR(100) PRIMARY KEY,
-                VAT VARCHAR(20)
-            )
-            ''')
-            
-        if 'busline' not in existing_tables:
-            self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS BusLine (
-                BusLineID INT PRIMARY KEY,
-                Route VARCHAR(255),
-                BusLineName VARCHAR(100),
-                Length DECIMAL(5,2),
-                CompanyName VARCHAR(100),
-                AmountOfSeats INT,
-                AmountOfCrew INT,
-                OnWay TINYINT(1),
-                FOREIGN KEY (CompanyName) REFERENCES Company(CompanyName)
-            )
-            ''')
-            
-        if 'station' not in existing_tables:
-            self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS Station (
-                StationNumber INT PRIMARY KEY,
-                StationName VARCHAR(100),
-                BusLineID INT,
-                FOREIGN KEY (BusLineID) REFERENCES BusLine(BusLineID)
-            )
-            ''')
-            
-        if 'bus' not in existing_tables:
-            self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS Bus (
-                BusNumber VARCHAR(50) PRIMARY KEY,
-                BusLineID INT,
-                AmountOfSeats INT,
-                AmountOfCrew INT,
-                OnWay TINYINT(1),
-                FOREIGN KEY (BusLineID) REFERENCES BusLine(BusLineID)
-            )
-            ''')
-            
-        if 'crew' not in existing_tables:
-            self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS Crew (
-                CrewID INT PRIMARY KEY,
-                CrewRole VARCHAR(100),
-                CrewName VARCHAR(100),
-                BusNumber VARCHAR(50),
-                FOREIGN KEY (BusNumber) REFERENCES Bus(BusNumber)
-            )
-            ''')
-            
-        if 'zone' not in existing_tables:
-            self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS Zone (
-                ZoneID INT PRIMARY KEY,
-                Price DECIMAL(5,2)
-            )
-            ''')
-            
-        if 'passenger' not in existing_tables:
-            self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS Passenger (
-                PassengerID VARCHAR(20) PRIMARY KEY,
-                PassengerName VARCHAR(100)
-            )
-            ''')
-            
-        if 'ticket' not in existing_tables:
-            self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS Ticket (
-                TicketNumber VARCHAR(50) PRIMARY KEY,
-                TicketType VARCHAR(50),
-                ZoneID INT,
-                SeatNumber INT,
-                PassengerID VARCHAR(20),
-                BusLineID INT,
-                StationNumber INT,
-                BusNumber VARCHAR(50),
-                FOREIGN KEY (ZoneID) REFERENCES Zone(ZoneID),
-                FOREIGN KEY (PassengerID) REFERENCES Passenger(PassengerID),
-                FOREIGN KEY (BusLineID) REFERENCES BusLine(BusLineID),
-                FOREIGN KEY (StationNumber) REFERENCES Station(StationNumber),
-                FOREIGN KEY (BusNumber) REFERENCES Bus(BusNumber)
-            )
-            ''')
-            
-        self.cursor.execute("SELECT COUNT(*) FROM Company")
-        self.insert_sample_data()
-            
-        self.conn.commit()
+        if self._loading:
+            return
+        if last >= 0.9 and self.start + count < self.total:
+            self._loading = True
+            self.tasks.run("page", self.db_manager.get_tickets_page, self.rows[-1][0], self.page_size,
+                           on_success=self._append, on_error=self._failed)
+        elif first <= 0.1 and self.start > 0:
+            self._loading = True
+            self.tasks.run("page", self.db_manager.get_tickets_page_before, self.rows[0][0], self.page_size,
+                           on_success=self._prepend, on_error=self._failed)
 
-    def insert_sample_data(self):
-        self.cursor.execute("DELETE FROM Ticket")
-        self.cursor.execute("DELETE FROM Passenger")
-        self.cursor.execute("DELETE FROM Zone")
-        self.cursor.execute("DELETE FROM Crew")
-        self.cursor.execute("DELETE FROM Bus")
-        self.cursor.execute("DELETE FROM Station")
-        self.cursor.execute("DELETE FROM BusLine")
-        self.cursor.execute("DELETE FROM Company")
-        self.conn.commit()
-
-        self.cursor.execute('''
-        INSERT INTO Company (CompanyName, VAT) 
-        VALUES ('Metro Transit', 'MT123456789')
-        ''')
-        
-        bus_lines = [
-            (1, 'Downtown to North End', 'Red Line', 15.5, 'Metro Transit', 50, 2, 1),
-            (2, 'Airport to South Side', 'Blue Line', 18.2, 'Metro Transit', 40, 2, 1),
-            (3, 'East to West', 'Green Line', 12.8, 'Metro Transit', 60, 2, 1)
-        ]
-        self.cursor.executemany('''
-        INSERT INTO BusLine (BusLineID, Route, BusLineName, Length, CompanyName, AmountOfSeats, AmountOfCrew, OnWay)
-        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-        ''', bus_lines)
-        
-        stations = [
-            (1, 'Downtown Central', 1),
-            (2, 'North End Terminal', 1),
-            (3, 'Airport Terminal', 2),
-            (4, 'South Side Station', 2),
-            (5, 'East Terminal', 3),
-            (6, 'West Terminal', 3)
-        ]
-        self.cursor.executemany('''
-        INSERT INTO Station (StationNumber, StationName, BusLineID)
-        VALUES (%s, %s, %s)
-        ''', stations)
-        
-        buses = [
-            ('B001', 1, 50, 2, 1),
-            ('B002', 2, 40, 2, 1),
-            ('B003', 3, 60, 2, 1)
-        ]
-        self.cursor.executemany('''
-        INSERT INTO Bus (BusNumber, BusLineID, AmountOfSeats, AmountOfCrew, OnWay)
-        VALUES (%s, %s, %s, %s, %s)
-        ''', buses)
-        
-        crew_members = [
-            (1, 'Driver', 'John Smith', 'B001'),
-            (2, 'Attendant', 'Mary Johnson', 'B001'),
-            (3, 'Driver', 'James Brown', 'B002'),
-            (4, 'Attendant', 'Sarah Davis', 'B002'),
-            (5, 'Driver', 'Michael Wilson', 'B003'),
-            (6, 'Attendant', 'Lisa Thompson', 'B003')
-        ]
-        self.cursor.executemany('''
-        INSERT INTO Crew (CrewID, CrewRole, CrewName, BusNumber)
-        VALUES (%s, %s, %s, %s)
-        ''', crew_members)
-        
-        zones = [
-            (1, 2.50),
-            (2, 3.75),
-            (3, 5.00)
-        ]
-        self.cursor.executemany('''
-        INSERT INTO Zone (ZoneID, Price)
-        VALUES (%s, %s)
-        ''', zones)
-        
-        passengers = [
-            ('P001', 'John Doe'),
-            ('P002', 'Jane Smith'),
-            ('P003', 'Robert Johnson')
-        ]
-        self.cursor.executemany('''
-        INSERT INTO Passenger (PassengerID, PassengerName)
-        VALUES (%s, %s)
-        ''', passengers)
-
-        tickets = [
-            ('T001', 'SingleTicket', 1, 10, 'P001', 1, 1, 'B001'),
-            ('T002', 'MonthlyPass', 2, 15, 'P002', 1, 1, 'B001'),
-            ('T003', 'SingleTicket', 3, 20, 'P003', 2, 3, 'B002'),
-            ('T004', 'SingleTicket', 1, 25, 'P001', 2, 4, 'B002'),
-            ('T005', 'MonthlyPass', 2, 30, 'P002', 3, 5, 'B003'),
-            ('T006', 'SingleTicket', 3, 5, 'P003', 3, 6, 'B003'),
-            ('T007', 'SingleTicket', 1, 12, 'P001', 1, 2, 'B001'),
-            ('T008', 'MonthlyPass', 2, 18, 'P002', 2, 3, 'B002'),
-            ('T009', 'SingleTicket', 3, 22, 'P003', 3, 5, 'B003'),
-            ('T010', 'SingleTicket', 1, 28, 'P001', 1, 1, 'B001'),
-            ('T011', 'MonthlyPass', 2, 8, 'P002', 2, 4, 'B002'),
-            ('T012', 'SingleTicket', 3, 14, 'P003', 3, 6, 'B003'),
-            ('T013', 'SingleTicket', 1, 16, 'P001', 1, 1, 'B001'),
-            ('T014', 'MonthlyPass', 2, 21, 'P002', 2, 3, 'B002'),
-            ('T015', 'SingleTicket', 3, 27, 'P003', 3, 5, 'B003')
-        ]
-        self.cursor.executemany('''
-        INSERT INTO Ticket (TicketNumber, TicketType, ZoneID, SeatNumber, PassengerID, BusLineID, StationNumber, BusNumber)
-        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-        ''', tickets)
-        
-        self.conn.commit()
+    def _append(self, page):
+        self._loading = False
+        if len(page) < self.page_size:
+            self.total = self.start + len(self.rows) + len(page)
+        if not page:
+            return
 
-    def get_all_passengers(self):
-        self.cursor.execute("SELECT PassengerID, PassengerName FROM Passenger")
-        return self.cursor.fetchall()
+        first_index = self.tree.yview()[0] * len(self.rows)
+        for row in page:
+            if not self.tree.exists(row[0]):
+                self.tree.insert("", "end", iid=row[0], values=row)
+                self.rows.append(row)
 
-    def get_passenger(self, passenger_id):
-        self.cursor.execute("SELECT PassengerID, PassengerName FROM Passenger WHERE PassengerID = %s", (passenger_id,))
-        return self.cursor.fetchone()
+        excess = len(self.rows) - self.max_rows
+        if excess > 0:
+            self.tree.delete(*[row[0] for row in self.rows[:excess]])
+            self.rows = self.rows[excess:]
+            self.start += excess
+            first_index -= excess
+        self.tree.yview_moveto(max(first_index, 0) / len(self.rows))
 
-    def create_passenger(self, passenger_id, passenger_name):
-        try:
-            self.cursor.execute('''
-            INSERT INTO Passenger (PassengerID, PassengerName)
-            VALUES (%s, %s)
-            ''', (passenger_id, passenger_name))
-            self.conn.commit()
-            return passenger_id
-        except Exception as e:
-            print(f"Error creating passenger: {e}")
-            return None
+    def _prepend(self, page):
+        self._loading = False
+        reached_top = len(page) < self.page_size
+        if not page:
+            self.start = 0
+            return
 
-    def update_passenger(self, passenger_id, passenger_name):
-        try:
-            self.cursor.execute('''
-            UPDATE Passenger
-            SET PassengerName = %s
-            WHERE PassengerID = %s
-            ''', (passenger_name, passenger_id))
-            self.conn.commit()
-            return True
-        except Exception as e:
-            print(f"Error updating passenger: {e}")
-            return False
+        first_index = self.tree.yview()[0] * len(self.rows)
+        page = [row for row in page if not self.tree.exists(row[0])]
+        for index, row in enumerate(page):
+            self.tree.insert("", index, iid=row[0], values=row)
+        self.rows = page + self.rows
+        self.start = 0 if reached_top else max(0, self.start - len(page))
+        first_index += len(page)
 
-    def delete_passenger(self, passenger_id):
-        try:
-            self.cursor.execute("SELECT COUNT(*) FROM Ticket WHERE PassengerID = %s", (passenger_id,))
-            if self.cursor.fetchone()[0] > 0:
-                return False, "Cannot delete passenger with existing tickets"
-            
-            self.cursor.execute("DELETE FROM Passenger WHERE PassengerID = %s", (passenger_id,))
-            self.conn.commit()
-            return True, "Passenger deleted successfully"
-        except Exception as e:
-            print(f"Error deleting passenger: {e}")
-            return False, f"Error: {str(e)}"
+        excess = len(self.rows) - self.max_rows
+        if excess > 0:
+            self.tree.delete(*[row[0] for row in self.rows[-excess:]])
+            self.rows = self.rows[:-excess]
+        self.tree.yview_moveto(first_index / len(self.rows))
 
-    def get_all_bus_lines(self):
-        self.cursor.execute("SELECT BusLineID, BusLineName FROM BusLine")
-        return self.cursor.fetchall()
+    def apply(self, event):
+        key = event.key
+        if event.operation == "delete":
+            self.total = max(self.total - 1, 0)
+            if self.tree.exists(key):
+                self.tree.delete(key)
+                self.rows = [row for row in self.rows if row[0] != key]
+            return
+        if event.row is None:
+            return
 
-    def get_all_zones(self):
-        self.cursor.execute("SELECT ZoneID, CONCAT('Zone ', ZoneID, ' - $', Price) FROM Zone")
-        return self.cursor.fetchall()
-        
-    def get_all_stations(self):
-        self.cursor.execute("SELECT StationNumber, StationName FROM Station")
-        return self.cursor.fetchall()
-        
-    def get_all_buses(self):
-        self.cursor.execute("SELECT BusNumber, BusLineID FROM Bus")
-        return self.cursor.fetchall()
+        row = tuple(event.row)
+        if self.tree.exists(key):
+            self.tree.item(key, values=row)
+            self.rows = [row if existing[0] == key else existing for existing in self.rows]
+            return
 
-    def insert_ticket(self, ticket_number, ticket_type, bus_line_id, zone_id, passenger_id, station_number, bus_number, seat_number):
-        try:
-            self.cursor.execute('''
-            INSERT INTO Ticket (TicketNumber, TicketType, BusLineID, ZoneID, PassengerID, StationNumber, BusNumber, SeatNumber)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-            ''', (ticket_number, ticket_type, bus_line_id, zone_id, passenger_id, station_number, bus_number, seat_number))
-            self.conn.commit()
-            return ticket_number
-        except Exception as e:
-            print(f"Error inserting ticket: {e}")
-            return None
+        self.total += 1
+        keys = [existing[0] for existing in self.rows]
+        position = bisect.bisect_left(keys, key)
+        at_top = position == 0 and self.start == 0
+        at_bottom = position == len(keys) and self.start + len(keys) >= self.total - 1
+        if 0 < position < len(keys) or at_top or at_bottom:
+            self.tree.insert("", position, iid=key, values=row)
+            self.rows.insert(position, row)
+        elif position == 0:
+            self.start += 1
 
-    def get_all_tickets(self):
-        self.cursor.execute("""
-        SELECT TicketNumber, TicketType, BusLineID, ZoneID, PassengerID, StationNumber, BusNumber, SeatNumber 
-        FROM Ticket
-        """)
-        return self.cursor.fetchall()
+    def _on_scrollbar(self, *args):
+        if args[0] != "moveto" or not self.total or not self.rows:
+            self.tree.yview(*args)
+            return
 
-    def get_ticket(self, ticket_number):
-        self.cursor.execute("""
-        SELECT TicketNumber, TicketType, BusLineID, ZoneID, PassengerID, StationNumber, BusNumber, SeatNumber 
-        FROM Ticket 
-        WHERE TicketNumber = %s
-        """, (ticket_number,))
-        return self.cursor.fetchone()
+        rank = int(float(args[1]) * self.total)
+        count = len(self.rows)
+        if self.start <= rank < self.start + count:
+            self.tree.yview_moveto((rank - self.start) / count)
+            return
 
-    def update_ticket(self, ticket_number, ticket_type, bus_line_id, zone_id, passenger_id, station_number, bus_number, seat_number):
-        try:
-            self.cursor.execute('''
-            UPDATE Ticket
-            SET TicketType = %s, BusLineID = %s, ZoneID = %s, PassengerID = %s, 
-                StationNumber = %s, BusNumber = %s, SeatNumber = %s
-            WHERE TicketNumber = %s
-            ''', (ticket_type, bus_line_id, zone_id, passenger_id, station_number, bus_number, seat_number, ticket_number))
-            self.conn.commit()
-            return True
-        except Exception as e:
-            print(f"Error updating ticket: {e}")
-            return False
+        target = max(0, min(rank - self.page_size, self.total - self.max_rows))
+        bookmarks = self._bookmarks
+        step = self.bookmark_step
 
-    def delete_ticket(self, ticket_number):
-        try:
-            self.cursor.execute("DELETE FROM Ticket WHERE TicketNumber = %s", (ticket_number,))
-            self.conn.commit()
-            return True, "Ticket deleted successfully"
-        except Exception as e:
-            print(f"Error deleting ticket: {e}")
-            return False, f"Error: {str(e)}"
+        def fetch():
+            # Seek to the nearest bookmark at or before the target and skip the remainder,
+            # instead of an OFFSET that walks every row before it.
+            marks = bookmarks if bookmarks is not None else self.db_manager.get_ticket_bookmarks(step)
+            if not marks:
+                return marks, 0, []
+            index = min(target // step, len(marks) - 1)
+            skip = target - index * step
+            rows = self.db_manager.get_tickets_page(marks[index], skip + self.max_rows, inclusive=True)
+            return marks, index * step + skip, rows[skip:]
 
-    def close(self):
-        if hasattr(self, 'conn') and self.conn:
-            self.conn.close()
+        def done(result):
+            self._bookmarks, offset, rows = result
+            if rows:
+                self._replace(rows, offset, max(rank - offset, 0) / len(rows))
+            else:
+                self._loading = False
+
+        self._loading = True
+        self.tasks.run("page", fetch, on_success=done, on_error=self._failed)
+
+
+class CachedWindow(tk.Toplevel):
+    def __init__(self, parent, stale_after=300, max_missed_changes=500):
+        super().__init__(parent)
+        self.stale_after = stale_after
+        self.max_missed_changes = max_missed_changes
+        self._loaded_at = None
+        self._stale = False
+        self._missed = []
+        self.withdraw()
+        self.protocol("WM_DELETE_WINDOW", self.hide)
+
+    def show(self):
+        self.deiconify()
+        self.lift()
+        self.focus_set()
+        if (self._loaded_at is None or self._stale
+                or (self.stale_after is not None and time.monotonic() - self._loaded_at > self.stale_after)):
+            self._loaded_at = time.monotonic()
+            self._stale = False
+            self._missed = []
+            self.load()
+        elif self._missed:
+            events, self._missed = self._missed, []
+            self.apply_changes(events)
+
+    def hide(self):
+        self.withdraw()
+
+    def load(self):
+        pass
+
+    def apply_changes(self, events):
+        pass
+
+    def receive_changes(self, events):
+        if self._loaded_at is None or self._stale:
+            return
+        if self.state() != "withdrawn":
+            self.apply_changes(events)
+            return
+        # Hidden windows catch up when they are shown again; a long backlog is cheaper to reload.
+        self._missed.extend(events)
+        if len(self._missed) > self.max_missed_changes or any(event.operation == "reload" for event in events):
+            self._missed = []
+            self._stale = True
 
 
-class PurchaseTicketForm(tk.Toplevel):
+class PurchaseTicketForm(CachedWindow):
     def __init__(self, parent, db_manager):
         super().__init__(parent)
         self.parent = parent
         self.db_manager = db_manager
         self.title("Purchase Ticket")
-        self.geometry("500x500")
+        self.geometry("620x620")
         self.resizable(True, True)
 
         tk.Label(self, text="Purchase Ticket", font=("Arial", 14, "bold")).grid(row=0, column=0, columnspan=3, pady=10)
@@ -375,6 +3970,7 @@ class PurchaseTicketForm(tk.Toplevel):
         self.ticket_number_var = tk.StringVar()
         self.ticket_number_entry = tk.Entry(ticket_frame, textvariable=self.ticket_number_var, width=30)
         self.ticket_number_entry.grid(row=0, column=1, padx=10, pady=10)
+        tk.Label(ticket_frame, text="(blank = automatic)", fg="gray").grid(row=0, column=2, padx=5, sticky="w")
         
         tk.Label(ticket_frame, text="Bus Line:").grid(row=1, column=0, padx=10, pady=10, sticky="w")
         self.bus_line_var = tk.StringVar()
@@ -386,32 +3982,53 @@ class PurchaseTicketForm(tk.Toplevel):
         self.station_dropdown = ttk.Combobox(ticket_frame, textvariable=self.station_var, width=30)
         self.station_dropdown.grid(row=2, column=1, padx=10, pady=10)
         
-        tk.Label(ticket_frame, text="Bus Number:").grid(row=3, column=0, padx=10, pady=10, sticky="w")
+        tk.Label(ticket_frame, text="Destination:").grid(row=3, column=0, padx=10, pady=10, sticky="w")
+        self.destination_var = tk.StringVar()
+        self.destination_dropdown = ttk.Combobox(ticket_frame, textvariable=self.destination_var, width=30)
+        self.destination_dropdown.grid(row=3, column=1, padx=10, pady=10)
+        tk.Label(ticket_frame, text="(optional, sets the zone)", fg="gray").grid(row=3, column=2, padx=5, sticky="w")
+
+        tk.Label(ticket_frame, text="Bus Number:").grid(row=4, column=0, padx=10, pady=10, sticky="w")
         self.bus_number_var = tk.StringVar()
         self.bus_number_dropdown = ttk.Combobox(ticket_frame, textvariable=self.bus_number_var, width=30)
-        self.bus_number_dropdown.grid(row=3, column=1, padx=10, pady=10)
+        self.bus_number_dropdown.grid(row=4, column=1, padx=10, pady=10)
 
-        tk.Label(ticket_frame, text="Zone:").grid(row=4, column=0, padx=10, pady=10, sticky="w")
+        tk.Label(ticket_frame, text="Zone:").grid(row=5, column=0, padx=10, pady=10, sticky="w")
         self.zone_var = tk.StringVar()
         self.zone_dropdown = ttk.Combobox(ticket_frame, textvariable=self.zone_var, width=30)
-        self.zone_dropdown.grid(row=4, column=1, padx=10, pady=10)
+        self.zone_dropdown.grid(row=5, column=1, padx=10, pady=10)
+        self.fare_var = tk.StringVar()
+        tk.Label(ticket_frame, textvariable=self.fare_var).grid(row=5, column=2, padx=5, sticky="w")
         
-        tk.Label(ticket_frame, text="Seat Number:").grid(row=5, column=0, padx=10, pady=10, sticky="w")
+        tk.Label(ticket_frame, text="Seat Number:").grid(row=6, column=0, padx=10, pady=10, sticky="w")
         self.seat_number_var = tk.StringVar()
         self.seat_number_entry = tk.Entry(ticket_frame, textvariable=self.seat_number_var, width=30)
-        self.seat_number_entry.grid(row=5, column=1, padx=10, pady=10)
+        self.seat_number_entry.grid(row=6, column=1, padx=10, pady=10)
+        self.auto_seat_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(ticket_frame, text="Auto-assign", variable=self.auto_seat_var,
+                       command=self.toggle_auto_seat).grid(row=6, column=2, padx=5, sticky="w")
+        self.bus_number_dropdown.bind("<<ComboboxSelected>>", lambda event: self.auto_seat_var.get() and self.assign_seat())
 
-        tk.Label(ticket_frame, text="Ticket Type:").grid(row=6, column=0, padx=10, pady=10, sticky="w")
+        tk.Label(ticket_frame, text="Ticket Type:").grid(row=7, column=0, padx=10, pady=10, sticky="w")
         self.ticket_type_var = tk.StringVar()
         self.ticket_type_dropdown = ttk.Combobox(ticket_frame, textvariable=self.ticket_type_var, width=30, 
-                                               values=["SingleTicket", "MonthlyPass"])
-        self.ticket_type_dropdown.grid(row=6, column=1, padx=10, pady=10)
+                                               values=list(TICKET_TYPES))
+        self.ticket_type_dropdown.grid(row=7, column=1, padx=10, pady=10)
         self.ticket_type_dropdown.current(0)
+        for dropdown in (self.station_dropdown, self.destination_dropdown, self.ticket_type_dropdown):
+            dropdown.bind("<<ComboboxSelected>>", lambda event: self.update_fare())
+        self.zone_dropdown.bind("<<ComboboxSelected>>", lambda event: self.clear_destination())
+
+        tk.Label(ticket_frame, text="Quantity:").grid(row=8, column=0, padx=10, pady=10, sticky="w")
+        self.quantity_var = tk.StringVar(value="1")
+        self.quantity_spinbox = tk.Spinbox(ticket_frame, from_=1, to=500, textvariable=self.quantity_var, width=10)
+        self.quantity_spinbox.grid(row=8, column=1, padx=10, pady=10, sticky="w")
 
         btn_frame = tk.Frame(self)
         btn_frame.grid(row=2, column=0, pady=20)
         tk.Button(btn_frame, text="Save", width=10, command=self.save_ticket).pack(side=tk.LEFT, padx=10)
         tk.Button(btn_frame, text="Purchase Ticket", width=15, command=self.purchase_ticket).pack(side=tk.LEFT, padx=10)
+        tk.Button(btn_frame, text="Batch Purchase", width=15, command=self.batch_purchase).pack(side=tk.LEFT, padx=10)
         tk.Button(btn_frame, text="Clear", width=10, command=self.clear_form).pack(side=tk.LEFT, padx=10)
 
         self.grid_rowconfigure(1, weight=1)
@@ -419,121 +4036,250 @@ class PurchaseTicketForm(tk.Toplevel):
         form_frame.grid_rowconfigure(0, weight=1)
         form_frame.grid_columnconfigure(0, weight=1)
 
+        self.status_var = tk.StringVar()
+        tk.Label(self, textvariable=self.status_var, anchor="w", fg="gray").grid(row=3, column=0, padx=10, sticky="ew")
+        self.tasks = BackgroundTasks(self, self.db_manager.executor, self.status_var)
+        self.passenger_search = PassengerTypeAhead(self.passenger_combo, self.passenger_var, self.db_manager, self.tasks)
+        self.line_choices = LineChoices(self.bus_line_dropdown, self.bus_line_var, self.station_dropdown,
+                                        self.bus_number_dropdown, self.db_manager, self.tasks,
+                                        on_change=self.line_changed)
+        self.changes = ChangeListener(self, self.db_manager, self.receive_changes)
+
+    def load(self):
         self.load_bus_lines()
         self.load_zones()
+        self.load_destinations()
         self.load_passengers()
-        self.load_stations()
-        self.load_buses()
     
     def load_passengers(self):
-        passengers = self.db_manager.get_all_passengers()
-        self.passenger_combo['values'] = [f"{p[0]}: {p[1]}" for p in passengers]
-        if passengers:
-            self.passenger_combo.current(0)
+        self.passenger_search.refresh()
+
+    def apply_changes(self, events):
+        tables = {event.table for event in events}
+        if "*" in tables:
+            self.load_bus_lines()
+            self.load_zones()
+            self.load_destinations()
+        if "Zone" in tables:
+            self.load_zones()
+            self.update_fare()
+        if "*" in tables or "Passenger" in tables:
+            self.load_passengers()
+        if ("*" in tables or "Ticket" in tables) and self.auto_seat_var.get():
+            self.assign_seat()
     
     def open_passenger_management(self):
-        passenger_form = PassengerManagementForm(self, self.db_manager)
-        self.wait_window(passenger_form)
-        self.load_passengers()
+        # The type-ahead follows passenger change events, so there is nothing to reload afterwards.
+        self.parent.open_passenger_management()
 
     def load_bus_lines(self):
-        bus_lines = self.db_manager.get_all_bus_lines()
-        self.bus_line_dropdown['values'] = [f"{bl[0]}: {bl[1]}" for bl in bus_lines]
-        if bus_lines:
+        self.tasks.run("bus_lines", self.db_manager.get_all_bus_lines, on_success=self.show_bus_lines)
+
+    def show_bus_lines(self, bus_lines):
+        values = [f"{bl[0]}: {bl[1]}" for bl in bus_lines]
+        self.bus_line_dropdown['values'] = values
+        if bus_lines and self.bus_line_var.get() not in values:
             self.bus_line_dropdown.current(0)
+            self.line_choices.refresh(select_first=True)
+        else:
+            self.line_choices.refresh()
 
     def load_zones(self):
-        zones = self.db_manager.get_all_zones()
+        self.tasks.run("zones", self.db_manager.get_all_zones, on_success=self.show_zones)
+
+    def show_zones(self, zones):
+        current = self.zone_var.get().split(":")[0]
         self.zone_dropdown['values'] = [f"{z[0]}: {z[1]}" for z in zones]
-        if zones:
+        self.select_zone(current)
+        if zones and not self.zone_var.get():
             self.zone_dropdown.current(0)
-            
-    def load_stations(self):
-        stations = self.db_manager.get_all_stations()
-        self.station_dropdown['values'] = [f"{s[0]}: {s[1]}" for s in stations]
-        if stations:
-            self.station_dropdown.current(0)
-            
-    def load_buses(self):
-        buses = self.db_manager.get_all_buses()
-        self.bus_number_dropdown['values'] = [f"{b[0]}: BusLine {b[1]}" for b in buses]
-        if buses:
-            self.bus_number_dropdown.current(0)
 
-    def save_ticket(self):
-        if not self.passenger_var.get() or not self.ticket_number_var.get():
-            messagebox.showwarning("Validation Error", "Passenger and Ticket Number are required!")
+    def select_zone(self, zone_id):
+        for index, value in enumerate(self.zone_dropdown['values']):
+            if value.split(":")[0] == str(zone_id):
+                self.zone_dropdown.current(index)
+                return
+        self.zone_var.set("")
+
+    def load_destinations(self):
+        self.tasks.run("destinations", self.db_manager.get_all_stations, on_success=self.show_destinations)
+
+    def show_destinations(self, stations):
+        self.destination_dropdown['values'] = [f"{s[0]}: {s[1]}" for s in stations]
+
+    def line_changed(self):
+        if self.auto_seat_var.get():
+            self.assign_seat()
+        self.update_fare()
+
+    def update_fare(self):
+        origin = self.station_var.get().split(":")[0]
+        destination = self.destination_var.get().split(":")[0]
+        if origin and destination:
+            self.tasks.run("fare", self.db_manager.quote_fare, origin, destination, self.ticket_type_var.get(),
+                           on_success=self.show_fare)
+        else:
+            self.fare_var.set("")
+
+    def show_fare(self, quote):
+        if quote is None:
+            self.fare_var.set("No fare zone for this trip")
             return
+        zone_id, fare = quote
+        self.select_zone(zone_id)
+        self.fare_var.set(f"Fare: ${fare}")
+
+    def clear_destination(self):
+        self.destination_var.set("")
+        self.fare_var.set("")
             
+    def read_ticket_fields(self):
+        if not self.passenger_var.get():
+            messagebox.showwarning("Validation Error", "Passenger is required!")
+            return None
+
         passenger_id = self.passenger_var.get().split(":")[0] if self.passenger_var.get() else ""
         bus_line_id = self.bus_line_var.get().split(":")[0] if self.bus_line_var.get() else ""
         zone_id = self.zone_var.get().split(":")[0] if self.zone_var.get() else ""
         station_number = self.station_var.get().split(":")[0] if self.station_var.get() else ""
         bus_number = self.bus_number_var.get().split(":")[0] if self.bus_number_var.get() else ""
-        seat_number = self.seat_number_var.get()
+        seat_number = "auto" if self.auto_seat_var.get() else self.seat_number_var.get().strip()
         ticket_type = self.ticket_type_var.get()
-        ticket_number = self.ticket_number_var.get()
+        ticket_number = self.ticket_number_var.get().strip() or None
 
-        if not all([passenger_id, bus_line_id, zone_id, station_number, bus_number, seat_number, ticket_type, ticket_number]):
+        if not all([passenger_id, bus_line_id, zone_id, station_number, bus_number, seat_number, ticket_type]):
             messagebox.showwarning("Validation Error", "All fields are required!")
-            return
+            return None
+        return ticket_number, ticket_type, bus_line_id, zone_id, passenger_id, station_number, bus_number, seat_number
 
-        result = self.db_manager.insert_ticket(
-            ticket_number, ticket_type, bus_line_id, zone_id, passenger_id, 
+    def issue_ticket(self, ticket_number, ticket_type, bus_line_id, zone_id, passenger_id, station_number, bus_number, seat_number):
+        if seat_number == "auto":
+            seat_number = self.db_manager.next_free_seat(bus_number)
+            if seat_number is None:
+                return None
+        if ticket_number is None:
+            ticket_number = self.db_manager.ticket_numbers.next()
+        return self.db_manager.insert_ticket(
+            ticket_number, ticket_type, bus_line_id, zone_id, passenger_id,
             station_number, bus_number, seat_number
         )
-        
-        if result:
-            messagebox.showinfo("Success", f"Ticket saved successfully!\nTicket Number: {ticket_number}")
-        else:
-            messagebox.showerror("Error", "Failed to save ticket!")
+
+    def offline_note(self):
+        if not self.db_manager.is_offline:
+            return ""
+        return "\n\nThe central database is unreachable. The sale was stored locally and will be sent automatically."
+
+    def save_ticket(self):
+        fields = self.read_ticket_fields()
+        if fields is None:
+            return
+
+        def done(result):
+            if result:
+                messagebox.showinfo("Success", f"Ticket saved successfully!\nTicket Number: {result}{self.offline_note()}", parent=self)
+            else:
+                messagebox.showerror("Error", "Failed to save ticket!", parent=self)
+
+        self.tasks.run(None, self.issue_ticket, *fields, on_success=done)
 
     def purchase_ticket(self):
-        if not self.passenger_var.get() or not self.ticket_number_var.get():
-            messagebox.showwarning("Validation Error", "Passenger and Ticket Number are required!")
+        fields = self.read_ticket_fields()
+        if fields is None:
             return
-            
-        passenger_id = self.passenger_var.get().split(":")[0] if self.passenger_var.get() else ""
-        bus_line_id = self.bus_line_var.get().split(":")[0] if self.bus_line_var.get() else ""
-        zone_id = self.zone_var.get().split(":")[0] if self.zone_var.get() else ""
-        station_number = self.station_var.get().split(":")[0] if self.station_var.get() else ""
-        bus_number = self.bus_number_var.get().split(":")[0] if self.bus_number_var.get() else ""
-        seat_number = self.seat_number_var.get()
-        ticket_type = self.ticket_type_var.get()
-        ticket_number = self.ticket_number_var.get()
 
-        if not all([passenger_id, bus_line_id, zone_id, station_number, bus_number, seat_number, ticket_type, ticket_number]):
-            messagebox.showwarning("Validation Error", "All fields are required!")
+        def done(result):
+            if result:
+                messagebox.showinfo("Success", f"Ticket purchased successfully!\nTicket Number: {result}{self.offline_note()}", parent=self)
+                self.clear_form()
+            else:
+                messagebox.showerror("Error", "Failed to create ticket!", parent=self)
+
+        self.tasks.run(None, self.issue_ticket, *fields, on_success=done)
+
+    def batch_purchase(self):
+        fields = self.read_ticket_fields()
+        if fields is None:
             return
+        ticket_number, ticket_type, bus_line_id, zone_id, passenger_id, station_number, bus_number, seat_number = fields
 
-        result = self.db_manager.insert_ticket(
-            ticket_number, ticket_type, bus_line_id, zone_id, passenger_id, 
-            station_number, bus_number, seat_number
-        )
-        
-        if result:
-            messagebox.showinfo("Success", f"Ticket purchased successfully!\nTicket Number: {ticket_number}")
-            self.clear_form()
+        try:
+            quantity = int(self.quantity_var.get())
+            first_seat = None if seat_number == "auto" else int(seat_number)
+        except ValueError:
+            messagebox.showwarning("Validation Error", "Quantity and Seat Number must be numbers!")
+            return
+        if quantity < 1:
+            messagebox.showwarning("Validation Error", "Quantity must be at least 1!")
+            return
+
+        def issue():
+            if first_seat is None:
+                seats = self.db_manager.find_free_seats(bus_number, quantity)
+                if len(seats) < quantity:
+                    return [], [(0, None, f"Only {len(seats)} free seats left on the selected bus")]
+            else:
+                seats = [first_seat + i for i in range(quantity)]
+            if ticket_number is None:
+                numbers = self.db_manager.ticket_numbers.take(quantity)
+            else:
+                numbers = [f"{ticket_number}-{i + 1:03d}" for i in range(quantity)]
+            tickets = [
+                (numbers[i], ticket_type, bus_line_id, zone_id, passenger_id,
+                 station_number, bus_number, seats[i])
+                for i in range(quantity)
+            ]
+            return self.db_manager.insert_tickets_bulk(tickets)
+
+        def done(result):
+            inserted, failures = result
+            details = "\n".join(f"{number or 'Batch'}: {message}" for _, number, message in failures[:10])
+            if inserted and not failures:
+                messagebox.showinfo("Success", f"{len(inserted)} tickets purchased successfully!\n"
+                                               f"Ticket Numbers: {inserted[0]} - {inserted[-1]}{self.offline_note()}", parent=self)
+                self.clear_form()
+            elif inserted:
+                messagebox.showwarning("Partial Success", f"{len(inserted)} tickets purchased, {len(failures)} failed:\n{details}", parent=self)
+            else:
+                messagebox.showerror("Error", f"Failed to purchase tickets!\n{details}", parent=self)
+
+        self.tasks.run(None, issue, on_success=done)
+
+    def assign_seat(self):
+        bus_number = self.bus_number_var.get().split(":")[0] if self.bus_number_var.get() else ""
+        if not bus_number:
+            self.seat_number_var.set("")
+            return
+
+        def done(seat):
+            self.seat_number_var.set(seat if seat is not None else "")
+            if seat is None:
+                self.status_var.set("No free seats left on the selected bus")
+
+        self.tasks.run("seat", self.db_manager.next_free_seat, bus_number, on_success=done)
+
+    def toggle_auto_seat(self):
+        if self.auto_seat_var.get():
+            self.seat_number_entry.config(state="disabled")
+            self.assign_seat()
         else:
-            messagebox.showerror("Error", "Failed to create ticket!")
+            self.seat_number_entry.config(state="normal")
 
     def clear_form(self):
         self.ticket_number_var.set("")
         self.seat_number_var.set("")
+        self.quantity_var.set("1")
         if self.passenger_combo['values']:
             self.passenger_combo.current(0)
         if self.bus_line_dropdown['values']:
             self.bus_line_dropdown.current(0)
+            self.line_choices.refresh(select_first=True)
         if self.zone_dropdown['values']:
             self.zone_dropdown.current(0)
-        if self.station_dropdown['values']:
-            self.station_dropdown.current(0)
-        if self.bus_number_dropdown['values']:
-            self.bus_number_dropdown.current(0)
         self.ticket_type_dropdown.current(0)
+        self.clear_destination()
 
 
-class PassengerManagementForm(tk.Toplevel):
+class PassengerManagementForm(CachedWindow):
     def __init__(self, parent, db_manager):
         super().__init__(parent)
         self.parent = parent
@@ -603,17 +4349,43 @@ class PassengerManagementForm(tk.Toplevel):
         form_frame.grid_rowconfigure(1, weight=1)
         form_frame.grid_columnconfigure(1, weight=1)
 
+        self.status_var = tk.StringVar()
+        tk.Label(self, textvariable=self.status_var, anchor="w", fg="gray").pack(side=tk.BOTTOM, fill=tk.X, padx=10)
+        self.tasks = BackgroundTasks(self, self.db_manager.executor, self.status_var)
+        self.changes = ChangeListener(self, self.db_manager, self.receive_changes)
+
         self.selected_passenger_id = None
+        self.selected_version = None
         self.clear_form()
+
+    def load(self):
         self.load_passengers()
     
     def load_passengers(self):
+        self.tasks.run("passengers", self.db_manager.get_all_passengers, on_success=self.show_passengers)
+
+    def show_passengers(self, passengers):
         for item in self.passenger_tree.get_children():
             self.passenger_tree.delete(item)
         
-        passengers = self.db_manager.get_all_passengers()
         for passenger in passengers:
-            self.passenger_tree.insert("", "end", values=passenger)
+            self.passenger_tree.insert("", "end", iid=passenger[0], values=passenger)
+
+    def apply_changes(self, events):
+        for event in events:
+            if event.operation == "reload":
+                self.load_passengers()
+                return
+            if event.table != "Passenger":
+                continue
+            if event.operation == "delete":
+                if self.passenger_tree.exists(event.key):
+                    self.passenger_tree.delete(event.key)
+            elif event.row:
+                if self.passenger_tree.exists(event.key):
+                    self.passenger_tree.item(event.key, values=event.row)
+                else:
+                    self.passenger_tree.insert("", "end", iid=event.key, values=event.row)
     
     def on_passenger_select(self, event):
         selected = self.passenger_tree.focus()
@@ -621,13 +4393,18 @@ class PassengerManagementForm(tk.Toplevel):
             values = self.passenger_tree.item(selected, "values")
             if values:
                 self.selected_passenger_id = values[0]
-                passenger = self.db_manager.get_passenger(self.selected_passenger_id)
-                if passenger:
-                    self.id_var.set(passenger[0])
-                    self.name_var.set(passenger[1])
+                self.tasks.run("select", self.db_manager.get_versioned_passenger, self.selected_passenger_id,
+                               on_success=self.show_passenger)
+
+    def show_passenger(self, passenger):
+        if passenger and passenger[0] == self.selected_passenger_id:
+            self.id_var.set(passenger[0])
+            self.name_var.set(passenger[1])
+            self.selected_version = passenger[2]
     
     def clear_form(self):
         self.selected_passenger_id = None
+        self.selected_version = None
         self.id_var.set("")
         self.name_var.set("")
         self.id_entry.config(state="normal")
@@ -643,20 +4420,37 @@ class PassengerManagementForm(tk.Toplevel):
             return
         
         if self.selected_passenger_id:
-            if self.db_manager.update_passenger(passenger_id, name):
-                messagebox.showinfo("Success", "Passenger updated successfully!")
-                self.clear_form()
-                self.load_passengers()
-            else:
-                messagebox.showerror("Error", "Failed to update passenger!")
+            def updated(success):
+                if success:
+                    messagebox.showinfo("Success", "Passenger updated successfully!", parent=self)
+                    self.clear_form()
+                else:
+                    messagebox.showerror("Error", "Failed to update passenger!", parent=self)
+
+            def conflicted(error):
+                if not isinstance(error, VersionConflict):
+                    self.tasks.report_error(error)
+                elif error.current is None:
+                    messagebox.showerror("Edit Conflict", str(error), parent=self)
+                    self.clear_form()
+                elif messagebox.askyesno("Edit Conflict", f"{error}.\n\nCurrent name: {error.current[1]}\n\n"
+                                         "Save your changes over it?", parent=self):
+                    self.selected_version = error.current[2]
+                    self.save_passenger()
+                else:
+                    self.show_passenger(error.current)
+
+            self.tasks.run(None, self.db_manager.update_passenger, passenger_id, name, self.selected_version,
+                           on_success=updated, on_error=conflicted)
         else:
-            result = self.db_manager.create_passenger(passenger_id, name)
-            if result:
-                messagebox.showinfo("Success", f"Passenger created successfully!\nID: {passenger_id}")
-                self.clear_form()
-                self.load_passengers()
-            else:
-                messagebox.showerror("Error", "Failed to create passenger!")
+            def created(result):
+                if result:
+                    messagebox.showinfo("Success", f"Passenger created successfully!\nID: {passenger_id}", parent=self)
+                    self.clear_form()
+                else:
+                    messagebox.showerror("Error", "Failed to create passenger!", parent=self)
+
+            self.tasks.run(None, self.db_manager.create_passenger, passenger_id, name, on_success=created)
     
     def delete_passenger(self):
         if not self.selected_passenger_id:
@@ -664,16 +4458,18 @@ class PassengerManagementForm(tk.Toplevel):
             return
         
         if messagebox.askyesno("Confirm Delete", "Are you sure you want to delete this passenger?"):
-            success, message = self.db_manager.delete_passenger(self.selected_passenger_id)
-            if success:
-                messagebox.showinfo("Success", message)
-                self.clear_form()
-                self.load_passengers()
-            else:
-                messagebox.showerror("Error", message)
+            def deleted(result):
+                success, message = result
+                if success:
+                    messagebox.showinfo("Success", message, parent=self)
+                    self.clear_form()
+                else:
+                    messagebox.showerror("Error", message, parent=self)
+
+            self.tasks.run(None, self.db_manager.delete_passenger, self.selected_passenger_id, on_success=deleted)
 
 
-class TicketManagementForm(tk.Toplevel):
+class TicketManagementForm(CachedWindow):
     def __init__(self, parent, db_manager):
         super().__init__(parent)
         self.parent = parent
@@ -712,11 +4508,10 @@ class TicketManagementForm(tk.Toplevel):
         self.ticket_tree.column("bus", width=80)
         self.ticket_tree.column("seat", width=80)
         
-        scrollbar = ttk.Scrollbar(tree_frame, orient=tk.VERTICAL, command=self.ticket_tree.yview)
-        self.ticket_tree.configure(yscroll=scrollbar.set)
+        self.ticket_scrollbar = ttk.Scrollbar(tree_frame, orient=tk.VERTICAL)
         
         self.ticket_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.ticket_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         
         self.ticket_tree.bind("<ButtonRelease-1>", self.on_ticket_select)
         
@@ -741,7 +4536,7 @@ class TicketManagementForm(tk.Toplevel):
         tk.Label(form_frame, text="Ticket Type:").grid(row=1, column=0, sticky="w", pady=5)
         self.ticket_type_var = tk.StringVar()
         self.ticket_type_dropdown = ttk.Combobox(form_frame, textvariable=self.ticket_type_var, width=30, 
-                                                values=["SingleTicket", "MonthlyPass"])
+                                                values=list(TICKET_TYPES))
         self.ticket_type_dropdown.grid(row=1, column=1, pady=5, sticky="w")
         
         tk.Label(form_frame, text="Bus Line:").grid(row=2, column=0, sticky="w", pady=5)
@@ -790,43 +4585,58 @@ class TicketManagementForm(tk.Toplevel):
         form_frame.grid_rowconfigure(7, weight=1)
         form_frame.grid_columnconfigure(1, weight=1)
 
+        self.status_var = tk.StringVar()
+        tk.Label(self, textvariable=self.status_var, anchor="w", fg="gray").pack(side=tk.BOTTOM, fill=tk.X, padx=10)
+        self.tasks = BackgroundTasks(self, self.db_manager.executor, self.status_var)
+        self.ticket_list = VirtualTicketList(self.ticket_tree, self.ticket_scrollbar, self.db_manager, self.tasks)
+        self.passenger_search = PassengerTypeAhead(self.passenger_dropdown, self.passenger_var, self.db_manager, self.tasks)
+        self.line_choices = LineChoices(self.bus_line_dropdown, self.bus_line_var, self.station_dropdown,
+                                        self.bus_number_dropdown, self.db_manager, self.tasks)
+        self.changes = ChangeListener(self, self.db_manager, self.receive_changes)
+
         self.selected_ticket_number = None
+        self.selected_version = None
+
+    def load(self):
         self.load_tickets()
         self.load_dropdowns()
     
     def load_tickets(self):
-        for item in self.ticket_tree.get_children():
-            self.ticket_tree.delete(item)
-        
-        tickets = self.db_manager.get_all_tickets()
-        for ticket in tickets:
-            self.ticket_tree.insert("", "end", values=ticket)
+        self.ticket_list.reload()
+
+    def apply_changes(self, events):
+        tables = {event.table for event in events}
+        if "*" in tables:
+            self.load_tickets()
+            self.load_dropdowns()
+            return
+        for event in events:
+            if event.table == "Ticket":
+                self.ticket_list.apply(event)
+        if "Passenger" in tables:
+            self.passenger_search.refresh()
     
     def load_dropdowns(self):
-        passengers = self.db_manager.get_all_passengers()
-        self.passenger_dropdown['values'] = [f"{p[0]}: {p[1]}" for p in passengers]
-        if passengers:
-            self.passenger_dropdown.current(0)
-            
-        bus_lines = self.db_manager.get_all_bus_lines()
+        def fetch():
+            return (
+                self.db_manager.get_all_bus_lines(),
+                self.db_manager.get_all_zones()
+            )
+
+        self.tasks.run("dropdowns", fetch, on_success=self.show_dropdowns)
+
+    def show_dropdowns(self, dropdowns):
+        bus_lines, zones = dropdowns
+        self.passenger_search.refresh()
+
         self.bus_line_dropdown['values'] = [f"{bl[0]}: {bl[1]}" for bl in bus_lines]
         if bus_lines:
             self.bus_line_dropdown.current(0)
+            self.line_choices.refresh(select_first=True)
             
-        zones = self.db_manager.get_all_zones()
         self.zone_dropdown['values'] = [f"{z[0]}: {z[1]}" for z in zones]
         if zones:
             self.zone_dropdown.current(0)
-            
-        stations = self.db_manager.get_all_stations()
-        self.station_dropdown['values'] = [f"{s[0]}: {s[1]}" for s in stations]
-        if stations:
-            self.station_dropdown.current(0)
-            
-        buses = self.db_manager.get_all_buses()
-        self.bus_number_dropdown['values'] = [f"{b[0]}: BusLine {b[1]}" for b in buses]
-        if buses:
-            self.bus_number_dropdown.current(0)
     
     def on_ticket_select(self, event):
         selected = self.ticket_tree.focus()
@@ -834,45 +4644,55 @@ class TicketManagementForm(tk.Toplevel):
             values = self.ticket_tree.item(selected, "values")
             if values:
                 self.selected_ticket_number = values[0]
-                ticket = self.db_manager.get_ticket(self.selected_ticket_number)
-                if ticket:
-                    self.ticket_number_var.set(ticket[0])
-                    self.ticket_type_var.set(ticket[1])
-                    self.bus_line_var.set(f"{ticket[2]}: {self.get_bus_line_name(ticket[2])}")
-                    self.zone_var.set(f"{ticket[3]}: Zone {ticket[3]} - ${self.get_zone_price(ticket[3])}")
-                    self.passenger_var.set(f"{ticket[4]}: {self.get_passenger_name(ticket[4])}")
-                    self.station_var.set(f"{ticket[5]}: {self.get_station_name(ticket[5])}")
-                    self.bus_number_var.set(f"{ticket[6]}: BusLine {self.get_bus_line_id(ticket[6])}")
-                    self.seat_number_var.set(ticket[7])
-                    self.ticket_number_entry.config(state="disabled")
+                self.tasks.run("select", self.fetch_ticket_details, self.selected_ticket_number,
+                               on_success=self.show_ticket)
+
+    def fetch_ticket_details(self, ticket_number):
+        ticket = self.db_manager.get_versioned_ticket(ticket_number)
+        if not ticket:
+            return None
+        return ticket, (
+            self.get_bus_line_name(ticket[2]),
+            self.get_zone_price(ticket[3]),
+            self.get_passenger_name(ticket[4]),
+            self.get_station_name(ticket[5]),
+            self.get_bus_line_id(ticket[6])
+        )
+
+    def show_ticket(self, details):
+        if not details or details[0][0] != self.selected_ticket_number:
+            return
+        ticket, (bus_line_name, zone_price, passenger_name, station_name, bus_line_id) = details
+        self.ticket_number_var.set(ticket[0])
+        self.ticket_type_var.set(ticket[1])
+        self.bus_line_var.set(f"{ticket[2]}: {bus_line_name}")
+        self.zone_var.set(f"{ticket[3]}: Zone {ticket[3]} - ${zone_price}")
+        self.passenger_var.set(f"{ticket[4]}: {passenger_name}")
+        self.station_var.set(f"{ticket[5]}: {station_name}")
+        self.bus_number_var.set(f"{ticket[6]}: BusLine {bus_line_id}")
+        self.seat_number_var.set(ticket[7])
+        self.selected_version = ticket[8]
+        self.ticket_number_entry.config(state="disabled")
+        self.line_choices.refresh()
     
     def get_bus_line_name(self, bus_line_id):
-        self.cursor.execute("SELECT BusLineName FROM BusLine WHERE BusLineID = %s", (bus_line_id,))
-        result = self.cursor.fetchone()
-        return result[0] if result else ""
+        return self.db_manager.get_bus_line_name(bus_line_id)
 
     def get_zone_price(self, zone_id):
-        self.cursor.execute("SELECT Price FROM Zone WHERE ZoneID = %s", (zone_id,))
-        result = self.cursor.fetchone()
-        return result[0] if result else ""
+        return self.db_manager.get_zone_price(zone_id)
 
     def get_passenger_name(self, passenger_id):
-        self.cursor.execute("SELECT PassengerName FROM Passenger WHERE PassengerID = %s", (passenger_id,))
-        result = self.cursor.fetchone()
-        return result[0] if result else ""
+        return self.db_manager.get_passenger_name(passenger_id)
 
     def get_station_name(self, station_number):
-        self.cursor.execute("SELECT StationName FROM Station WHERE StationNumber = %s", (station_number,))
-        result = self.cursor.fetchone()
-        return result[0] if result else ""
+        return self.db_manager.get_station_name(station_number)
 
     def get_bus_line_id(self, bus_number):
-        self.cursor.execute("SELECT BusLineID FROM Bus WHERE BusNumber = %s", (bus_number,))
-        result = self.cursor.fetchone()
-        return result[0] if result else ""
+        return self.db_manager.get_bus_line_id(bus_number)
 
     def clear_form(self):
         self.selected_ticket_number = None
+        self.selected_version = None
         self.ticket_number_var.set("")
         self.ticket_type_var.set("")
         self.bus_line_var.set("")
@@ -888,12 +4708,9 @@ class TicketManagementForm(tk.Toplevel):
             self.passenger_dropdown.current(0)
         if self.bus_line_dropdown['values']:
             self.bus_line_dropdown.current(0)
+            self.line_choices.refresh(select_first=True)
         if self.zone_dropdown['values']:
             self.zone_dropdown.current(0)
-        if self.station_dropdown['values']:
-            self.station_dropdown.current(0)
-        if self.bus_number_dropdown['values']:
-            self.bus_number_dropdown.current(0)
         self.ticket_type_dropdown.current(0)
     
     def save_ticket(self):
@@ -911,26 +4728,41 @@ class TicketManagementForm(tk.Toplevel):
             return
         
         if self.selected_ticket_number:
-            if self.db_manager.update_ticket(
-                ticket_number, ticket_type, bus_line_id, zone_id, passenger_id, 
-                station_number, bus_number, seat_number
-            ):
-                messagebox.showinfo("Success", "Ticket updated successfully!")
-                self.clear_form()
-                self.load_tickets()
-            else:
-                messagebox.showerror("Error", "Failed to update ticket!")
+            def updated(success):
+                if success:
+                    messagebox.showinfo("Success", "Ticket updated successfully!", parent=self)
+                    self.clear_form()
+                else:
+                    messagebox.showerror("Error", "Failed to update ticket!", parent=self)
+
+            def conflicted(error):
+                if not isinstance(error, VersionConflict):
+                    self.tasks.report_error(error)
+                elif error.current is None:
+                    messagebox.showerror("Edit Conflict", str(error), parent=self)
+                    self.clear_form()
+                elif messagebox.askyesno("Edit Conflict", f"{error}.\n\nSave your changes over the latest version?",
+                                         parent=self):
+                    self.selected_version = error.current[8]
+                    self.save_ticket()
+                else:
+                    self.tasks.run("select", self.fetch_ticket_details, ticket_number, on_success=self.show_ticket)
+
+            self.tasks.run(None, self.db_manager.update_ticket,
+                           ticket_number, ticket_type, bus_line_id, zone_id, passenger_id,
+                           station_number, bus_number, seat_number, self.selected_version,
+                           on_success=updated, on_error=conflicted)
         else:
-            result = self.db_manager.insert_ticket(
-                ticket_number, ticket_type, bus_line_id, zone_id, passenger_id, 
-                station_number, bus_number, seat_number
-            )
-            if result:
-                messagebox.showinfo("Success", f"Ticket created successfully!\nTicket Number: {ticket_number}")
-                self.clear_form()
-                self.load_tickets()
-            else:
-                messagebox.showerror("Error", "Failed to create ticket!")
+            def created(result):
+                if result:
+                    messagebox.showinfo("Success", f"Ticket created successfully!\nTicket Number: {ticket_number}", parent=self)
+                    self.clear_form()
+                else:
+                    messagebox.showerror("Error", "Failed to create ticket!", parent=self)
+
+            self.tasks.run(None, self.db_manager.insert_ticket,
+                           ticket_number, ticket_type, bus_line_id, zone_id, passenger_id,
+                           station_number, bus_number, seat_number, on_success=created)
     
     def delete_ticket(self):
         if not self.selected_ticket_number:
@@ -938,20 +4770,115 @@ class TicketManagementForm(tk.Toplevel):
             return
         
         if messagebox.askyesno("Confirm Delete", "Are you sure you want to delete this ticket?"):
-            success, message = self.db_manager.delete_ticket(self.selected_ticket_number)
-            if success:
-                messagebox.showinfo("Success", message)
-                self.clear_form()
-                self.load_tickets()
-            else:
-                messagebox.showerror("Error", message)
+            def deleted(result):
+                success, message = result
+                if success:
+                    messagebox.showinfo("Success", message, parent=self)
+                    self.clear_form()
+                else:
+                    messagebox.showerror("Error", message, parent=self)
+
+            self.tasks.run(None, self.db_manager.delete_ticket, self.selected_ticket_number, on_success=deleted)
+
+
+class JourneyPlannerForm(CachedWindow):
+    def __init__(self, parent, db_manager):
+        super().__init__(parent)
+        self.parent = parent
+        self.db_manager = db_manager
+        self.title("Journey Planner")
+        self.geometry("560x400")
+        self.resizable(True, True)
+
+        tk.Label(self, text="Journey Planner", font=("Arial", 14, "bold")).pack(pady=10)
+
+        form_frame = tk.Frame(self)
+        form_frame.pack(fill=tk.X, padx=10, pady=5)
+
+        tk.Label(form_frame, text="From:").grid(row=0, column=0, sticky="w", pady=5)
+        self.origin_var = tk.StringVar()
+        self.origin_dropdown = ttk.Combobox(form_frame, textvariable=self.origin_var, width=40)
+        self.origin_dropdown.grid(row=0, column=1, pady=5, sticky="w")
+
+        tk.Label(form_frame, text="To:").grid(row=1, column=0, sticky="w", pady=5)
+        self.destination_var = tk.StringVar()
+        self.destination_dropdown = ttk.Combobox(form_frame, textvariable=self.destination_var, width=40)
+        self.destination_dropdown.grid(row=1, column=1, pady=5, sticky="w")
+
+        tk.Button(form_frame, text="Plan", width=10, command=self.plan_journey).grid(row=0, column=2, rowspan=2, padx=10)
+
+        self.journey_tree = ttk.Treeview(self, columns=("bus_line", "board", "alight", "stops"), show="headings", height=8)
+        self.journey_tree.heading("bus_line", text="Bus Line")
+        self.journey_tree.heading("board", text="Board At")
+        self.journey_tree.heading("alight", text="Get Off At")
+        self.journey_tree.heading("stops", text="Stops")
+        self.journey_tree.column("stops", width=60)
+        self.journey_tree.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+
+        self.summary_var = tk.StringVar()
+        tk.Label(self, textvariable=self.summary_var, anchor="w").pack(fill=tk.X, padx=10)
+
+        self.status_var = tk.StringVar()
+        tk.Label(self, textvariable=self.status_var, anchor="w", fg="gray").pack(side=tk.BOTTOM, fill=tk.X, padx=10)
+        self.tasks = BackgroundTasks(self, self.db_manager.executor, self.status_var)
+        self.changes = ChangeListener(self, self.db_manager, self.receive_changes)
+
+    def load(self):
+        self.load_stations()
+
+    def load_stations(self):
+        def fetch():
+            return [(station[0], station[1], bus_line_name)
+                    for bus_line_id, bus_line_name in self.db_manager.get_all_bus_lines()
+                    for station in self.db_manager.get_line_stations(bus_line_id)]
+
+        self.tasks.run("stations", fetch, on_success=self.show_stations)
+
+    def show_stations(self, stations):
+        values = [f"{s[0]}: {s[1]} ({s[2]})" for s in stations]
+        self.origin_dropdown['values'] = values
+        self.destination_dropdown['values'] = values
+
+    def apply_changes(self, events):
+        if any(event.table == "*" for event in events):
+            self.load_stations()
+
+    def plan_journey(self):
+        origin = self.origin_var.get().split(":")[0]
+        destination = self.destination_var.get().split(":")[0]
+        if not origin or not destination:
+            messagebox.showwarning("Validation Error", "Select both stations!", parent=self)
+            return
+
+        def plan():
+            legs = self.db_manager.plan_journey(origin, destination)
+            if legs is None:
+                return None
+            return [(leg, self.db_manager.get_bus_line_name(leg.bus_line_id),
+                     self.db_manager.get_station_name(leg.board), self.db_manager.get_station_name(leg.alight))
+                    for leg in legs]
+
+        self.tasks.run("plan", plan, on_success=self.show_journey)
+
+    def show_journey(self, journey):
+        for item in self.journey_tree.get_children():
+            self.journey_tree.delete(item)
+        if journey is None:
+            self.summary_var.set("No connection between these stations.")
+            return
+        for leg, bus_line_name, board_name, alight_name in journey:
+            self.journey_tree.insert("", "end", values=(f"{leg.bus_line_id}: {bus_line_name}",
+                                                        f"{leg.board}: {board_name}", f"{leg.alight}: {alight_name}", leg.stops))
+        transfers = max(len(journey) - 1, 0)
+        self.summary_var.set(f"{len(journey)} ride(s), {transfers} transfer(s), "
+                             f"{sum(leg.stops for leg, *_ in journey)} stop(s)")
 
 
 class MainApplication(tk.Tk):
-    def __init__(self):
+    def __init__(self, seed_sample_data=False, backend=None, offline_journal=DEFAULT_OFFLINE_JOURNAL):
         super().__init__()
         self.title("Bus Ticket System")
-        self.geometry("400x300")
+        self.geometry("400x380")
         self.resizable(True, True)
 
         try:
@@ -959,13 +4886,20 @@ class MainApplication(tk.Tk):
                 host="localhost", 
                 user="root",
                 password="root",
-                database="busline_prisezone"
+                database="busline_prisezone",
+                seed_sample_data=seed_sample_data,
+                backend=backend,
+                offline_journal=offline_journal
             )
         except Exception as e:
             messagebox.showerror("Database Error", f"Failed to connect to database: {str(e)}")
             self.destroy()
             return
 
+        self.db_manager.start_change_polling()
+        self.db_manager.start_offline_sync()
+        self.forms = {}
+
         main_frame = tk.Frame(self)
         main_frame.pack(fill=tk.BOTH, expand=True, padx=20, pady=20)
 
@@ -980,29 +4914,45 @@ class MainApplication(tk.Tk):
                  command=self.open_passenger_management).pack(pady=10)
         tk.Button(button_frame, text="Manage Tickets", width=20, height=2, 
                  command=self.open_ticket_management).pack(pady=10)
+        tk.Button(button_frame, text="Plan Journey", width=20, height=2,
+                 command=self.open_journey_planner).pack(pady=10)
         tk.Button(button_frame, text="Exit", width=20, height=2, 
                  command=self.quit_app).pack(pady=10)
 
         self.protocol("WM_DELETE_WINDOW", self.quit_app)
 
+    def show_form(self, form_class):
+        # Forms are built once and hidden on close; reopening one just shows it again.
+        form = self.forms.get(form_class)
+        if form is None or not form.winfo_exists():
+            form = self.forms[form_class] = form_class(self, self.db_manager)
+        form.show()
+        return form
+
     def open_purchase_form(self):
         try:
-            PurchaseTicketForm(self, self.db_manager)
+            self.show_form(PurchaseTicketForm)
         except Exception as e:
             messagebox.showerror("Error", f"Failed to open Purchase Ticket form: {str(e)}")
 
     def open_passenger_management(self):
         try:
-            PassengerManagementForm(self, self.db_manager)
+            self.show_form(PassengerManagementForm)
         except Exception as e:
             messagebox.showerror("Error", f"Failed to open Passenger Management form: {str(e)}")
 
     def open_ticket_management(self):
         try:
-            TicketManagementForm(self, self.db_manager)
+            self.show_form(TicketManagementForm)
         except Exception as e:
             messagebox.showerror("Error", f"Failed to open Ticket Management form: {str(e)}")
 
+    def open_journey_planner(self):
+        try:
+            self.show_form(JourneyPlannerForm)
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to open Journey Planner form: {str(e)}")
+
     def quit_app(self):
         if messagebox.askyesno("Exit", "Are you sure you want to exit?"):
             if hasattr(self, 'db_manager'):
@@ -1011,5 +4961,46 @@ class MainApplication(tk.Tk):
 
 
 if __name__ == "__main__":
-    app = MainApplication()
-    app.mainloop()
+    parser = argparse.ArgumentParser(description="Bus Ticket System")
+    parser.add_argument("--seed-sample-data", action="store_true",
+                        help="replace the database contents with the demo data set")
+    parser.add_argument("--sqlite", metavar="PATH",
+                        help="use an embedded SQLite database file instead of the MySQL server")
+    parser.add_argument("--offline-journal", metavar="PATH", default=DEFAULT_OFFLINE_JOURNAL,
+                        help="queue sales in this local file while the database is unreachable (empty to disable)")
+    parser.add_argument("--metrics-port", type=int, metavar="PORT",
+                        help="serve Prometheus metrics on http://127.0.0.1:PORT/metrics")
+    parser.add_argument("--metrics-file", metavar="PATH",
+                        help="write Prometheus metrics to PATH every 15 seconds and on exit")
+    parser.add_argument("--export", nargs=2, metavar=("TABLE", "PATH"),
+                        help="export Ticket or Passenger rows to a .csv or .parquet file and exit")
+    parser.add_argument("--import", dest="import_", nargs=2, metavar=("TABLE", "PATH"),
+                        help="import Ticket or Passenger rows from a .csv or .parquet file and exit")
+    args = parser.parse_args()
+    backend = SQLiteBackend(args.sqlite) if args.sqlite else None
+    if args.export or args.import_:
+        db_manager = DatabaseManager(seed_sample_data=args.seed_sample_data, backend=backend, interactive=False)
+        exchange = DataExchange(db_manager, progress=lambda table, rows: print(f"{table}: {rows} rows", end="\r"))
+        try:
+            if args.export:
+                print(f"\nExported {exchange.export_file(*args.export)} rows to {args.export[1]}")
+            if args.import_:
+                inserted, failures = exchange.import_file(*args.import_)
+                print(f"\nImported {inserted} rows from {args.import_[1]}")
+                for index, key, message in failures:
+                    print(f"Row {index + 1} ({key}): {message}")
+        finally:
+            db_manager.close()
+            if args.metrics_file:
+                db_manager.metrics.write_prometheus(args.metrics_file)
+    else:
+        app = MainApplication(seed_sample_data=args.seed_sample_data, backend=backend,
+                              offline_journal=args.offline_journal)
+        if hasattr(app, 'db_manager'):
+            if args.metrics_port:
+                app.db_manager.metrics.serve(port=args.metrics_port)
+            if args.metrics_file:
+                app.db_manager.metrics.export_periodically(args.metrics_file)
+        app.mainloop()
+        if args.metrics_file and hasattr(app, 'db_manager'):
+            app.db_manager.metrics.write_prometheus(args.metrics_file)
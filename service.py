@@ -0,0 +1,420 @@
+import argparse
+import asyncio
+import json
+import logging
+import re
+from collections import Counter
+from urllib.parse import parse_qs, urlsplit
+
+from mini_app import (DatabaseManager, ExecutorBusyError, SQLiteBackend, TICKET_COLUMNS, TICKET_TYPES,
+                      VersionConflict, retry_on_conflict)
+
+logger = logging.getLogger("mini_app.service")
+
+MAX_PAGE_SIZE = 1000
+
+HTTP_REASONS = {
+    200: "OK", 201: "Created", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+    409: "Conflict", 413: "Payload Too Large", 500: "Internal Server Error", 503: "Service Unavailable",
+}
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def ticket_to_json(row):
+    ticket = dict(zip(TICKET_COLUMNS, row))
+    if len(row) > len(TICKET_COLUMNS):
+        ticket["Version"] = row[len(TICKET_COLUMNS)]
+    return ticket
+
+
+def passenger_to_json(row):
+    passenger = {"PassengerID": row[0], "PassengerName": row[1]}
+    if len(row) > 2:
+        passenger["Version"] = row[2]
+    return passenger
+
+
+def conflict_error(error):
+    return HTTPError(404 if error.current is None else 409, str(error))
+
+
+def failure_status(message):
+    return 409 if "already exists" in message or "not available" in message or "free seats" in message else 400
+
+
+def page_limit(query, default=100):
+    value = query.get("limit", default)
+    try:
+        limit = int(value)
+    except (TypeError, ValueError):
+        raise HTTPError(400, f"limit must be an integer, got {value!r}")
+    if limit < 1:
+        raise HTTPError(400, "limit must be at least 1")
+    return min(limit, MAX_PAGE_SIZE)
+
+
+class TicketService:
+    def __init__(self, db_manager, host="127.0.0.1", port=8080, batch_window=0.005, max_batch=200,
+                 keepalive_timeout=15, max_body=1 << 20):
+        self.db = db_manager
+        self.host = host
+        self.port = port
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.keepalive_timeout = keepalive_timeout
+        self.max_body = max_body
+        self._server = None
+        self._batcher = None
+        self._ticket_queue = None
+        self.routes = [
+            ("GET", re.compile(r"^/health$"), self.health),
+            ("GET", re.compile(r"^/metrics$"), self.metrics),
+            ("GET", re.compile(r"^/passengers$"), self.list_passengers),
+            ("POST", re.compile(r"^/passengers$"), self.create_passenger),
+            ("GET", re.compile(r"^/passengers/([^/]+)$"), self.get_passenger),
+            ("PUT", re.compile(r"^/passengers/([^/]+)$"), self.update_passenger),
+            ("DELETE", re.compile(r"^/passengers/([^/]+)$"), self.delete_passenger),
+            ("GET", re.compile(r"^/tickets$"), self.list_tickets),
+            ("POST", re.compile(r"^/tickets$"), self.create_tickets),
+            ("GET", re.compile(r"^/tickets/([^/]+)$"), self.get_ticket),
+            ("PUT", re.compile(r"^/tickets/([^/]+)$"), self.update_ticket),
+            ("DELETE", re.compile(r"^/tickets/([^/]+)$"), self.delete_ticket),
+            ("GET", re.compile(r"^/reports/(zone|bus_line|ticket_type|fare|day)$"), self.report),
+            ("GET", re.compile(r"^/fares$"), self.fares),
+        ]
+
+    async def start(self):
+        self._ticket_queue = asyncio.Queue()
+        self._batcher = asyncio.create_task(self._batch_tickets())
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self._server
+
+    async def serve_forever(self):
+        await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def stop(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+        if self._batcher:
+            self._batcher.cancel()
+
+    async def _run(self, fn, *args):
+        return await asyncio.wrap_future(self.db.executor.submit(fn, *args))
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request_line = await asyncio.wait_for(reader.readline(), self.keepalive_timeout)
+                except asyncio.TimeoutError:
+                    break
+                if not request_line:
+                    break
+                keep_alive = await self._handle_request(request_line, reader, writer)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _handle_request(self, request_line, reader, writer):
+        try:
+            method, target, version = request_line.decode("latin-1").split()
+        except ValueError:
+            self._respond(writer, 400, {"error": "Malformed request line"}, False)
+            return False
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        connection = headers.get("connection", "").lower()
+        keep_alive = connection != "close" if version == "HTTP/1.1" else connection == "keep-alive"
+        try:
+            length = int(headers.get("content-length", 0) or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            # Without a valid length the end of the body is unknown, so the connection is closed.
+            self._respond(writer, 400, {"error": "Invalid Content-Length header"}, False)
+            return False
+        if length > self.max_body:
+            self._respond(writer, 413, {"error": "Request body too large"}, False)
+            return False
+        body = await reader.readexactly(length) if length else b""
+
+        try:
+            status, payload = await self._dispatch(method, target, body)
+        except HTTPError as e:
+            status, payload = e.status, {"error": e.message}
+        except ExecutorBusyError as e:
+            status, payload = 503, {"error": str(e)}
+        except Exception as e:
+            logger.error(f"Error handling {method} {target}: {e}")
+            status, payload = 500, {"error": "Internal server error"}
+        self._respond(writer, status, payload, keep_alive)
+        return keep_alive
+
+    def _respond(self, writer, status, payload, keep_alive):
+        if isinstance(payload, str):
+            body, content_type = payload.encode("utf-8"), "text/plain; version=0.0.4"
+        else:
+            body, content_type = json.dumps(payload, default=str).encode("utf-8"), "application/json"
+        writer.write((
+            f"HTTP/1.1 {status} {HTTP_REASONS.get(status, '')}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        ).encode("latin-1") + body)
+
+    async def _dispatch(self, method, target, body):
+        url = urlsplit(target)
+        allowed = False
+        for route_method, pattern, handler in self.routes:
+            match = pattern.match(url.path)
+            if not match:
+                continue
+            allowed = True
+            if route_method == method:
+                data = None
+                if body:
+                    try:
+                        data = json.loads(body)
+                    except ValueError:
+                        raise HTTPError(400, "Request body is not valid JSON")
+                query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+                return await handler(*match.groups(), data=data, query=query)
+        if allowed:
+            raise HTTPError(405, f"Method {method} not allowed")
+        raise HTTPError(404, f"No route for {url.path}")
+
+    async def health(self, data=None, query=None):
+        version = await self._run(self.db.schema_version)
+        return 200, {"status": "ok", "backend": self.db.backend.name, "schema_version": version}
+
+    async def metrics(self, data=None, query=None):
+        return 200, self.db.metrics.prometheus()
+
+    async def list_passengers(self, data=None, query=None):
+        limit = page_limit(query)
+        if query.get("q") is not None:
+            rows = await self._run(self.db.search_passengers, query["q"], limit)
+        else:
+            rows = await self._run(self.db.get_passengers_page, query.get("after"), limit)
+        return 200, [passenger_to_json(row) for row in rows]
+
+    async def get_passenger(self, passenger_id, data=None, query=None):
+        row = await self._run(self.db.get_versioned_passenger, passenger_id)
+        if row is None:
+            raise HTTPError(404, f"Passenger {passenger_id} not found")
+        return 200, passenger_to_json(row)
+
+    async def create_passenger(self, data=None, query=None):
+        if not isinstance(data, dict) or not data.get("PassengerID") or not data.get("PassengerName"):
+            raise HTTPError(400, "PassengerID and PassengerName are required")
+        if await self._run(self.db.get_passenger, data["PassengerID"]) is not None:
+            raise HTTPError(409, f"Passenger {data['PassengerID']} already exists")
+        if await self._run(self.db.create_passenger, data["PassengerID"], data["PassengerName"]) is None:
+            raise HTTPError(400, "Failed to create passenger")
+        return 201, {"PassengerID": data["PassengerID"], "PassengerName": data["PassengerName"]}
+
+    async def update_passenger(self, passenger_id, data=None, query=None):
+        if not isinstance(data, dict) or not data.get("PassengerName"):
+            raise HTTPError(400, "PassengerName is required")
+        if await self._run(self.db.get_passenger, passenger_id) is None:
+            raise HTTPError(404, f"Passenger {passenger_id} not found")
+        try:
+            updated = await self._run(self.db.update_passenger, passenger_id, data["PassengerName"], data.get("Version"))
+        except VersionConflict as e:
+            raise conflict_error(e)
+        if not updated:
+            raise HTTPError(400, "Failed to update passenger")
+        return 200, passenger_to_json(await self._run(self.db.get_versioned_passenger, passenger_id))
+
+    async def delete_passenger(self, passenger_id, data=None, query=None):
+        if await self._run(self.db.get_passenger, passenger_id) is None:
+            raise HTTPError(404, f"Passenger {passenger_id} not found")
+        success, message = await self._run(self.db.delete_passenger, passenger_id)
+        if not success:
+            raise HTTPError(409, message)
+        return 200, {"message": message}
+
+    async def list_tickets(self, data=None, query=None):
+        limit = page_limit(query)
+        rows = await self._run(self.db.get_tickets_page, query.get("after"), limit)
+        return 200, [ticket_to_json(row) for row in rows]
+
+    async def get_ticket(self, ticket_number, data=None, query=None):
+        row = await self._run(self.db.get_versioned_ticket, ticket_number)
+        if row is None:
+            raise HTTPError(404, f"Ticket {ticket_number} not found")
+        return 200, ticket_to_json(row)
+
+    async def create_tickets(self, data=None, query=None):
+        tickets = data if isinstance(data, list) else [data]
+        if not tickets or not all(isinstance(ticket, dict) for ticket in tickets):
+            raise HTTPError(400, "Expected a ticket object or a list of ticket objects")
+        results = await asyncio.gather(*(self._submit_ticket(ticket) for ticket in tickets))
+        if not isinstance(data, list):
+            ticket_number, error = results[0]
+            if error:
+                raise HTTPError(failure_status(error), error)
+            return 201, {"TicketNumber": ticket_number}
+        return 200, [{"TicketNumber": number, "error": error} if error else {"TicketNumber": number}
+                     for number, error in results]
+
+    async def update_ticket(self, ticket_number, data=None, query=None):
+        if not isinstance(data, dict):
+            raise HTTPError(400, "Expected a ticket object")
+        changes = {key: value for key, value in data.items() if key in TICKET_COLUMNS[1:]}
+
+        def merge_and_update():
+            current = self.db.get_versioned_ticket(ticket_number)
+            if current is None:
+                return None, False
+            fields = ticket_to_json(current)
+            fields.update(changes)
+            # A client-supplied Version is checked as is; otherwise the merge is retried on conflict.
+            version = data.get("Version", fields["Version"])
+            updated = self.db.update_ticket(*(fields[column] for column in TICKET_COLUMNS), expected_version=version)
+            return fields, updated
+
+        try:
+            if "Version" in data:
+                fields, updated = await self._run(merge_and_update)
+            else:
+                fields, updated = await self._run(retry_on_conflict, merge_and_update)
+        except VersionConflict as e:
+            raise conflict_error(e)
+        if fields is None:
+            raise HTTPError(404, f"Ticket {ticket_number} not found")
+        if not updated:
+            raise HTTPError(409, "Failed to update ticket")
+        return 200, ticket_to_json(await self._run(self.db.get_versioned_ticket, ticket_number))
+
+    async def delete_ticket(self, ticket_number, data=None, query=None):
+        if await self._run(self.db.get_ticket, ticket_number) is None:
+            raise HTTPError(404, f"Ticket {ticket_number} not found")
+        success, message = await self._run(self.db.delete_ticket, ticket_number)
+        if not success:
+            raise HTTPError(400, message)
+        return 200, {"message": message}
+
+    async def report(self, dimension, data=None, query=None):
+        totals = await self._run(self.db.reports.totals, dimension)
+        return 200, [{"key": key, "tickets": tickets, "revenue": revenue}
+                     for key, (tickets, revenue) in sorted(totals.items()) if tickets]
+
+    async def fares(self, data=None, query=None):
+        if not query.get("origin") or not query.get("destination"):
+            raise HTTPError(400, "origin and destination stations are required")
+        quotes = {ticket_type: await self._run(self.db.quote_fare, query["origin"], query["destination"], ticket_type)
+                  for ticket_type in TICKET_TYPES}
+        if any(quote is None for quote in quotes.values()):
+            raise HTTPError(404, "No fare zone for this trip")
+        return 200, {"ZoneID": quotes[TICKET_TYPES[0]][0],
+                     "fares": {ticket_type: quote[1] for ticket_type, quote in quotes.items()}}
+
+    async def _submit_ticket(self, ticket):
+        future = asyncio.get_running_loop().create_future()
+        await self._ticket_queue.put((ticket, future))
+        return await future
+
+    async def _batch_tickets(self):
+        # Single ticket POSTs arriving within batch_window share one bulk insert and one commit.
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._ticket_queue.get()]
+            deadline = loop.time() + self.batch_window
+            while len(batch) < self.max_batch:
+                if not self._ticket_queue.empty():
+                    batch.append(self._ticket_queue.get_nowait())
+                    continue
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._ticket_queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                results = await self._run(self._insert_batch, [ticket for ticket, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+    def _insert_batch(self, tickets):
+        auto_seat = [ticket.get("SeatNumber") in (None, "", "auto") for ticket in tickets]
+        wanted = Counter(str(ticket.get("BusNumber")) for ticket, auto in zip(tickets, auto_seat) if auto)
+        free_seats = {bus: iter(self.db.find_free_seats(bus, count)) for bus, count in wanted.items()}
+        numbers = iter(self.db.ticket_numbers.take(sum(1 for ticket in tickets if not ticket.get("TicketNumber"))))
+
+        results = [None] * len(tickets)
+        rows = []
+        positions = []
+        for index, ticket in enumerate(tickets):
+            row = [ticket.get(column) for column in TICKET_COLUMNS]
+            row[0] = row[0] or next(numbers)
+            if row[3] is None and ticket.get("DestinationStationNumber") is not None:
+                row[3] = self.db.fares.fare_zone(row[5], ticket["DestinationStationNumber"])
+                if row[3] is None:
+                    results[index] = (row[0], "No fare zone for this trip")
+                    continue
+            if auto_seat[index]:
+                row[7] = next(free_seats[str(row[6])], None)
+                if row[7] is None:
+                    results[index] = (row[0], f"No free seats left on bus {row[6]}")
+                    continue
+            rows.append(tuple(row))
+            positions.append(index)
+
+        inserted, failures = self.db.insert_tickets_bulk(rows)
+        errors = {index: message for index, _, message in failures}
+        for row_index, (index, row) in enumerate(zip(positions, rows)):
+            results[index] = (row[0], errors.get(row_index))
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bus Ticket System HTTP/JSON service")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--sqlite", metavar="PATH",
+                        help="use an embedded SQLite database file instead of the MySQL server")
+    args = parser.parse_args()
+
+    db_manager = DatabaseManager(backend=SQLiteBackend(args.sqlite) if args.sqlite else None, interactive=False)
+    db_manager.start_change_polling()
+    service = TicketService(db_manager, host=args.host, port=args.port)
+    print(f"Serving on http://{args.host}:{args.port}")
+    try:
+        asyncio.run(service.serve_forever())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        db_manager.close()
+
+
+if __name__ == "__main__":
+    main()
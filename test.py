@@ -1,5 +1,14 @@
-import mysql.connector
-from mini_app import DatabaseManager
+import argparse
+import asyncio
+import http.client
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+from datetime import datetime
+from mini_app import DatabaseManager, FareEngine, OfflineSalesJournal, PoolError, SQLiteBackend
+from service import MAX_PAGE_SIZE, TicketService
 
 def print_table(cursor, table_name, columns, condition=""):
     query = f"SELECT {', '.join(columns)} FROM {table_name}"
@@ -13,15 +22,152 @@ def print_table(cursor, table_name, columns, condition=""):
     for row in rows:
         print("| " + " | ".join(str(val) for val in row) + " |")
 
-def test_operations_and_reports():
+HOT_QUERIES = [
+    ("Tickets held by a passenger", "SELECT COUNT(*) FROM Ticket WHERE PassengerID = %s", ("P001",)),
+    ("Seats sold on a bus", "SELECT BusNumber, SeatNumber FROM Ticket WHERE BusNumber = %s", ("B001",)),
+    ("Seat availability", "SELECT TicketNumber FROM Ticket WHERE BusNumber = %s AND SeatNumber = %s", ("B001", 10)),
+    ("Tickets per line and zone", "SELECT COUNT(*) FROM Ticket WHERE BusLineID = %s AND ZoneID = %s", (1, 1)),
+    ("Ticket lookup", "SELECT TicketType, BusNumber, SeatNumber FROM Ticket WHERE TicketNumber = %s", ("T001",)),
+    ("Ticket list page", "SELECT TicketNumber, TicketType FROM Ticket WHERE TicketNumber > %s ORDER BY TicketNumber LIMIT %s", ("T005", 100)),
+]
+
+def check_query_plans(db):
+    print("\n=== Test: Hot Queries Use Indexes ===")
+    regressions = []
+    for name, query, params in HOT_QUERIES:
+        scans = db.full_scans(query, params)
+        print(f"| {name:<28} | {'full scan of ' + ', '.join(scans) if scans else 'indexed':<28} |")
+        if scans:
+            regressions.append(name)
+    assert not regressions, f"Hot queries regressed to a full table scan: {', '.join(regressions)}"
+    print("\nVerification: No hot query scans the whole Ticket table.")
+
+def check_offline_sales(db):
+    print("\n=== Test: Offline Sales Queue ===")
+    assert not db.is_connection_error(sqlite3.OperationalError("database is locked"))
+    assert not db.is_connection_error(sqlite3.OperationalError("no such table: Ticket"))
+    assert db.is_connection_error(PoolError("No database connection available after 30s"))
+
+    journal = os.path.join(tempfile.mkdtemp(), "offline_sales.db")
+    db.offline = OfflineSalesJournal(journal)
+    acquire = db.pool.acquire
+
+    def unreachable(*args, **kwargs):
+        raise PoolError("No database connection available after 30s")
+
+    seat = db.next_free_seat("B001")
+    price = db.get_zone_price(1)
+    db.pool.acquire = unreachable
+    try:
+        queued = db.insert_ticket("OFF001", "SingleTicket", 1, 1, "P001", 1, "B001", seat)
+        duplicate = db.insert_ticket("OFF002", "SingleTicket", 1, 1, "P001", 1, "B001", seat)
+    finally:
+        db.pool.acquire = acquire
+    print(f"\nQueued while offline: {queued}, same seat again: {duplicate}, pending: {db.pending_offline_sales()}")
+    assert queued == "OFF001" and duplicate is None and db.pending_offline_sales() == 1
+    assert db.get_ticket("OFF001") is None
+
+    # A price change during the outage does not reprice a sale that was already made.
+    db.update_zone_price(1, "99.00")
+    try:
+        assert db.sync_offline_sales() == 1
+    finally:
+        db.update_zone_price(1, price)
+    assert db.get_ticket("OFF001") is not None and not db.is_offline
+    with db.transaction(write=False) as cursor:
+        cursor.execute("SELECT Fare FROM Ticket WHERE TicketNumber = %s", ("OFF001",))
+        assert cursor.fetchone()[0] == price, "Synced sale was repriced"
+    print(f"After sync: {db.get_ticket('OFF001')}, pending: {db.pending_offline_sales()}")
+
+    # Replaying a sale that already reached the database acknowledges it instead of inserting it again.
+    row = db.get_ticket("OFF001")
+    db.offline._conn.execute(
+        "INSERT INTO Sale (TicketNumber, TicketType, BusLineID, ZoneID, PassengerID, StationNumber, BusNumber, SeatNumber, SoldAt) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", tuple(row) + (datetime.now(),))
+    assert db.sync_offline_sales() == 1
+    assert db.pending_offline_sales() == 0 and not db.failed_offline_sales()
+    with db.transaction(write=False) as cursor:
+        cursor.execute("SELECT COUNT(*) FROM Ticket")
+        assert db.count_tickets() == cursor.fetchone()[0]
+    db.offline.close()
+    db.offline = None
+    print("\nVerification: The queued sale was synced exactly once and the seat was held while offline.")
+
+def check_service(db):
+    print("\n=== Test: HTTP Service Routes ===")
+    service = TicketService(db, port=0)
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(service.start())
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+
+    def request(method, path, body=None):
+        conn = http.client.HTTPConnection(service.host, service.port, timeout=10)
+        try:
+            conn.request(method, path, body=json.dumps(body) if body is not None else None,
+                         headers={"Content-Type": "application/json"})
+            response = conn.getresponse()
+            return response.status, json.loads(response.read())
+        finally:
+            conn.close()
+
     try:
-        db = DatabaseManager(host="localhost", user="root", password="root", database="busline_prisezone")
+        checks = [
+            ("GET", "/health", None, 200),
+            ("GET", "/passengers?limit=2", None, 200),
+            ("GET", "/passengers?q=john&limit=5", None, 200),
+            ("GET", "/passengers?limit=abc", None, 400),
+            ("GET", "/tickets?limit=0", None, 400),
+            ("GET", "/tickets?limit=-5", None, 400),
+            ("GET", "/tickets?limit=1e9", None, 400),
+            ("GET", f"/tickets?limit={MAX_PAGE_SIZE * 10}", None, 200),
+            ("GET", "/tickets/T001", None, 200),
+            ("GET", "/tickets/NOPE", None, 404),
+            ("POST", "/tickets", {"TicketType": "SingleTicket", "BusLineID": 1, "ZoneID": 1, "PassengerID": "P001",
+                                  "StationNumber": 1, "BusNumber": "B001"}, 201),
+            ("GET", "/reports/ticket_type", None, 200),
+            ("PATCH", "/tickets/T001", None, 405),
+            ("GET", "/nope", None, 404),
+        ]
+        print("\n| Request                          | Status |")
+        print("|----------------------------------|--------|")
+        for method, path, body, expected in checks:
+            status, payload = request(method, path, body)
+            print(f"| {method + ' ' + path:<32} | {status:<6} |")
+            assert status == expected, f"{method} {path} answered {status}, expected {expected}: {payload}"
+        status, page = request("GET", "/passengers?limit=2")
+        assert len(page) == 2
+        status, matches = request("GET", "/passengers?q=jon")
+        assert "P001" in [match["PassengerID"] for match in matches], "Short misspelling did not find John Doe"
+        for length in ("abc", "-1"):
+            conn = http.client.HTTPConnection(service.host, service.port, timeout=10)
+            try:
+                conn.putrequest("POST", "/passengers")
+                conn.putheader("Content-Length", length)
+                conn.endheaders()
+                response = conn.getresponse()
+                print(f"| {'POST with Content-Length ' + length:<32} | {response.status:<6} |")
+                assert response.status == 400, f"Content-Length {length} answered {response.status}"
+            finally:
+                conn.close()
+    finally:
+        asyncio.run_coroutine_threadsafe(service.stop(), loop).result(10)
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(10)
+        loop.close()
+    print("\nVerification: Every route answers with the expected status and bad limits are rejected with 400.")
+
+def test_operations_and_reports(backend=None):
+    try:
+        db = DatabaseManager(host="localhost", user="root", password="root", database="busline_prisezone",
+                             backend=backend, interactive=False)
         cursor = db.cursor
-    except mysql.connector.Error as err:
+    except Exception as err:
         print(f"Failed to connect to database: {err}")
         return
 
     db.insert_sample_data()
+    check_query_plans(db)
 
     print("\n=== Test 1: Create Passenger Profile ===")
     print("\nBefore:")
@@ -59,7 +205,7 @@ def test_operations_and_reports():
     print("\n=== Test 4: Purchase Ticket ===")
     print("\nBefore (last ticket):")
     print_table(cursor, "Ticket", ["TicketNumber", "TicketType", "ZoneID", "SeatNumber", "PassengerID", "BusLineID", "StationNumber", "BusNumber"], "TicketNumber = 'T015'")
-    query = "INSERT INTO Ticket (TicketNumber, TicketType, BusLineID, ZoneID, PassengerID, StationNumber, BusNumber, SeatNumber) VALUES ('T016', 'SingleTicket', 1, 1, 'P001', 1, 'B001', 10)"
+    query = "INSERT INTO Ticket (TicketNumber, TicketType, BusLineID, ZoneID, PassengerID, StationNumber, BusNumber, SeatNumber) VALUES ('T016', 'SingleTicket', 1, 1, 'P001', 1, 'B001', 11)"
     print(f"\nQuery:\n{query}")
     cursor.execute(query)
     db.conn.commit()
@@ -70,7 +216,7 @@ def test_operations_and_reports():
     print("\n=== Test 5: Update Ticket ===")
     print("\nBefore:")
     print_table(cursor, "Ticket", ["TicketNumber", "TicketType", "ZoneID", "SeatNumber", "PassengerID", "BusLineID", "StationNumber", "BusNumber"], "TicketNumber = 'T016'")
-    query = "UPDATE Ticket SET TicketType = 'MonthlyPass', BusLineID = 1, ZoneID = 1, PassengerID = 'P001', StationNumber = 1, BusNumber = 'B001', SeatNumber = 10 WHERE TicketNumber = 'T016'"
+    query = "UPDATE Ticket SET TicketType = 'MonthlyPass', BusLineID = 1, ZoneID = 1, PassengerID = 'P001', StationNumber = 1, BusNumber = 'B001', SeatNumber = 11 WHERE TicketNumber = 'T016'"
     print(f"\nQuery:\n{query}")
     cursor.execute(query)
     db.conn.commit()
@@ -95,60 +241,70 @@ def test_operations_and_reports():
     print("\nRelevant Tables:")
     print_table(cursor, "Zone", ["ZoneID", "Price"])
     print_table(cursor, "Ticket", ["TicketNumber", "ZoneID"])
-    query = """
-    SELECT z.ZoneID, CONCAT('Zone ', z.ZoneID, ' - $', z.Price) as ZoneName, COUNT(t.TicketNumber) as TicketCount
-    FROM Zone z LEFT JOIN Ticket t ON z.ZoneID = t.ZoneID
-    GROUP BY z.ZoneID ORDER BY z.ZoneID
-    """
-    print(f"\nQuery:\n{query}")
-    cursor.execute(query)
+    print("\nSource: SalesSummary (Dimension = 'zone'), maintained on every ticket write")
     print("\nReport Output:")
     print("| Zone ID | Zone Name      | Tickets Sold |")
     print("|---------|----------------|--------------|")
-    for row in cursor.fetchall():
-        print(f"| {row[0]}       | {row[1]:<15} | {row[2]:<12} |")
+    for zone_id, zone_name, tickets, revenue in db.reports.zone_usage():
+        print(f"| {zone_id}       | {zone_name:<15} | {tickets:<12} |")
     print("\nVerification: Matches actual counts (5 tickets each zone).")
 
     print("\n=== Report 2: Route Optimization Report ===")
     print("\nRelevant Tables:")
     print_table(cursor, "BusLine", ["BusLineID", "BusLineName"])
     print_table(cursor, "Ticket", ["TicketNumber", "BusLineID"])
-    query = """
-    SELECT bl.BusLineID, COUNT(t.TicketNumber) as TicketCount
-    FROM BusLine bl LEFT JOIN Ticket t ON bl.BusLineID = t.BusLineID
-    GROUP BY bl.BusLineID ORDER BY bl.BusLineID
-    """
-    print(f"\nQuery:\n{query}")
-    cursor.execute(query)
+    print("\nSource: SalesSummary (Dimension = 'bus_line'), maintained on every ticket write")
     print("\nReport Output:")
     print("| Bus Line ID | Ticket Count |")
     print("|-------------|--------------|")
-    for row in cursor.fetchall():
-        print(f"| {row[0]:<11} | {row[1]:<12} |")
+    for bus_line_id, bus_line_name, tickets, revenue in db.reports.bus_line_usage():
+        print(f"| {bus_line_id:<11} | {tickets:<12} |")
     print("\nVerification: Matches actual counts (5 tickets each bus line).")
 
     print("\n=== Report 3: Fare Calculation Report ===")
     print("\nRelevant Tables:")
     print_table(cursor, "Zone", ["ZoneID", "Price"])
     print_table(cursor, "Ticket", ["TicketNumber", "TicketType", "ZoneID"])
-    query = """
-    SELECT t.TicketType, CONCAT('Zone ', z.ZoneID, ' - $', z.Price) as ZoneName, SUM(CASE 
-            WHEN t.TicketType = 'SingleTicket' THEN z.Price
-            WHEN t.TicketType = 'MonthlyPass' THEN z.Price * 10
-            ELSE 0 END) as TotalFare
-    FROM Ticket t JOIN Zone z ON t.ZoneID = z.ZoneID
-    GROUP BY t.TicketType, z.ZoneID
-    """
-    print(f"\nQuery:\n{query}")
-    cursor.execute(query)
+    print("\nSource: SalesSummary (Dimension = 'fare'), fares from FARE_MULTIPLIERS (MonthlyPass = 10 x zone price)")
     print("\nReport Output:")
     print("| Ticket Type   | Zone Name      | Total Fare ($) |")
     print("|---------------|----------------|----------------|")
-    for row in cursor.fetchall():
-        print(f"| {row[0]:<13} | {row[1]:<15} | {row[2]:<14} |")
+    for ticket_type, zone_id, zone_name, tickets, revenue in db.reports.fare_totals():
+        print(f"| {ticket_type:<13} | {zone_name:<15} | {revenue:<14} |")
     print("\nVerification: Matches actual totals (SingleTicket Zone 1: $12.50, MonthlyPass Zone 2: $187.50, SingleTicket Zone 3: $25.00).")
 
+    print("\n=== Report 4: End-of-Day Settlement ===")
+    try:
+        settlement = FareEngine(db).settle()
+    except ImportError as err:
+        print(f"\nSkipped: {err}")
+    else:
+        print("\nReport Output:")
+        print("| Ticket Type   | Tickets | Revenue ($)    |")
+        print("|---------------|---------|----------------|")
+        for ticket_type, (tickets, revenue) in settlement["by_ticket_type"].items():
+            print(f"| {ticket_type:<13} | {tickets:<7} | {revenue:<14} |")
+        print(f"\nTotal: {settlement['tickets']} tickets, ${settlement['revenue']}")
+        summary = {ticket_type: (tickets, revenue) for ticket_type, tickets, revenue in db.reports.ticket_type_sales() if tickets}
+        assert settlement["by_ticket_type"] == summary, "Settlement disagrees with SalesSummary"
+        print("\nVerification: Vectorized settlement matches the SalesSummary totals ($225.00 over 15 tickets).")
+
+        today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        price = db.get_zone_price(1)
+        db.update_zone_price(1, "99.00")
+        repriced = FareEngine(db).settle(since=today)
+        db.update_zone_price(1, price)
+        assert repriced == settlement, "Settlement revalued tickets after a price change"
+        assert FareEngine(db).settle(until=today)["tickets"] == 0
+        print("Verification: Today's settlement keeps the sold fares after a zone price change.")
+
+    check_offline_sales(db)
+    check_service(db)
     db.close()
 
 if __name__ == "__main__":
-    test_operations_and_reports()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Run the ticket system checks against a database")
+    parser.add_argument("--sqlite", metavar="PATH",
+                        help="run against an embedded SQLite database file instead of the MySQL server")
+    args = parser.parse_args()
+    test_operations_and_reports(SQLiteBackend(args.sqlite) if args.sqlite else None)
\ No newline at end of file